@@ -3,30 +3,222 @@ Agent 核心模块 V2 - 增强版,支持深入拍卖场次获取拍品列表
 """
 
 import json
+import time
+import asyncio
 import logging
-from typing import List, Dict, Optional
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
-from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL
+from config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, AUCTION_WORKERS, LOT_STORE_ENABLED,
+    TOOL_CALL_WORKERS, TOOL_CALL_TIMEOUT, TOOL_CALL_TIMEOUTS, AGENT_MAX_STEPS, LLM_CACHE_ENABLED,
+    INTENT_FAST_PATH_ENABLED, INTENT_MIN_CONFIDENCE, TOOL_RESULT_HANDLES, ANALYZE_MAX_BINS,
+    LOT_STORE_WAIT_TIMEOUT
+)
 from scraper import AuctionScraper
-from lot_scraper import LotScraper
+from lot_scraper import LotScraper, ScrapeProgress
+from lot_analytics import LotFrame
+from lot_records import Auction, Lot
+from lot_store import get_lot_store
+from conversation import ConversationHistory, message_tokens
+from intent_parser import IntentParser, IntentResult, format_auction_answer
+from llm_cache import LLMCache, response_key
+from single_flight import SingleFlight
+from tool_results import ResultShaper, ResultStore, compact_json, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# 工具调用线程中的取消事件,长时间运行的工具在抓取过程中检查
+_tool_context = threading.local()
 
-class AuctionAgentV2:
-    """增强版拍卖信息处理 Agent"""
+
+def _tool_cancel_event() -> Optional[threading.Event]:
+    """当前线程中执行的工具调用的取消事件,传给 ScrapeProgress 后分页抓取线程也能看到"""
+    return getattr(_tool_context, "cancel", None)
+
+
+def _tool_cancelled() -> bool:
+    """当前线程中执行的工具调用是否已被取消"""
+    cancel = _tool_cancel_event()
+    return cancel is not None and cancel.is_set()
+
+
+class _ModelCall:
+    """_agent_steps 请求调用方执行的一次模型请求"""
+    
+    def __init__(self, messages: List[Dict], tool_choice: str, tools_tokens: int, stream: bool):
+        self.messages = messages
+        self.tool_choice = tool_choice
+        self.tools_tokens = tools_tokens
+        self.stream = stream
+
+
+class _ToolCalls:
+    """_agent_steps 请求调用方执行的一批工具调用"""
+    
+    def __init__(self, tool_calls: List[Dict]):
+        self.tool_calls = tool_calls
+
+
+class _StreamAssembler:
+    """拼接流式回复: 文本片段和按 index 分片到达的工具调用"""
     
     def __init__(self):
+        self.parts: List[str] = []
+        self.calls: Dict[int, Dict] = {}
+        self.prompt_tokens: Optional[int] = None
+    
+    def add(self, chunk) -> Optional[str]:
+        """加入一个片段,返回其中的文本"""
+        usage = getattr(chunk, "usage", None)
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_tokens
+        if not chunk.choices:
+            return None
+        
+        delta = chunk.choices[0].delta
+        for fragment in delta.tool_calls or []:
+            call = self.calls.setdefault(fragment.index, {
+                "id": None, "type": "function", "function": {"name": "", "arguments": ""}
+            })
+            if fragment.id:
+                call["id"] = fragment.id
+            if fragment.function:
+                call["function"]["name"] += fragment.function.name or ""
+                call["function"]["arguments"] += fragment.function.arguments or ""
+        if delta.content:
+            self.parts.append(delta.content)
+        return delta.content
+    
+    def result(self) -> Tuple[Optional[str], List[Dict]]:
+        return "".join(self.parts) or None, [self.calls[index] for index in sorted(self.calls)]
+
+
+def _message_reply(response) -> Tuple[Optional[str], List[Dict]]:
+    """非流式回复中的文本和工具调用"""
+    message = response.choices[0].message
+    return message.content, [tool_call.model_dump() for tool_call in message.tool_calls or []]
+
+
+def _event_answer(event: Dict, answer: Optional[str]) -> Optional[str]:
+    """从事件中取出最终回复"""
+    if event["type"] == "done":
+        return event["content"]
+    if event["type"] == "error":
+        return f"抱歉,处理您的请求时出现错误: {event['message']}"
+    return answer
+
+
+def _tool_timeout_result(name: str, timeout: float) -> str:
+    logger.warning(f"工具调用超时: {name}, {timeout}s")
+    return json.dumps({"success": False, "error": f"工具执行超时({timeout} 秒),已取消"}, ensure_ascii=False)
+
+
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": """你是一个拍卖信息处理助手。你可以帮助用户搜索和分析 Stacks Bowers 拍卖网站上的拍卖信息。
+
+你有以下工具可以使用:
+1. search_auctions: 搜索拍卖场次,支持按时间、类别、关键词过滤
+2. get_lots_from_auction: 深入特定拍卖场次,获取所有拍品的详细信息
+3. search_stored_lots: 在本地拍品库中搜索之前抓取过的拍品,不需要重新抓取
+4. analyze_lots: 统计拍品价格(按拍卖场次的最低/最高/中位出价、直方图、最贵的拍品)
+5. refresh_auction_lots: 增量刷新拍卖场次,只返回上次查看以来有变化的拍品
+6. get_result_page: 按句柄翻页查看之前工具结果中的完整数据
+7. save_lots_to_file: 将拍品信息保存到文件(JSON/JSONL/CSV/TXT)
+8. search_and_export_lots: 组合操作 - 搜索拍卖、获取拍品、过滤并导出
+
+当用户提出请求时,你需要:
+1. 理解用户的意图
+2. 提取关键参数(时间范围、类别、关键词等)
+3. 调用合适的工具
+4. 将结果以清晰的方式呈现给用户
+
+类别映射:
+- "硬币" 或 "coins" -> ["U.S. Coins & Related", "World Coins"]
+- "纸币" 或 "currency" -> ["U.S. Paper Currency", "World Paper Currency"]
+- "代币" 或 "tokens" -> ["Numismatic Americana"]
+- "古币" 或 "ancient" -> ["Ancient Coins"]
+
+重要功能:
+- 当用户需要获取拍品详细信息时,使用 get_lots_from_auction
+- 当用户搜索之前已经查看或导出过的拍品时,优先使用 search_stored_lots
+- 当用户询问价格分布、均价、最贵的拍品等统计问题时,使用 analyze_lots,不要列出全部拍品
+- 当用户想了解某个拍卖场次的最新变化(出价更新、新增拍品)时,使用 refresh_auction_lots
+- 当用户需要导出数据时,使用 save_lots_to_file 或 search_and_export_lots
+- search_and_export_lots 是最强大的工具,可以一次性完成搜索、获取、过滤和导出
+- 可以分多步调用工具,例如先搜索拍卖场次,再获取拍品,最后保存;互不依赖的工具调用可以在同一次回复中一起发出
+- 较长的列表结果只包含 count、前几行(rows)、出价统计(bid_stats)和 handle;需要更多行时用 get_result_page 翻页,
+  导出时把 handle 传给 save_lots_to_file,不要把拍品数据复制到 lots_data 中
+"""
+}
+
+
+class AgentResources:
+    """
+    可以在多个 Agent(会话)之间共享的资源,都是线程安全的
+    
+    包括模型客户端、抓取器(共享 HTTP 连接池、页面缓存、限速和请求合并)、拍品库、
+    工具线程池、LLM 缓存和意图解析器。
+    """
+    
+    def __init__(self, tool_workers: int = TOOL_CALL_WORKERS):
         self.client = OpenAI(
             api_key=DEEPSEEK_API_KEY,
             base_url=DEEPSEEK_BASE_URL
         )
+        # 异步客户端供 aprocess_command / astream_command 使用
+        self.aclient = AsyncOpenAI(
+            api_key=DEEPSEEK_API_KEY,
+            base_url=DEEPSEEK_BASE_URL
+        )
         self.scraper = AuctionScraper()
         self.lot_scraper = LotScraper()
+        # 本地拍品库,抓取过的拍卖场次直接从库中回答
+        self.store = get_lot_store() if LOT_STORE_ENABLED else None
+        # 同一次回复中的多个工具调用在线程池中并发执行
+        self.tool_executor = ThreadPoolExecutor(max_workers=tool_workers, thread_name_prefix="tool")
+        # 模型回复缓存和意图计划缓存,重复的问题跳过模型请求
+        self.llm_cache = LLMCache() if LLM_CACHE_ENABLED else None
+        # 简单的拍卖搜索指令用规则解析,直接调用 search_auctions,不请求模型
+        self.intent_parser = IntentParser() if INTENT_FAST_PATH_ENABLED else None
+        # 多个会话同时查询同一拍卖场次时只抓取一次
+        self.auction_flight = SingleFlight("auction-store", wait_timeout=LOT_STORE_WAIT_TIMEOUT)
+
+
+class AuctionAgentV2:
+    """增强版拍卖信息处理 Agent"""
+    
+    def __init__(self, resources: Optional[AgentResources] = None, max_results: int = TOOL_RESULT_HANDLES):
+        """
+        Args:
+            resources: 共享资源,为空时创建自己的一份;多个会话共用一份时每个 Agent 只保存自己的对话状态
+            max_results: 按句柄保留的完整工具结果数
+        """
+        resources = resources or AgentResources()
+        self.resources = resources
+        self.client = resources.client
+        self.aclient = resources.aclient
+        self.scraper = resources.scraper
+        self.lot_scraper = resources.lot_scraper
+        self.store = resources.store
+        self.tool_executor = resources.tool_executor
+        self.llm_cache = resources.llm_cache
+        self.intent_parser = resources.intent_parser
+        self.auction_flight = resources.auction_flight
         self.model = DEEPSEEK_MODEL
-        self.conversation_history = []
+        # 对话历史按 token 预算压缩,长会话中每轮的请求大小保持稳定
+        self.history = ConversationHistory()
+        self.tool_timeouts = dict(TOOL_CALL_TIMEOUTS)
+        # 一条用户指令最多请求模型的次数
+        self.max_steps = AGENT_MAX_STEPS
+        self.intent_min_confidence = INTENT_MIN_CONFIDENCE
+        # 工具结果整理: 长列表只把摘要发送给 LLM,完整数据按句柄保留
+        self.result_shaper = ResultShaper(ResultStore(max_results))
         
         # 定义工具函数
         self.tools = [
@@ -81,12 +273,122 @@ class AuctionAgentV2:
                             "max_pages": {
                                 "type": "integer",
                                 "description": "最大抓取页数,默认 20"
+                            },
+                            "refresh": {
+                                "type": "boolean",
+                                "description": "为 true 时忽略拍品库和页面缓存,重新抓取"
                             }
                         },
                         "required": ["auction_url"]
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "search_stored_lots",
+                    "description": "在本地拍品库中搜索之前抓取过的拍品,不需要重新抓取,速度很快。支持关键词、出价范围和拍卖日期过滤",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "keywords": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "匹配标题或描述的关键词,任一匹配即可"
+                            },
+                            "auction_url": {
+                                "type": "string",
+                                "description": "只搜索该拍卖场次(可选)"
+                            },
+                            "min_bid": {"type": "number", "description": "最低出价"},
+                            "max_bid": {"type": "number", "description": "最高出价"},
+                            "date_from": {"type": "string", "description": "拍卖日期下限 YYYY-MM-DD"},
+                            "date_to": {"type": "string", "description": "拍卖日期上限 YYYY-MM-DD"},
+                            "limit": {"type": "integer", "description": "最多返回的拍品数,默认 100"}
+                        },
+                        "required": []
+                    }
+                }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "analyze_lots",
+                    "description": "统计拍品价格: 每个拍卖场次的最低/最高/中位出价、出价分布直方图和最贵的拍品。返回紧凑的统计结果,适合回答价格分析类问题,不需要列出全部拍品",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "auction_urls": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "要分析的拍卖场次 URL;不提供时分析本地拍品库中的所有拍品"
+                            },
+                            "keywords": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "只分析匹配这些关键词的拍品(可选)"
+                            },
+                            "min_bid": {"type": "number", "description": "价格区间下限"},
+                            "max_bid": {"type": "number", "description": "价格区间上限"},
+                            "top_n": {"type": "integer", "description": "返回最贵的拍品数,默认 10"},
+                            "bins": {"type": "integer", "description": "直方图区间数,默认 10"},
+                            "log_scale": {"type": "boolean", "description": "直方图是否按对数等分区间"}
+                        },
+                        "required": []
+                    }
+                }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "refresh_auction_lots",
+                    "description": "增量刷新已关注的拍卖场次,只返回上次查看以来新增或出价等信息有变化的拍品,以及已移除的拍品",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "auction_url": {
+                                "type": "string",
+                                "description": "拍卖场次的 URL"
+                            },
+                            "keywords": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "用于过滤拍品的关键词(可选)"
+                            },
+                            "max_pages": {
+                                "type": "integer",
+                                "description": "最大抓取页数,默认 20"
+                            }
+                        },
+                        "required": ["auction_url"]
+                    }
+                }
+            },
+            {
+                "type": "function",
+                "function": {
+                    "name": "get_result_page",
+                    "description": "按句柄翻页查看之前工具结果中的完整数据。列表较长的工具结果只包含前几行和一个 handle,需要查看更多行时使用",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "handle": {
+                                "type": "string",
+                                "description": "工具结果中的 handle"
+                            },
+                            "offset": {
+                                "type": "integer",
+                                "description": "起始行,默认 0;继续翻页时使用上一页返回的 next_offset"
+                            },
+                            "limit": {
+                                "type": "integer",
+                                "description": "最多返回的行数,默认 20"
+                            }
+                        },
+                        "required": ["handle"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -95,9 +397,13 @@ class AuctionAgentV2:
                     "parameters": {
                         "type": "object",
                         "properties": {
+                            "handle": {
+                                "type": "string",
+                                "description": "之前工具结果中拍品列表的 handle,保存该列表的全部拍品(推荐)"
+                            },
                             "lots_data": {
                                 "type": "string",
-                                "description": "拍品数据的 JSON 字符串"
+                                "description": "拍品数据的 JSON 字符串(没有 handle 时使用)"
                             },
                             "filename": {
                                 "type": "string",
@@ -105,11 +411,11 @@ class AuctionAgentV2:
                             },
                             "format": {
                                 "type": "string",
-                                "enum": ["json", "csv", "txt"],
+                                "enum": ["json", "jsonl", "csv", "txt"],
                                 "description": "文件格式"
                             }
                         },
-                        "required": ["lots_data", "filename"]
+                        "required": ["filename"]
                     }
                 }
             },
@@ -141,7 +447,7 @@ class AuctionAgentV2:
                             },
                             "output_format": {
                                 "type": "string",
-                                "enum": ["json", "csv", "txt"],
+                                "enum": ["json", "jsonl", "csv", "txt"],
                                 "description": "输出格式"
                             }
                         },
@@ -151,6 +457,11 @@ class AuctionAgentV2:
             }
         ]
     
+    @property
+    def conversation_history(self) -> List[Dict]:
+        """当前保留的对话历史消息"""
+        return self.history.messages
+    
     def search_auctions(self, time_range_days: Optional[int] = None, 
                        categories: Optional[List[str]] = None,
                        keywords: Optional[List[str]] = None,
@@ -181,42 +492,192 @@ class AuctionAgentV2:
     
     def get_lots_from_auction(self, auction_url: str, 
                              keywords: Optional[List[str]] = None,
-                             max_pages: int = 20) -> List[Dict]:
+                             max_pages: int = 20,
+                             refresh: bool = False) -> List[Dict]:
         """
         深入拍卖场次获取所有拍品
         
+        拍卖场次最近抓取过时直接从本地拍品库查询,否则抓取并写入拍品库。
+        其他会话正在抓取同一拍卖场次时等待其完成,再从拍品库查询,不重复抓取;
+        等待超时时返回错误,那次抓取被取消或有页面失败时重新抓取。
+        
         Args:
             auction_url: 拍卖场次 URL
             keywords: 过滤关键词
             max_pages: 最大抓取页数
+            refresh: 为 True 时忽略拍品库和页面缓存,重新抓取最新的出价
         
         Returns:
             拍品列表
         """
         logger.info(f"获取拍卖场次的拍品: {auction_url}")
         
-        # 使用 Zyte API 获取所有拍品
-        all_lots = self.lot_scraper.get_all_lots_from_auction(auction_url, max_pages)
+        if self.store and not refresh and self.store.is_fresh(auction_url, max_pages):
+            all_lots = self.store.search_lots(keywords, auction_url=auction_url, with_auction=False)
+            logger.info(f"从拍品库获取到 {len(all_lots)} 个拍品")
+            return all_lots
         
-        # 如果指定了关键词,进行过滤
-        if keywords:
-            all_lots = self.lot_scraper.filter_lots_by_keyword(all_lots, keywords)
+        if self.store:
+            # 抓取结果写入拍品库,同时查询同一拍卖场次的会话共享这一次抓取
+            scraped = []
+            
+            def scrape():
+                scraped.append(True)
+                self._scrape_into_store(auction_url, max_pages, not refresh)
+            
+            self.auction_flight.do((auction_url, max_pages, refresh), scrape)
+            if not scraped and not _tool_cancelled() and not self.store.is_fresh(auction_url, max_pages):
+                # 等待的是其他会话的抓取,它被取消或有页面失败: 自己重新抓取一次
+                logger.warning(f"共享的抓取未完成,重新抓取: {auction_url}")
+                self.auction_flight.do((auction_url, max_pages, refresh), scrape)
+            all_lots = self.store.search_lots(keywords, auction_url=auction_url, with_auction=False)
+            logger.info(f"获取到 {len(all_lots)} 个拍品")
+            return all_lots
+        
+        # 使用 Zyte API 逐页获取拍品,边获取边按关键词过滤
+        progress = ScrapeProgress(auction_url, cancel=_tool_cancel_event())
+        lots = self.lot_scraper.iter_lots(auction_url, max_pages, progress=progress, use_cache=not refresh)
+        
+        all_lots = []
+        for lot in self.lot_scraper.iter_filter_lots_by_keyword(lots, keywords):
+            if _tool_cancelled():
+                # 工具调用已超时: 停止抓取后续页面
+                lots.close()
+                logger.warning(f"获取拍品已取消: {auction_url}")
+                break
+            all_lots.append(lot)
         
+        logger.info(f"获取到 {len(all_lots)} 个拍品")
         return all_lots
     
-    def save_lots_to_file(self, lots_data: str, filename: str, format: str = 'json'):
+    def _scrape_into_store(self, auction_url: str, max_pages: int, use_cache: bool = True):
+        """逐页抓取拍卖场次并写入拍品库,不在内存中保留拍品"""
+        progress = ScrapeProgress(auction_url, cancel=_tool_cancel_event())
+        lots = self.lot_scraper.iter_lots(auction_url, max_pages, progress=progress, use_cache=use_cache)
+        lots = self.store.tee_lots(auction_url, lots, progress=progress)
+        try:
+            for _ in lots:
+                if _tool_cancelled():
+                    # 工具调用已超时: 停止抓取后续页面,已抓取的拍品仍写入拍品库
+                    logger.warning(f"获取拍品已取消: {auction_url}")
+                    break
+        finally:
+            lots.close()
+    
+    def search_stored_lots(self, keywords: Optional[List[str]] = None,
+                           auction_url: Optional[str] = None,
+                           min_bid: Optional[float] = None,
+                           max_bid: Optional[float] = None,
+                           date_from: Optional[str] = None,
+                           date_to: Optional[str] = None,
+                           limit: int = 100) -> Dict:
+        """
+        在本地拍品库中搜索拍品
+        
+        Returns:
+            匹配的拍品(附加拍卖场次信息)和库中的拍品总数
+        """
+        if not self.store:
+            return {"success": False, "error": "本地拍品库未启用"}
+        
+        lots = self.store.search_lots(keywords, auction_url, min_bid, max_bid, date_from, date_to, limit)
+        logger.info(f"拍品库搜索: keywords={keywords}, 找到 {len(lots)} 个拍品")
+        return {"success": True, "count": len(lots), "stored_lots": self.store.count_lots(), "lots": lots}
+    
+    def analyze_lots(self, auction_urls: Optional[List[str]] = None,
+                     keywords: Optional[List[str]] = None,
+                     min_bid: Optional[float] = None,
+                     max_bid: Optional[float] = None,
+                     top_n: int = 10,
+                     bins: int = 10,
+                     log_scale: bool = False) -> Dict:
+        """
+        统计拍品价格
+        
+        指定拍卖场次时通过 get_lots_from_auction 获取拍品(拍品库中有新鲜数据时不会重新抓取),
+        否则统计本地拍品库中的所有拍品。
+        
+        Returns:
+            拍品数、出价范围、按拍卖场次的统计、直方图和最贵的拍品
+        """
+        logger.info(f"分析拍品价格: auctions={auction_urls}, keywords={keywords}")
+        
+        try:
+            bins = int(bins)
+        except (TypeError, ValueError):
+            bins = 0
+        if not 1 <= bins <= ANALYZE_MAX_BINS:
+            return {"success": False, "error": f"bins 必须是 1 到 {ANALYZE_MAX_BINS} 之间的整数"}
+        
+        if auction_urls:
+            lots = []
+            for url in auction_urls:
+                for lot in self.get_lots_from_auction(url, keywords):
+                    lot.setdefault('auction_url', url)
+                    lots.append(lot)
+        elif self.store:
+            lots = self.store.search_lots(keywords)
+        else:
+            return {"success": False, "error": "没有指定拍卖场次,且本地拍品库未启用"}
+        
+        frame = LotFrame.from_lots(lots)
+        return {"success": True,
+                **frame.summary(top=top_n, bins=bins, min_bid=min_bid, max_bid=max_bid, log_scale=log_scale)}
+    
+    def refresh_auction_lots(self, auction_url: str,
+                             keywords: Optional[List[str]] = None,
+                             max_pages: int = 20) -> Dict:
+        """
+        增量刷新拍卖场次,只返回与上次刷新相比有变化的拍品
+        
+        快照保存在共用的 lot_scraper 中,按拍卖场次而不是按会话保存: 上次刷新可能来自其他会话。
+        
+        Args:
+            auction_url: 拍卖场次 URL
+            keywords: 过滤关键词,只影响返回的拍品,快照仍记录全部拍品
+            max_pages: 最大抓取页数
+        
+        Returns:
+            变化的拍品、变化字段、已移除的拍品编号和页面统计
+        """
+        logger.info(f"增量刷新拍卖场次的拍品: {auction_url}")
+        
+        progress = ScrapeProgress(auction_url, cancel=_tool_cancel_event())
+        result = self.lot_scraper.refresh_lots(auction_url, max_pages, progress=progress, keywords=keywords)
+        
+        logger.info(f"{len(result['lots'])} 个拍品有变化")
+        return result
+    
+    def get_result_page(self, handle: str, offset: int = 0, limit: Optional[int] = None) -> Dict:
+        """按句柄翻页查看之前工具结果中的完整数据"""
+        return self.result_shaper.page(handle, offset, limit)
+    
+    def save_lots_to_file(self, lots_data: Optional[str] = None, filename: Optional[str] = None,
+                          format: str = 'json', handle: Optional[str] = None):
         """
         保存拍品到文件
         
         Args:
-            lots_data: 拍品数据的 JSON 字符串
+            lots_data: 拍品数据的 JSON 字符串(指定 handle 时可以省略)
             filename: 文件名
             format: 格式
+            handle: 之前工具结果中拍品列表的句柄,指定时保存句柄对应的全部拍品
         """
+        if not filename:
+            return {"success": False, "error": "需要提供 filename"}
         try:
-            lots = json.loads(lots_data)
-            self.lot_scraper.save_lots_to_file(lots, filename, format)
-            return {"success": True, "filename": filename, "count": len(lots)}
+            if handle:
+                lots = self.result_shaper.store.get(handle)
+                if lots is None:
+                    return {"success": False, "error": f"结果句柄不存在或已过期: {handle}"}
+            elif lots_data:
+                lots = json.loads(lots_data)
+            else:
+                return {"success": False, "error": "需要提供 handle 或 lots_data"}
+            count = self.lot_scraper.save_lots_to_file(lots, filename, format)
+            if count is None:
+                return {"success": False, "error": f"保存文件失败: {filename}"}
+            return {"success": True, "filename": filename, "count": count}
         except Exception as e:
             logger.error(f"保存文件失败: {e}")
             return {"success": False, "error": str(e)}
@@ -225,18 +686,24 @@ class AuctionAgentV2:
                               auction_criteria: Optional[Dict] = None,
                               lot_keywords: Optional[List[str]] = None,
                               output_file: str = "auction_lots.json",
-                              output_format: str = "json") -> Dict:
+                              output_format: str = "json",
+                              on_progress: Optional[Callable[[ScrapeProgress], None]] = None) -> Dict:
         """
         组合操作: 搜索拍卖 -> 获取拍品 -> 过滤 -> 导出
         
+        多个拍卖场次同时抓取(最多 AUCTION_WORKERS 个),所有页面请求共享
+        LotScraper 的令牌桶和 HTTP 客户端的主机并发上限。拍品到达后立即
+        附加拍卖场次信息并写入文件。
+        
         Args:
             auction_criteria: 拍卖场次搜索条件
             lot_keywords: 拍品关键词
             output_file: 输出文件
             output_format: 输出格式
+            on_progress: 每个拍卖场次开始前以其 ScrapeProgress 调用,用于后台任务汇报进度
         
         Returns:
-            操作结果
+            操作结果,auctions 字段包含每个拍卖场次的页数、拍品数、失败页面和耗时
         """
         logger.info("执行组合操作: 搜索拍卖 -> 获取拍品 -> 导出")
         
@@ -252,35 +719,199 @@ class AuctionAgentV2:
         
         logger.info(f"找到 {len(auctions)} 个拍卖场次")
         
-        # 2. 获取所有拍品
-        all_lots = []
-        for auction in auctions:
-            url = auction.get('url')
-            if url:
-                logger.info(f"获取拍卖场次的拍品: {auction.get('title')}")
-                lots = self.get_lots_from_auction(url, lot_keywords)
-                
-                # 添加拍卖场次信息到每个拍品
-                for lot in lots:
-                    lot['auction_title'] = auction.get('title')
-                    lot['auction_date'] = auction.get('date')
-                    lot['auction_url'] = url
-                
-                all_lots.extend(lots)
+        # 2. 获取拍品并 3. 保存到文件: 拍品从各拍卖场次流入文件,不在内存中累积
+        reports = []
+        started = datetime.now()
+        lots = self._iter_auction_lots(auctions, lot_keywords, reports, on_progress=on_progress)
+        lots_count = self.lot_scraper.save_lots_to_file(lots, output_file, output_format)
+        elapsed = (datetime.now() - started).total_seconds()
         
-        logger.info(f"总共获取 {len(all_lots)} 个拍品")
+        if lots_count is None:
+            return {
+                "success": False,
+                "message": f"保存文件失败: {output_file}",
+                "auctions": reports
+            }
         
-        # 3. 保存到文件
-        self.lot_scraper.save_lots_to_file(all_lots, output_file, output_format)
+        logger.info(f"总共获取 {lots_count} 个拍品,耗时 {elapsed:.1f}s")
         
         return {
             "success": True,
             "auctions_count": len(auctions),
-            "lots_count": len(all_lots),
+            "lots_count": lots_count,
             "output_file": output_file,
-            "output_format": output_format
+            "output_format": output_format,
+            "elapsed_seconds": round(elapsed, 2),
+            "auctions": reports
         }
     
+    def run_scrape_job(self, job) -> Dict:
+        """
+        后台任务: 抓取拍卖场次的拍品,拍品随抓取写入任务结果,可在执行过程中读取
+        
+        job.params:
+            auction_urls: 拍卖场次 URL 列表;为空时按 auction_criteria 搜索拍卖场次
+            auction_criteria: 拍卖场次搜索条件
+            lot_keywords: 拍品关键词
+        """
+        params = job.params
+        if params.get("auction_urls"):
+            auctions = [{"url": url, "title": url} for url in params["auction_urls"]]
+        else:
+            auctions = self.search_auctions(**(params.get("auction_criteria") or {}))
+        
+        reports = []
+        batch = []
+        flushed = time.monotonic()
+        _tool_context.cancel = job.cancel_event
+        try:
+            for lot in self._iter_auction_lots(auctions, params.get("lot_keywords"), reports,
+                                               on_progress=job.track):
+                batch.append(lot.to_dict())
+                # 按批写入结果,兼顾写入次数和结果可见的延迟
+                if len(batch) >= 100 or time.monotonic() - flushed >= 1.0:
+                    job.add_results(batch)
+                    batch = []
+                    flushed = time.monotonic()
+            job.add_results(batch)
+        finally:
+            _tool_context.cancel = None
+        
+        return {
+            "auctions_count": len(auctions),
+            "lots_count": job.results_count,
+            "auctions": reports
+        }
+    
+    def run_export_job(self, job) -> Dict:
+        """后台任务: 执行 search_and_export_lots,job.params 为其参数"""
+        _tool_context.cancel = job.cancel_event
+        try:
+            return self.search_and_export_lots(**job.params, on_progress=job.track)
+        finally:
+            _tool_context.cancel = None
+    
+    def _iter_auction_lots(self, auctions: List[Dict], lot_keywords: Optional[List[str]] = None,
+                           reports: Optional[List[Dict]] = None, max_workers: int = AUCTION_WORKERS,
+                           on_progress: Optional[Callable[[ScrapeProgress], None]] = None):
+        """
+        并发抓取多个拍卖场次,按到达顺序产出匹配关键词的拍品
+        
+        每个拍卖场次由一个工作线程抓取,拍品经有界队列交给调用方,
+        调用方写入较慢时工作线程会等待,内存占用不随拍卖规模增长。
+        
+        Args:
+            auctions: 拍卖场次列表
+            lot_keywords: 拍品关键词
+            reports: 传入列表时,每个拍卖场次结束后追加一条进度报告
+            max_workers: 同时抓取的拍卖场次数
+            on_progress: 提交抓取时以每个拍卖场次的 ScrapeProgress 调用
+        
+        Yields:
+            Lot 记录,auction 指向所属拍卖场次
+        """
+        auctions = [auction for auction in auctions if auction.get('url')]
+        if not auctions:
+            return
+        
+        done = object()
+        lot_queue = queue.Queue(maxsize=1000)
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    lot_queue.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def scrape(auction: Dict, progress: ScrapeProgress):
+            url = auction['url']
+            title = auction.get('title')
+            record = Auction.from_dict(auction)
+            # 排队等待的时间不计入该拍卖场次的耗时
+            progress.started_at = time.time()
+            report = {"title": title, "url": url, "lots_matched": 0, "error": None}
+            
+            logger.info(f"获取拍卖场次的拍品: {title}")
+            
+            try:
+                lots = self.lot_scraper.iter_lots(url, progress=progress)
+                if self.store:
+                    lots = self.store.tee_lots(url, lots, auction, progress)
+                for lot in self.lot_scraper.iter_filter_lots_by_keyword(lots, lot_keywords):
+                    # 拍品引用共享的拍卖场次对象,写入文件时才展开为 auction_* 字段
+                    if not put(Lot.from_dict(lot, record)):
+                        lots.close()
+                        break
+                    report["lots_matched"] += 1
+            except Exception as e:
+                logger.error(f"抓取拍卖场次失败: {title}, {e}")
+                report["error"] = str(e)
+            finally:
+                progress.finish()
+                report.update(progress.to_dict())
+                del report["auction_url"]
+                logger.info(f"拍卖场次完成: {title}, {report['lots_matched']} 个拍品, "
+                            f"耗时 {report['elapsed_seconds']}s")
+                put((done, report))
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(auctions))),
+                                      thread_name_prefix="auction")
+        progresses = []
+        futures = []
+        try:
+            for auction in auctions:
+                # 调用方停止或取消时 stop 被设置,正在等待分页的抓取线程随之退出
+                progress = ScrapeProgress(auction['url'], cancel=stop)
+                if on_progress:
+                    on_progress(progress)
+                progresses.append(progress)
+                futures.append(executor.submit(scrape, auction, progress))
+            
+            remaining = len(auctions)
+            logged = time.monotonic()
+            while remaining:
+                if _tool_cancelled():
+                    logger.warning(f"抓取已取消,还有 {remaining} 个拍卖场次未完成")
+                    break
+                if time.monotonic() - logged >= 5.0:
+                    self._log_progress(progresses)
+                    logged = time.monotonic()
+                try:
+                    item = lot_queue.get(timeout=0.5)
+                except queue.Empty:
+                    # 工作线程都已结束且队列为空: 没有发送结束标记的线程不会再有结果
+                    if all(future.done() for future in futures):
+                        logger.error(f"{remaining} 个拍卖场次的抓取线程异常退出")
+                        break
+                    continue
+                if isinstance(item, tuple) and item[0] is done:
+                    remaining -= 1
+                    if reports is not None:
+                        reports.append(item[1])
+                    continue
+                yield item
+        
+        finally:
+            # 调用方提前停止时通知工作线程退出
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    @staticmethod
+    def _log_progress(progresses: List[ScrapeProgress]):
+        """汇总记录多个拍卖场次的抓取进度和预计剩余时间"""
+        states = [progress.to_dict() for progress in progresses]
+        pages_done = sum(state["pages_done"] for state in states)
+        total_pages = sum(state["total_pages"] or 0 for state in states)
+        lots_found = sum(state["lots_found"] for state in states)
+        etas = [state["eta_seconds"] for state in states if not state["finished"]]
+        eta = "未知" if not etas or None in etas else f"{max(etas):.0f}s"
+        logger.info(f"抓取进度: {pages_done}/{total_pages} 页, {lots_found} 个拍品, "
+                    f"{sum(state['finished'] for state in states)}/{len(states)} 个拍卖场次完成, 预计剩余 {eta}")
+    
     def _parse_date(self, date_str: str) -> datetime:
         """解析日期字符串"""
         try:
@@ -315,11 +946,24 @@ class AuctionAgentV2:
         ]
     
     def execute_tool(self, tool_name: str, arguments: Dict) -> str:
-        """执行工具函数"""
+        """
+        执行工具函数
+        
+        Returns:
+            发送给 LLM 的结果 JSON,长列表由 result_shaper 整理为摘要和句柄
+        """
         if tool_name == "search_auctions":
             result = self.search_auctions(**arguments)
         elif tool_name == "get_lots_from_auction":
             result = self.get_lots_from_auction(**arguments)
+        elif tool_name == "search_stored_lots":
+            result = self.search_stored_lots(**arguments)
+        elif tool_name == "analyze_lots":
+            result = self.analyze_lots(**arguments)
+        elif tool_name == "refresh_auction_lots":
+            result = self.refresh_auction_lots(**arguments)
+        elif tool_name == "get_result_page":
+            result = self.get_result_page(**arguments)
         elif tool_name == "save_lots_to_file":
             result = self.save_lots_to_file(**arguments)
         elif tool_name == "search_and_export_lots":
@@ -327,113 +971,408 @@ class AuctionAgentV2:
         else:
             result = {"error": f"未知的工具: {tool_name}"}
         
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        # 翻页结果已经按字符上限分页,不再替换为摘要
+        return self.result_shaper.shape(tool_name, result, summarize=tool_name != "get_result_page")
     
     def process_command(self, user_input: str) -> str:
-        """处理用户指令"""
+        """处理用户指令,返回完整回复"""
+        answer = None
+        for event in self._agent_loop(user_input, stream=False):
+            answer = _event_answer(event, answer)
+        return answer
+    
+    def stream_command(self, user_input: str) -> Iterator[Dict]:
+        """
+        处理用户指令,边生成边产出事件
+        
+        Yields:
+            {"type": "tool_call", "name", "arguments"}: 开始执行工具
+            {"type": "tool_result", "name", "chars"}: 工具执行完成
+            {"type": "token", "content"}: 模型输出的一段文本
+            {"type": "done", "content"}: 完整回复
+            {"type": "error", "message"}: 处理失败
+        """
+        return self._agent_loop(user_input, stream=True)
+    
+    async def aprocess_command(self, user_input: str) -> str:
+        """process_command 的异步版本,模型请求使用异步客户端,工具在线程池中执行,不阻塞事件循环"""
+        answer = None
+        async for event in self._agent_loop_async(user_input, stream=False):
+            answer = _event_answer(event, answer)
+        return answer
+    
+    def astream_command(self, user_input: str) -> AsyncIterator[Dict]:
+        """stream_command 的异步版本,事件格式相同"""
+        return self._agent_loop_async(user_input, stream=True)
+    
+    def _agent_loop(self, user_input: str, stream: bool) -> Iterator[Dict]:
+        """同步执行 _agent_steps: 在当前线程请求模型、等待工具结果"""
+        steps = self._agent_steps(user_input, stream)
+        reply, error = None, None
+        try:
+            while True:
+                try:
+                    item = steps.throw(error) if error else steps.send(reply)
+                except StopIteration:
+                    return
+                reply, error = None, None
+                try:
+                    if isinstance(item, _ModelCall):
+                        reply = yield from self._call_model(item)
+                    elif isinstance(item, _ToolCalls):
+                        reply = self.run_tool_calls(item.tool_calls)
+                    else:
+                        yield item
+                except Exception as e:
+                    error = e
+        finally:
+            steps.close()
+    
+    async def _agent_loop_async(self, user_input: str, stream: bool) -> AsyncIterator[Dict]:
+        """异步执行 _agent_steps: 模型请求使用 aclient,等待工具结果时让出事件循环"""
+        steps = self._agent_steps(user_input, stream)
+        reply, error = None, None
+        try:
+            while True:
+                try:
+                    item = steps.throw(error) if error else steps.send(reply)
+                except StopIteration:
+                    return
+                reply, error = None, None
+                try:
+                    if isinstance(item, _ModelCall):
+                        async for event in self._acall_model(item):
+                            # 最后一项是 (文本, 工具调用),其余是 token 事件
+                            if isinstance(event, tuple):
+                                reply = event
+                            else:
+                                yield event
+                    elif isinstance(item, _ToolCalls):
+                        reply = await self.arun_tool_calls(item.tool_calls)
+                    else:
+                        yield item
+                except Exception as e:
+                    error = e
+        finally:
+            steps.close()
+    
+    def _agent_steps(self, user_input: str, stream: bool):
+        """
+        多步工具循环: 模型可以连续调用工具(搜索 -> 获取拍品 -> 保存),最多 max_steps 次请求
+        
+        最后一次请求设置 tool_choice="none",要求模型根据已有结果直接回答。
+        
+        这里只处理对话逻辑,不直接做 I/O: 产出 _ModelCall / _ToolCalls 由调用方(同步或异步)
+        执行后把结果送回,其余产出的是事件。
+        """
         logger.info(f"处理用户指令: {user_input}")
         
-        # 添加用户消息到对话历史
-        self.conversation_history.append({
-            "role": "user",
-            "content": user_input
-        })
+        # 之前没有对话时,第一批工具调用只取决于这条指令,可以作为意图计划缓存
+        context_free = not self.history.messages and not self.history.summary_lines
         
-        # 系统提示
-        system_message = {
-            "role": "system",
-            "content": """你是一个拍卖信息处理助手。你可以帮助用户搜索和分析 Stacks Bowers 拍卖网站上的拍卖信息。
-
-你有以下工具可以使用:
-1. search_auctions: 搜索拍卖场次,支持按时间、类别、关键词过滤
-2. get_lots_from_auction: 深入特定拍卖场次,获取所有拍品的详细信息
-3. save_lots_to_file: 将拍品信息保存到文件(JSON/CSV/TXT)
-4. search_and_export_lots: 组合操作 - 搜索拍卖、获取拍品、过滤并导出
-
-当用户提出请求时,你需要:
-1. 理解用户的意图
-2. 提取关键参数(时间范围、类别、关键词等)
-3. 调用合适的工具
-4. 将结果以清晰的方式呈现给用户
-
-类别映射:
-- "硬币" 或 "coins" -> ["U.S. Coins & Related", "World Coins"]
-- "纸币" 或 "currency" -> ["U.S. Paper Currency", "World Paper Currency"]
-- "代币" 或 "tokens" -> ["Numismatic Americana"]
-- "古币" 或 "ancient" -> ["Ancient Coins"]
-
-重要功能:
-- 当用户需要获取拍品详细信息时,使用 get_lots_from_auction
-- 当用户需要导出数据时,使用 save_lots_to_file 或 search_and_export_lots
-- search_and_export_lots 是最强大的工具,可以一次性完成搜索、获取、过滤和导出
-"""
-        }
+        intent = self._parse_intent(user_input, context_free)
         
-        messages = [system_message] + self.conversation_history
+        # 添加用户消息到对话历史
+        self.history.add_user(user_input)
+        
+        # 工具定义每次都会发送,计入历史预算
+        tools_tokens = estimate_tokens(compact_json(self.tools))
         
-        # 调用 LLM
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=self.tools,
-                tool_choice="auto"
-            )
-            
-            response_message = response.choices[0].message
+            if intent:
+                yield from self._fast_path(intent)
+                return
             
-            # 检查是否需要调用工具
-            if response_message.tool_calls:
-                # 执行工具调用
-                for tool_call in response_message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    logger.info(f"调用工具: {function_name}, 参数: {function_args}")
-                    
-                    # 执行工具
-                    function_result = self.execute_tool(function_name, function_args)
-                    
-                    # 添加工具调用和结果到对话历史
-                    self.conversation_history.append({
+            for step in range(1, self.max_steps + 1):
+                tool_choice = "auto" if step < self.max_steps else "none"
+                # 与 put_plan 相同: 只有没有上下文的指令才使用计划,追问中的同一句话可能指代之前的结果
+                plan = (self.llm_cache.get_plan(user_input)
+                        if step == 1 and context_free and self.llm_cache else None)
+                
+                if plan:
+                    # 重复的问题: 直接执行缓存的工具调用计划,跳过第一次模型请求
+                    content, tool_calls = None, plan
+                else:
+                    messages = self.history.build(SYSTEM_MESSAGE, reserved_tokens=tools_tokens)
+                    content, tool_calls = yield from self._complete(messages, tool_choice, tools_tokens, stream)
+                    if step == 1 and tool_calls and context_free and self.llm_cache:
+                        self.llm_cache.put_plan(user_input, tool_calls)
+                
+                if not tool_calls:
+                    self.history.append({
                         "role": "assistant",
-                        "content": None,
-                        "tool_calls": [tool_call.model_dump()]
-                    })
-                    
-                    self.conversation_history.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": function_result
+                        "content": content
                     })
+                    yield {"type": "done", "content": content}
+                    return
                 
-                # 再次调用 LLM 生成最终回复
-                second_response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[system_message] + self.conversation_history
-                )
-                
-                final_message = second_response.choices[0].message.content
-                self.conversation_history.append({
+                # 一条助手消息包含全部工具调用,之后按顺序添加每个调用的结果
+                self.history.append({
                     "role": "assistant",
-                    "content": final_message
+                    "content": content,
+                    "tool_calls": tool_calls
                 })
+                for tool_call in tool_calls:
+                    yield {"type": "tool_call", "name": tool_call["function"]["name"],
+                           "arguments": tool_call["function"]["arguments"]}
                 
-                return final_message
-            else:
-                # 直接返回 LLM 的回复
-                content = response_message.content
-                self.conversation_history.append({
-                    "role": "assistant",
-                    "content": content
-                })
-                return content
+                # 并发执行工具调用,结果按调用顺序返回
+                results = yield _ToolCalls(tool_calls)
                 
+                for tool_call, function_result in zip(tool_calls, results):
+                    self.history.append({
+                        "role": "tool",
+                        "tool_call_id": tool_call["id"],
+                        "content": function_result
+                    })
+                    yield {"type": "tool_result", "name": tool_call["function"]["name"],
+                           "chars": len(function_result)}
+        
+        except GeneratorExit:
+            # 调用方中途停止(客户端断开、请求超时): 补齐工具结果,之后仍能继续这段对话
+            self.history.close_pending_calls("[工具调用已中断]")
+            raise
         except Exception as e:
             logger.error(f"处理指令时出错: {e}")
-            return f"抱歉,处理您的请求时出现错误: {str(e)}"
+            # 出错前已写入的工具调用补上错误结果,下一条指令的对话历史仍然有效
+            self.history.close_pending_calls(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+            yield {"type": "error", "message": str(e)}
+    
+    def _parse_intent(self, user_input: str, context_free: bool) -> Optional[IntentResult]:
+        """
+        规则解析用户指令,置信度足够时返回解析结果,否则返回 None 交给 LLM
+        
+        有上文时,只有明确提到拍卖的指令才直接处理,"列出所有金币" 这类指令可能指上文中的拍卖场次。
+        """
+        if not self.intent_parser:
+            return None
+        intent = self.intent_parser.parse(user_input)
+        if intent.confidence < self.intent_min_confidence or not (context_free or intent.explicit):
+            logger.info(f"意图解析置信度不足({intent.confidence:.2f}, {intent.reason}),交给 LLM 处理")
+            return None
+        logger.info(f"意图解析命中: {intent.arguments}, 置信度 {intent.confidence:.2f}")
+        return intent
+    
+    def _fast_path(self, intent: IntentResult) -> Iterator[Dict]:
+        """
+        直接执行解析出的搜索,用模板生成回复
+        
+        搜索与模型选择的工具调用一样以 _ToolCalls 交给调用方执行(异步调用方在工具线程池中执行,
+        不阻塞事件循环);工具调用和结果照常写入对话历史,之后的指令可以引用这次搜索的结果。
+        """
+        arguments = json.dumps(intent.arguments, ensure_ascii=False)
+        tool_call = {"id": f"call_local_{self.history.turn}_{int(time.time() * 1000)}", "type": "function",
+                     "function": {"name": intent.tool, "arguments": arguments}}
+        self.history.append({
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [tool_call]
+        })
+        yield {"type": "tool_call", "name": intent.tool, "arguments": arguments}
+        
+        function_result = (yield _ToolCalls([tool_call]))[0]
+        self.history.append({
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "content": function_result
+        })
+        yield {"type": "tool_result", "name": intent.tool, "chars": len(function_result)}
+        
+        auctions = self._result_rows(function_result)
+        content = format_auction_answer(intent.arguments, auctions)
+        self.history.append({
+            "role": "assistant",
+            "content": content
+        })
+        yield {"type": "token", "content": content}
+        yield {"type": "done", "content": content}
+    
+    def _result_rows(self, function_result: str) -> List[Dict]:
+        """从整理后的工具结果取回完整的行,摘要中的行不全时按句柄取回;工具失败时抛出异常"""
+        result = json.loads(function_result)
+        if isinstance(result, list):
+            return result
+        if isinstance(result, dict) and result.get("handle"):
+            rows = self.result_shaper.store.get(result["handle"])
+            return rows if rows is not None else result.get("rows", [])
+        raise RuntimeError(result.get("error") if isinstance(result, dict) else function_result)
+    
+    def _complete(self, messages: List[Dict], tool_choice: str, tools_tokens: int, stream: bool):
+        """
+        请求一次模型回复,相同的请求直接使用缓存的回复
+        
+        stream 为 True 时文本片段到达后立即产出 token 事件。
+        
+        Returns:
+            (文本, 工具调用列表)
+        """
+        key = None
+        if self.llm_cache:
+            key = response_key(self.model, messages, self.tools, tool_choice)
+            cached = self.llm_cache.get_response(key)
+            if cached is not None:
+                logger.info("模型回复缓存命中")
+                content, tool_calls = cached
+                if stream and content:
+                    yield {"type": "token", "content": content}
+                return content, tool_calls
+        
+        content, tool_calls = yield _ModelCall(messages, tool_choice, tools_tokens, stream)
+        
+        if key is not None:
+            self.llm_cache.put_response(key, content, tool_calls)
+        return content, tool_calls
+    
+    def _call_model(self, request: "_ModelCall"):
+        """
+        同步请求模型,stream 为 True 时文本片段到达后立即产出
+        
+        Returns:
+            (完整文本, 工具调用列表)
+        """
+        if not request.stream:
+            response = self.client.chat.completions.create(**self._request_kwargs(request))
+            self._record_usage(request.messages, response, request.tools_tokens)
+            return _message_reply(response)
+        
+        assembler = _StreamAssembler()
+        for chunk in self.client.chat.completions.create(**self._request_kwargs(request)):
+            text = assembler.add(chunk)
+            if text:
+                yield {"type": "token", "content": text}
+        self._record_stream_usage(request, assembler)
+        return assembler.result()
+    
+    async def _acall_model(self, request: "_ModelCall"):
+        """异步请求模型,依次产出 token 事件,最后产出 (完整文本, 工具调用列表)"""
+        if not request.stream:
+            response = await self.aclient.chat.completions.create(**self._request_kwargs(request))
+            self._record_usage(request.messages, response, request.tools_tokens)
+            yield _message_reply(response)
+            return
+        
+        assembler = _StreamAssembler()
+        async for chunk in await self.aclient.chat.completions.create(**self._request_kwargs(request)):
+            text = assembler.add(chunk)
+            if text:
+                yield {"type": "token", "content": text}
+        self._record_stream_usage(request, assembler)
+        yield assembler.result()
+    
+    def _request_kwargs(self, request: "_ModelCall") -> Dict:
+        kwargs = {
+            "model": self.model,
+            "messages": request.messages,
+            "tools": self.tools,
+            "tool_choice": request.tool_choice
+        }
+        if request.stream:
+            kwargs["stream"] = True
+            kwargs["stream_options"] = {"include_usage": True}
+        return kwargs
+    
+    def _record_stream_usage(self, request: "_ModelCall", assembler: "_StreamAssembler"):
+        estimated = request.tools_tokens + sum(message_tokens(m) for m in request.messages)
+        self.history.record_usage(estimated, assembler.prompt_tokens)
+    
+    def run_tool_calls(self, tool_calls: List[Dict]) -> List[str]:
+        """
+        并发执行一次回复中的多个工具调用
+        
+        每个调用在 tool_executor 中执行,超过 tool_timeouts 中的时限(默认 TOOL_CALL_TIMEOUT)
+        时通知该调用取消,并以错误结果代替,不等待它结束;其他调用不受影响。
+        
+        Args:
+            tool_calls: 工具调用 {"id", "type", "function": {"name", "arguments"}}
+        
+        Returns:
+            与 tool_calls 顺序一致的结果 JSON
+        """
+        started = time.monotonic()
+        results = []
+        for name, future, cancel, error in self._submit_tool_calls(tool_calls):
+            if future is None:
+                results.append(error)
+                continue
+            
+            timeout = self.tool_timeouts.get(name, TOOL_CALL_TIMEOUT)
+            try:
+                results.append(future.result(timeout=max(0.0, started + timeout - time.monotonic())))
+            except FutureTimeoutError:
+                cancel.set()
+                future.cancel()
+                results.append(_tool_timeout_result(name, timeout))
+            except Exception as e:
+                logger.error(f"工具调用失败: {name}, {e}")
+                results.append(json.dumps({"success": False, "error": str(e)}, ensure_ascii=False))
+        
+        logger.info(f"{len(results)} 个工具调用完成,耗时 {time.monotonic() - started:.2f}s")
+        return results
+    
+    async def arun_tool_calls(self, tool_calls: List[Dict]) -> List[str]:
+        """run_tool_calls 的异步版本: 工具仍在 tool_executor 中执行,等待时不阻塞事件循环"""
+        started = time.monotonic()
+        
+        async def collect(name, future, cancel, error):
+            if future is None:
+                return error
+            timeout = self.tool_timeouts.get(name, TOOL_CALL_TIMEOUT)
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future),
+                                              max(0.0, started + timeout - time.monotonic()))
+            except asyncio.TimeoutError:
+                cancel.set()
+                return _tool_timeout_result(name, timeout)
+            except asyncio.CancelledError:
+                # 请求被取消时通知工具停止抓取
+                cancel.set()
+                raise
+            except Exception as e:
+                logger.error(f"工具调用失败: {name}, {e}")
+                return json.dumps({"success": False, "error": str(e)}, ensure_ascii=False)
+        
+        results = await asyncio.gather(*(collect(*item) for item in self._submit_tool_calls(tool_calls)))
+        logger.info(f"{len(results)} 个工具调用完成,耗时 {time.monotonic() - started:.2f}s")
+        return list(results)
+    
+    def _submit_tool_calls(self, tool_calls: List[Dict]) -> List[tuple]:
+        """
+        把工具调用提交到 tool_executor
+        
+        Returns:
+            [(工具名, future, 取消事件, 错误结果)],参数无效时 future 为 None
+        """
+        pending = []
+        for tool_call in tool_calls:
+            name = tool_call["function"]["name"]
+            try:
+                arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            except json.JSONDecodeError as e:
+                pending.append((name, None, None, json.dumps({"error": f"工具参数不是有效的 JSON: {e}"},
+                                                             ensure_ascii=False)))
+                continue
+            
+            logger.info(f"调用工具: {name}, 参数: {arguments}")
+            cancel = threading.Event()
+            future = self.tool_executor.submit(self._execute_tool_call, name, arguments, cancel)
+            pending.append((name, future, cancel, None))
+        return pending
+    
+    def _execute_tool_call(self, name: str, arguments: Dict, cancel: threading.Event) -> str:
+        """在工具线程中执行,取消事件通过线程局部变量传给工具"""
+        _tool_context.cancel = cancel
+        try:
+            return self.execute_tool(name, arguments)
+        finally:
+            _tool_context.cancel = None
+    
+    def _record_usage(self, messages: List[Dict], response, reserved_tokens: int = 0):
+        """记录本次请求估算和实际的 prompt token 数"""
+        estimated = reserved_tokens + sum(message_tokens(m) for m in messages)
+        usage = getattr(response, "usage", None)
+        self.history.record_usage(estimated, getattr(usage, "prompt_tokens", None))
     
     def reset_conversation(self):
         """重置对话历史"""
-        self.conversation_history = []
+        self.history.clear()
         logger.info("对话历史已重置")
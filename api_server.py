@@ -2,13 +2,24 @@
 Web API 服务 - 提供 RESTful API 接口
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
 import uvicorn
 import logging
+import json
+import os
 
-from agent import AuctionAgent
+from agent_v2 import AgentResources, AuctionAgentV2
+from config import (
+    API_WORKERS, API_REQUEST_TIMEOUT, API_TOOL_WORKERS, API_SESSION_RESULT_HANDLES, EXPORT_DIR, EXPORT_FORMATS
+)
+from session_pool import Session, SessionPool
+from job_queue import JobQueue, JobQueueFull
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -21,8 +32,31 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# 全局 Agent 实例
-agent = AuctionAgent()
+# 所有会话共用的模型客户端、抓取器、缓存和工具线程池
+resources = AgentResources(tool_workers=API_TOOL_WORKERS)
+
+# 每个 session_id 有自己的对话历史和工具结果
+sessions = SessionPool(lambda: AuctionAgentV2(resources, max_results=API_SESSION_RESULT_HANDLES))
+
+# 不涉及对话的操作(直接搜索、后台任务)使用的 Agent
+agent = AuctionAgentV2(resources)
+
+# 耗时的抓取和导出在后台任务中执行,提交后立即返回任务 ID
+jobs = JobQueue({"scrape": agent.run_scrape_job, "export": agent.run_export_job})
+
+# 阻塞操作(抓取、本地搜索)在有界线程池中执行,事件循环可以同时处理其他请求
+executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """在线程池中执行阻塞函数,超过 API_REQUEST_TIMEOUT 时抛出 asyncio.TimeoutError"""
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout=API_REQUEST_TIMEOUT)
+
+
+def timeout_error() -> HTTPException:
+    return HTTPException(status_code=504, detail=f"请求处理超时({API_REQUEST_TIMEOUT} 秒)")
 
 
 class QueryRequest(BaseModel):
@@ -37,6 +71,21 @@ class QueryResponse(BaseModel):
     session_id: Optional[str] = None
 
 
+class ResetRequest(BaseModel):
+    """重置会话请求模型"""
+    session_id: str
+
+
+class JobRequest(BaseModel):
+    """后台任务请求模型"""
+    kind: str = "scrape"
+    auction_urls: Optional[List[str]] = None
+    auction_criteria: Optional[Dict] = None
+    lot_keywords: Optional[List[str]] = None
+    output_file: Optional[str] = None
+    output_format: Optional[str] = None
+
+
 class SearchRequest(BaseModel):
     """搜索请求模型"""
     time_range_days: Optional[int] = None
@@ -53,7 +102,12 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "query": "/api/query",
+            "query_stream": "/api/query/stream",
             "search": "/api/search",
+            "reset": "/api/reset",
+            "sessions": "/api/sessions",
+            "jobs": "/api/jobs",
+            "metrics": "/api/metrics",
             "health": "/health"
         }
     }
@@ -70,6 +124,9 @@ async def query(request: QueryRequest):
     """
     处理自然语言查询
     
+    同一 session_id 的查询共享对话历史,依次处理;不传 session_id 时创建新会话,
+    响应中返回会话 ID。
+    
     示例:
     ```json
     {
@@ -78,18 +135,71 @@ async def query(request: QueryRequest):
     ```
     """
     try:
-        logger.info(f"收到查询: {request.query}")
-        response = agent.process_command(request.query)
+        session = sessions.get(request.session_id)
+        logger.info(f"收到查询 [{session.session_id}]: {request.query}")
+        async with session.lock:
+            session.queries += 1
+            response = await asyncio.wait_for(session.agent.aprocess_command(request.query),
+                                              timeout=API_REQUEST_TIMEOUT)
         
         return QueryResponse(
             response=response,
-            session_id=request.session_id
+            session_id=session.session_id
         )
+    except asyncio.TimeoutError:
+        logger.error(f"查询超时: {request.query}")
+        raise timeout_error()
     except Exception as e:
         logger.error(f"处理查询时出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def sse_events(events: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    """把 Agent 事件转换为 Server-Sent Events 格式"""
+    async for event in events:
+        data = json.dumps(event, ensure_ascii=False)
+        yield f"event: {event['type']}\ndata: {data}\n\n"
+
+
+async def locked_stream(session: Session, query: str) -> AsyncIterator[Dict]:
+    """持有会话锁流式处理指令,超过 API_REQUEST_TIMEOUT 时产出 error 事件"""
+    async with session.lock:
+        session.queries += 1
+        events = session.agent.astream_command(query)
+        deadline = asyncio.get_running_loop().time() + API_REQUEST_TIMEOUT
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), timeout=max(0.0, remaining))
+                except StopAsyncIteration:
+                    return
+                yield event
+        except asyncio.TimeoutError:
+            logger.error(f"流式查询超时: {query}")
+            yield {"type": "error", "message": f"请求处理超时({API_REQUEST_TIMEOUT} 秒)"}
+        finally:
+            await events.aclose()
+
+
+@app.post("/api/query/stream")
+async def query_stream(request: QueryRequest):
+    """
+    处理自然语言查询,以 Server-Sent Events 流式返回
+
+    事件类型: tool_call / tool_result(工具执行进度)、token(模型输出的文本片段)、
+    done(完整回复)、error。模型输出第一个片段时客户端即可开始显示。
+    会话 ID 在响应头 X-Session-Id 中返回。
+    """
+    session = sessions.get(request.session_id)
+    logger.info(f"收到流式查询 [{session.session_id}]: {request.query}")
+    return StreamingResponse(
+        sse_events(locked_stream(session, request.query)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Session-Id": session.session_id}
+    )
+
+
 @app.post("/api/search")
 async def search(request: SearchRequest):
     """
@@ -105,9 +215,10 @@ async def search(request: SearchRequest):
     ```
     """
     try:
-        logger.info(f"收到搜索请求: {request.dict()}")
+        logger.info(f"收到搜索请求: {request.model_dump()}")
         
-        results = agent.search_auctions(
+        results = await run_blocking(
+            agent.search_auctions,
             time_range_days=request.time_range_days,
             categories=request.categories,
             keywords=request.keywords,
@@ -118,22 +229,130 @@ async def search(request: SearchRequest):
             "count": len(results),
             "results": results
         }
+    except asyncio.TimeoutError:
+        logger.error(f"搜索超时: {request.model_dump()}")
+        raise timeout_error()
     except Exception as e:
         logger.error(f"搜索时出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/reset")
-async def reset_conversation():
-    """重置对话历史"""
+async def reset_conversation(request: ResetRequest):
+    """重置指定会话的对话历史,其他会话不受影响"""
     try:
-        agent.reset_conversation()
-        return {"message": "对话历史已重置"}
+        if not sessions.remove(request.session_id):
+            raise HTTPException(status_code=404, detail=f"会话不存在: {request.session_id}")
+        return {"message": "对话历史已重置", "session_id": request.session_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"重置对话时出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def export_path(output_file: str) -> str:
+    """导出任务的文件名只能是 EXPORT_DIR 中的文件名,不能包含目录"""
+    name = os.path.basename(output_file)
+    if name != output_file or "\\" in name or name in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail=f"output_file 只能是文件名,不能包含目录: {output_file}")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, name)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """
+    提交后台任务,立即返回任务 ID
+    
+    kind 为 "scrape" 时抓取 auction_urls(或按 auction_criteria 搜索到的拍卖场次)中
+    匹配 lot_keywords 的拍品,结果可在执行过程中分页读取;kind 为 "export" 时执行
+    search_and_export_lots 导出到文件。参数相同的任务正在进行时返回已有任务。
+    
+    导出文件写入 EXPORT_DIR,output_file 只能是文件名;output_format 只能是 EXPORT_FORMATS 之一。
+    
+    示例:
+    ```json
+    {
+        "kind": "export",
+        "auction_criteria": {"categories": ["World Coins"]},
+        "lot_keywords": ["gold"],
+        "output_file": "world_gold.csv",
+        "output_format": "csv"
+    }
+    ```
+    """
+    params = request.model_dump(exclude_none=True, exclude={"kind"})
+    if request.kind == "scrape":
+        invalid = {"output_file", "output_format"} & params.keys()
+    else:
+        invalid = {"auction_urls"} & params.keys()
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"{request.kind} 任务不支持参数: {', '.join(sorted(invalid))}")
+    if "output_format" in params and params["output_format"] not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"output_format 只能是 {', '.join(EXPORT_FORMATS)}")
+    if request.kind == "export":
+        params["output_file"] = export_path(params.get("output_file", "auction_lots.json"))
+    
+    try:
+        job, created = jobs.submit(request.kind, params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    return {"job_id": job.id, "status": job.status, "deduplicated": not created}
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str, offset: int = Query(0, ge=0), limit: int = Query(100, ge=0, le=1000)):
+    """
+    查询任务状态、进度(已完成页面、找到的拍品、预计剩余时间)和已获得的结果
+    
+    结果按 offset / limit 分页,任务执行中即可读取;下次从 next_offset 继续读取新增的结果。
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"任务不存在: {job_id}")
+    
+    data = job.to_dict()
+    results = await run_blocking(jobs.results, job_id, offset, limit)
+    data["results"] = results
+    data["next_offset"] = offset + len(results)
+    return data
+
+
+@app.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """取消排队或执行中的任务"""
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=404, detail=f"任务不存在或已结束: {job_id}")
+    return {"job_id": job_id, "message": "任务正在取消"}
+
+
+@app.get("/api/sessions")
+async def session_stats():
+    """会话池状态"""
+    sessions.expire_idle()
+    return sessions.stats()
+
+
+@app.get("/api/metrics")
+async def metrics():
+    """
+    抓取和缓存指标
+    
+    fetch.pages / fetch.auctions: 页面请求和整场抓取的合并统计(coalesced 为共享了
+    进行中请求结果的次数);fetch.cache: 页面缓存命中统计;fetch.modes: 各抓取模式的
+    请求数、耗时和费用单位;auction_store: 按拍卖场次写入拍品库的抓取合并统计。
+    """
+    return {
+        "fetch": resources.lot_scraper.fetch_stats(),
+        "auction_store": resources.auction_flight.stats(),
+        "llm_cache": resources.llm_cache.stats() if resources.llm_cache else None
+    }
+
+
 def start_server(host: str = "0.0.0.0", port: int = 8000):
     """启动服务器"""
     logger.info(f"启动 API 服务器: http://{host}:{port}")
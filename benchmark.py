@@ -0,0 +1,440 @@
+"""
+性能基准 - 在本地测试数据上测量关键路径的耗时
+
+运行: python3 benchmark.py
+"""
+
+import json
+import logging
+import re
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from bs4 import BeautifulSoup
+
+from intent_parser import IntentParser
+from lot_feed import iter_lot_objects, iter_normalized_lots
+from lot_index import KeywordIndex
+from lot_parser import DEFAULT_PROFILE, ExtractionPlan
+from lot_records import Auction, Lot, LotTable
+from lot_scraper import LotScraper, HTML_PARSER
+from tool_results import ResultShaper, estimate_tokens
+
+# 基准测试只关心耗时,关闭解析过程中的日志
+logging.basicConfig(level=logging.WARNING)
+
+# 仿照站点列表页结构生成的合成页面(约 320 KB),不是保存的真实页面
+FIXTURE_PAGE = "test_lot_page.html"
+FIXTURE_LOTS = "test_lots.json"
+AGENT_LOG = "auction_agent.log"
+
+
+def _measure(func, repeat: int = 10) -> float:
+    """多次运行取中位数,返回毫秒"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _print_results(results, baseline_name: str):
+    baseline = results[baseline_name]
+    for name, ms in results.items():
+        print(f"  {name:<40} {ms:>9.2f} ms   x{baseline / ms:.1f}")
+
+
+def legacy_extract_lot(container):
+    """优化前的字段提取: 每个字段单独 find() 一次,正则在每个容器上重新编译"""
+    lot_data = {}
+    
+    lot_num = container.find(string=re.compile(r'\b\d{5,6}\b'))
+    if lot_num:
+        lot_data['lot_number'] = lot_num.strip()
+    
+    title_elem = container.find(['h1', 'h2', 'h3', 'h4', 'a'], class_=re.compile(r'title|name', re.I))
+    if title_elem:
+        lot_data['title'] = title_elem.get_text(strip=True)
+    
+    desc_elem = container.find(['p', 'div'], class_=re.compile(r'desc|detail', re.I))
+    if desc_elem:
+        lot_data['description'] = desc_elem.get_text(strip=True)
+    
+    price_elem = container.find(string=re.compile(r'\$\s*\d+'))
+    if price_elem:
+        price_match = re.search(r'\$\s*(\d+(?:,\d{3})*)', price_elem)
+        if price_match:
+            lot_data['current_bid'] = price_match.group(1).replace(',', '')
+    
+    img_elem = container.find('img')
+    if img_elem and img_elem.get('src'):
+        lot_data['image_url'] = img_elem['src']
+    
+    return lot_data if lot_data else None
+
+
+def legacy_parse_lots(soup):
+    """优化前的拍品列表提取"""
+    containers = soup.find_all(['div', 'article', 'li'], class_=re.compile(r'lot|item|product', re.I))
+    lots = []
+    for container in containers:
+        lot_data = legacy_extract_lot(container)
+        if lot_data and lot_data.get('lot_number'):
+            lots.append(lot_data)
+    return lots
+
+
+def _cards_from_lots(lots, copies: int) -> str:
+    """用 test_lots.json 中的拍品生成拍品卡片 HTML"""
+    cards = []
+    for i in range(copies):
+        for j, lot in enumerate(lots):
+            cards.append(
+                f'<div class="lot-card"><span class="lot-no">Lot {70000 + i * len(lots) + j}</span>'
+                f'<a class="lot-title" href="#">{lot.get("title", "")}</a>'
+                f'<p class="lot-description">{lot.get("description", "")}</p>'
+                f'<span class="estimate">Estimate: $1,000 - $2,000</span>'
+                f'<img src="{lot.get("image_url", "")}"></div>'
+            )
+    return f'<html><body>{"".join(cards)}</body></html>'
+
+
+def bench_extract_lots():
+    """拍品字段提取: 逐字段 find() vs 预编译提取计划单次遍历"""
+    print("\n" + "="*60)
+    print("基准: 拍品字段提取")
+    print("="*60)
+    
+    with open(FIXTURE_LOTS, encoding='utf-8') as f:
+        fixture_lots = json.load(f)
+    with open(FIXTURE_PAGE, encoding='utf-8') as f:
+        page_html = f.read()
+    
+    plan = ExtractionPlan(DEFAULT_PROFILE)
+    pages = {
+        f"{FIXTURE_LOTS} x100": _cards_from_lots(fixture_lots, 100),
+        FIXTURE_PAGE: page_html,
+    }
+    
+    for label, html in pages.items():
+        soup = BeautifulSoup(html, HTML_PARSER)
+        containers = plan.find_containers(soup)
+        
+        legacy = [legacy_extract_lot(c) for c in containers]
+        planned = [plan.extract(c) for c in containers]
+        assert legacy == planned, f"{label}: 提取结果不一致"
+        
+        print(f"\n{label}: {len(containers)} 个容器")
+        _print_results({
+            "逐字段 find() (优化前)": _measure(lambda: [legacy_extract_lot(c) for c in containers]),
+            "ExtractionPlan 单次遍历": _measure(lambda: [plan.extract(c) for c in containers]),
+        }, "逐字段 find() (优化前)")
+
+
+def legacy_filter_lots(lots, keywords):
+    """优化前的关键词过滤: 每次查询对每个拍品做小写转换和子串查找"""
+    keywords_lower = [keyword.lower() for keyword in keywords]
+    filtered = []
+    for lot in lots:
+        title = lot.get('title', '').lower()
+        description = lot.get('description', '').lower()
+        for keyword_lower in keywords_lower:
+            if keyword_lower in title or keyword_lower in description:
+                filtered.append(lot)
+                break
+    return filtered
+
+
+def bench_filter_lots(count: int = 10000):
+    """关键词过滤: 线性扫描 vs 倒排索引"""
+    print("\n" + "="*60)
+    print(f"基准: 关键词过滤 ({count} 个拍品)")
+    print("="*60)
+    
+    with open(FIXTURE_LOTS, encoding='utf-8') as f:
+        fixture_lots = json.load(f)
+    
+    metals = ["Gold", "Silver", "Bronze", "Copper", "Platinum"]
+    lots = []
+    for i in range(count):
+        lot = dict(fixture_lots[i % len(fixture_lots)])
+        lot['lot_number'] = str(70000 + i)
+        lot['title'] = f"{lot['title']} {metals[i % len(metals)]} #{i}"
+        lots.append(lot)
+    
+    queries = [["gold"], ["double eagle", "platinum"], ["dewey medal"]]
+    
+    start = time.perf_counter()
+    index = KeywordIndex(lots)
+    build_ms = (time.perf_counter() - start) * 1000
+    
+    for keywords in queries:
+        assert index.filter(keywords) == legacy_filter_lots(lots, keywords), f"{keywords}: 结果不一致"
+    
+    print(f"建立索引耗时 {build_ms:.1f} ms(每个拍品列表只需一次)")
+    for keywords in queries:
+        print(f"\n关键词 {keywords}: {len(index.filter(keywords))} 个拍品")
+        _print_results({
+            "线性扫描 (优化前)": _measure(lambda: legacy_filter_lots(lots, keywords)),
+            "倒排索引": _measure(lambda: index.filter(keywords)),
+        }, "线性扫描 (优化前)")
+
+
+def _measure_memory(build) -> float:
+    """build() 返回的对象占用的内存,单位 MB"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return (after - before) / 1024 / 1024
+
+
+def bench_lot_memory(count: int = 20000, auctions: int = 10):
+    """拍品内存占用: 附加拍卖场次字段的字典 vs __slots__ 记录 vs LotTable"""
+    print("\n" + "="*60)
+    print(f"基准: 拍品内存占用 ({count} 个拍品, {auctions} 个拍卖场次)")
+    print("="*60)
+    
+    def scraped_lots():
+        # 每个拍品的文本各不相同,与真实抓取结果一致
+        for i in range(count):
+            yield {
+                "lot_number": str(70000 + i),
+                "title": f"1907 Saint-Gaudens Double Eagle #{i}",
+                "description": f"MS-{60 + i % 10} (PCGS) lot {i}",
+                "current_bid": str(100 + i),
+                "image_url": f"https://images.example.com/lots/{i}.jpg",
+            }
+    
+    auction_infos = [{"url": f"https://auctions.example.com/auctions/{a}",
+                      "title": f"December 2025 Showcase Auction - Session {a}",
+                      "date": "2025-12-15"} for a in range(auctions)]
+    
+    def build_dicts():
+        # 优化前 search_and_export_lots 的做法: 每个拍品字典再加三个拍卖场次字段
+        lots = []
+        for i, lot in enumerate(scraped_lots()):
+            info = auction_infos[i % auctions]
+            lot['auction_title'] = info['title']
+            lot['auction_date'] = info['date']
+            lot['auction_url'] = info['url']
+            lots.append(lot)
+        return lots
+    
+    def build_records():
+        records = [Auction.from_dict(info) for info in auction_infos]
+        return [Lot.from_dict(lot, records[i % auctions]) for i, lot in enumerate(scraped_lots())]
+    
+    def build_table():
+        records = [Auction.from_dict(info) for info in auction_infos]
+        table = LotTable()
+        for i, lot in enumerate(scraped_lots()):
+            table.append(lot, records[i % auctions])
+        return table
+    
+    results = {
+        "dict + auction_* 字段 (优化前)": _measure_memory(build_dicts),
+        "Lot 记录 (__slots__)": _measure_memory(build_records),
+        "LotTable (按列保存)": _measure_memory(build_table),
+    }
+    
+    baseline = results["dict + auction_* 字段 (优化前)"]
+    for name, mb in results.items():
+        print(f"  {name:<40} {mb:>9.2f} MB   x{baseline / mb:.1f}")
+
+
+def bench_tool_results(sizes=(10, 100, 500)):
+    """工具结果发送给 LLM 的估算 token 数: 缩进 JSON 全量发送 vs 摘要和句柄"""
+    print("\n" + "="*60)
+    print("基准: 工具结果 token 数 (get_lots_from_auction)")
+    print("="*60)
+    
+    with open(FIXTURE_LOTS, 'r', encoding='utf-8') as f:
+        fixture = json.load(f)
+    
+    shaper = ResultShaper()
+    for size in sizes:
+        lots = [dict(fixture[i % len(fixture)], lot_number=str(70000 + i)) for i in range(size)]
+        raw = estimate_tokens(json.dumps(lots, ensure_ascii=False, indent=2))
+        sent = estimate_tokens(shaper.shape("get_lots_from_auction", lots))
+        print(f"  {size:>4} 个拍品: {raw:>8} -> {sent:>6} tokens   节省 {1 - sent / raw:.0%}")
+
+
+def _logged_tool_latencies(path: str = AGENT_LOG):
+    """从 Agent 日志中统计收到指令到模型决定调用第一个工具的耗时(秒)"""
+    pattern = re.compile(r'^(\S+ \S+) - \S+ - INFO - (处理用户指令|调用工具)')
+    latencies = []
+    started = None
+    try:
+        with open(path, 'r', encoding='gbk', errors='ignore') as f:
+            for line in f:
+                match = pattern.match(line)
+                if not match:
+                    continue
+                timestamp = datetime.strptime(match.group(1), '%Y-%m-%d %H:%M:%S,%f')
+                if match.group(2) == '处理用户指令':
+                    started = timestamp
+                elif started is not None:
+                    latencies.append((timestamp - started).total_seconds())
+                    started = None
+    except FileNotFoundError:
+        pass
+    return latencies
+
+
+def bench_intent_parser(repeat: int = 200):
+    """规则意图解析的耗时,与日志中模型选择工具的耗时对比"""
+    print("\n" + "="*60)
+    print("基准: 意图解析 vs 模型选择工具")
+    print("="*60)
+    
+    from test_intent_parser import COMMAND_QUERIES, VARIANT_QUERIES
+    
+    parser = IntentParser()
+    queries = [query for query, _ in COMMAND_QUERIES + VARIANT_QUERIES]
+    ms = _measure(lambda: [parser.parse(query) for query in queries], repeat=repeat) / len(queries)
+    handled = sum(parser.parse(query).confidence >= 0.8 for query in queries)
+    print(f"  规则解析: 每条 {ms * 1000:.1f} µs, {handled}/{len(queries)} 条不需要请求模型")
+    
+    latencies = _logged_tool_latencies()
+    if latencies:
+        print(f"  日志中模型选择工具: 中位数 {statistics.median(latencies) * 1000:.0f} ms "
+              f"({len(latencies)} 条指令)")
+
+
+def bench_parse_page():
+    """拍品列表页面解析: 完整 html.parser 解析两次 vs 按需解析一次"""
+    print("\n" + "="*60)
+    print(f"基准: 拍品列表页面解析 ({FIXTURE_PAGE})")
+    print("="*60)
+    
+    with open(FIXTURE_PAGE, encoding='utf-8') as f:
+        html = f.read()
+    
+    scraper = LotScraper(parser='html.parser')
+    
+    def full_parse_twice():
+        # 优化前的流程: 解析拍品一次,检测分页再完整解析一次
+        lots = legacy_parse_lots(BeautifulSoup(html, 'html.parser'))
+        total_pages = scraper._get_total_pages(BeautifulSoup(html, 'html.parser'))
+        return lots, total_pages
+    
+    expected = full_parse_twice()
+    
+    variants = {"html.parser 完整解析 x2 (优化前)": full_parse_twice}
+    parsers = ['html.parser'] + (['lxml'] if HTML_PARSER == 'lxml' else [])
+    for parser in parsers:
+        variant_scraper = LotScraper(parser=parser)
+        assert variant_scraper.parse_page(html) == expected, f"{parser} 解析结果不一致"
+        variants[f"{parser} + SoupStrainer 单次解析"] = lambda s=variant_scraper: s.parse_page(html)
+    
+    print(f"页面大小 {len(html) / 1024:.0f} KB, {len(expected[0])} 个拍品, {expected[1]} 页")
+    if HTML_PARSER != 'lxml':
+        print("未安装 lxml,跳过 lxml 后端")
+    
+    # 只计构建解析树的时间,不含拍品字段提取
+    trees = {"html.parser 完整解析 x2 (优化前)":
+             lambda: (BeautifulSoup(html, 'html.parser'), BeautifulSoup(html, 'html.parser'))}
+    for parser in parsers:
+        trees[f"{parser} + SoupStrainer 单次解析"] = \
+            lambda p=parser: BeautifulSoup(html, p, parse_only=DEFAULT_PROFILE.strainer)
+    
+    print("\n构建解析树:")
+    _print_results({name: _measure(func) for name, func in trees.items()},
+                   "html.parser 完整解析 x2 (优化前)")
+    
+    print("\n解析页面 (解析树 + 拍品提取 + 分页检测):")
+    _print_results({name: _measure(func) for name, func in variants.items()},
+                   "html.parser 完整解析 x2 (优化前)")
+
+
+def legacy_find_lots_in_json(data, depth=0, max_depth=5):
+    """优化前的 JSON 拍品查找: 递归,每层都 extend 子结果"""
+    lots = []
+    
+    if depth > max_depth:
+        return lots
+    
+    if isinstance(data, dict):
+        if 'lot_number' in data or 'lotNumber' in data or 'lot' in data:
+            lots.append(data)
+        else:
+            for value in data.values():
+                lots.extend(legacy_find_lots_in_json(value, depth + 1, max_depth))
+    
+    elif isinstance(data, list):
+        for item in data:
+            lots.extend(legacy_find_lots_in_json(item, depth + 1, max_depth))
+    
+    return lots
+
+
+def _measure_peak(func) -> float:
+    """func() 运行期间的内存峰值,单位 KB"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def bench_json_lots(count: int = 20000):
+    """内嵌 JSON 拍品查找: 递归 vs 迭代遍历"""
+    print("\n" + "="*60)
+    print(f"基准: 内嵌 JSON 拍品查找 ({count} 个拍品)")
+    print("="*60)
+    
+    lots = [{"lotNumber": str(70000 + i), "title": f"Lot {i}", "currentBid": {"amount": 100 + i},
+             "images": [{"url": f"https://img.example.com/{i}.jpg", "sizes": [100, 400, 800]}],
+             "bids": [{"amount": 50 + j, "time": "2025-12-01T10:00:00Z"} for j in range(3)]}
+            for i in range(count)]
+    # 拍品按分区嵌套,分区之外还有与拍品无关的大量数据
+    state = {"state": {"auction": {"sections": [{"lots": lots[i:i + 500]} for i in range(0, count, 500)]},
+                       "analytics": {"events": [{"id": i, "tags": ["a", "b"]} for i in range(count)]}}}
+    print(f"JSON 大小 {len(json.dumps(state)) / 1024 / 1024:.1f} MB")
+    
+    def legacy():
+        return list(iter_normalized_lots(legacy_find_lots_in_json(state)))
+    
+    def walk():
+        return list(iter_normalized_lots((lot for _, lot in iter_lot_objects(state))))
+    
+    print(f"  递归查找(max_depth=5)找到 {len(legacy())} 个拍品,迭代遍历找到 {len(walk())} 个")
+    
+    # 递归版本找不到第 6 层的拍品,比较耗时时把拍品放在它能找到的深度
+    shallow = {"auction": {"lots": lots}, "analytics": state["state"]["analytics"]}
+    
+    def legacy_shallow():
+        return list(iter_normalized_lots(legacy_find_lots_in_json(shallow)))
+    
+    def walk_shallow():
+        return list(iter_normalized_lots((lot for _, lot in iter_lot_objects(shallow))))
+    
+    variants = {
+        "递归查找 + 规范化": legacy_shallow,
+        "迭代遍历 + 规范化": walk_shallow,
+    }
+    results = {name: _measure(func, repeat=5) for name, func in variants.items()}
+    _print_results(results, "递归查找 + 规范化")
+    for name, func in variants.items():
+        print(f"  {name:<40} 峰值内存 {_measure_peak(func):>9.0f} KB")
+
+
+def main():
+    """运行所有基准"""
+    bench_parse_page()
+    bench_extract_lots()
+    bench_filter_lots()
+    bench_lot_memory()
+    bench_tool_results()
+    bench_intent_parser()
+    bench_json_lots()
+
+
+if __name__ == "__main__":
+    main()
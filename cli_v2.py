@@ -44,6 +44,27 @@ def print_banner():
     print(banner)
 
 
+def print_stream(events):
+    """逐段打印 Agent 的流式输出,工具调用单独一行显示"""
+    need_prefix = True
+    for event in events:
+        if event["type"] == "token":
+            if need_prefix:
+                print("Agent: ", end="")
+                need_prefix = False
+            print(event["content"], end="", flush=True)
+        elif event["type"] == "tool_call":
+            if not need_prefix:
+                print()
+                need_prefix = True
+            print(f"  [调用工具 {event['name']}]", flush=True)
+        elif event["type"] == "tool_result":
+            print(f"  [{event['name']} 完成]", flush=True)
+        elif event["type"] == "error":
+            print(f"\n抱歉,处理您的请求时出现错误: {event['message']}", end="")
+    print("\n")
+
+
 def main():
     """主函数"""
     print_banner()
@@ -74,10 +95,9 @@ def main():
             if not user_input:
                 continue
             
-            # 处理用户指令
-            print("\nAgent: 正在处理您的请求...\n")
-            response = agent.process_command(user_input)
-            print(f"Agent: {response}\n")
+            # 处理用户指令,模型输出边生成边打印
+            print()
+            print_stream(agent.stream_command(user_input))
             
         except KeyboardInterrupt:
             print("\n\n检测到中断信号,正在退出...")
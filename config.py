@@ -16,9 +16,90 @@ DEEPSEEK_MODEL = "deepseek-chat"
 # 拍卖网站配置
 AUCTION_SITE_URL = "https://auctions.stacksbowers.com"
 
+# HTTP 请求配置
+HTTP_TIMEOUT = 60  # 默认请求超时(秒)
+HTTP_MAX_CONNECTIONS = 16  # 连接池大小
+HTTP_PER_HOST_LIMIT = 4  # 每个主机的默认并发上限
+HTTP_HOST_LIMITS = {"api.zyte.com": 8}  # 按主机覆盖并发上限
+HTTP_MAX_RETRIES = 3  # 暂时性错误的最大重试次数
+HTTP_BACKOFF_BASE = 1.0  # 指数退避初始等待(秒)
+HTTP_BACKOFF_MAX = 30.0  # 单次退避等待上限(秒)
+
+# 拍品抓取配置
+LOT_FETCH_WORKERS = 4  # 并发抓取分页的线程数,1 表示逐页抓取
+LOT_FETCH_RATE = 1.0  # 令牌桶速率,每秒允许的请求数
+LOT_FETCH_BURST = 2  # 令牌桶容量,允许的突发请求数
+AUCTION_WORKERS = 3  # search_and_export_lots 同时抓取的拍卖场次数
+# 依次尝试的抓取模式,页面是验证页或没有拍品时升级到下一个模式,每个 URL 模式记住成功的模式
+LOT_FETCH_MODES = ["http", "zyte-http", "zyte-browser"]
+FETCH_MODE_COSTS = {"http": 0, "zyte-http": 1, "zyte-browser": 10}  # 每种模式单次请求的相对费用
+FETCH_MODE_PROBE_INTERVAL = 50  # 学到较贵的模式后,每隔多少次请求重新从最便宜的模式尝试一次,0 表示不重试
+
 # 缓存配置
 CACHE_DIR = os.path.join(os.path.dirname(__file__), "cache")
 CACHE_EXPIRY_HOURS = 24
+LOT_PAGE_CACHE_SECONDS = 300  # 拍品列表页含实时出价,缓存时间远短于其他页面
+CACHE_MAX_SIZE_MB = 500  # 页面缓存总大小上限,超出后按最近最少使用淘汰
+CACHE_ENABLED = True
+
+# 拍品库配置(SQLite,抓取过的拍品可直接从库中查询)
+LOT_STORE_PATH = os.path.join(os.path.dirname(__file__), "lots.db")
+LOT_STORE_ENABLED = True
+LOT_STORE_MAX_AGE_HOURS = 6  # 拍卖场次抓取后多长时间内直接从库中回答,出价会变化,不宜过长
+LOT_STORE_WAIT_TIMEOUT = 150  # 等待其他会话抓取同一拍卖场次的最长时间(秒),应小于 TOOL_CALL_TIMEOUT
+
+# 拍品快照配置(增量刷新时与上次抓取结果比较)
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), "snapshots")
+
+# 后台任务配置(耗时的抓取和导出在后台执行,按任务 ID 查询进度)
+JOB_DIR = os.path.join(os.path.dirname(__file__), "jobs")  # 任务状态和结果的保存目录
+JOB_WORKERS = 2  # 同时执行的任务数
+JOB_MAX_PENDING = 20  # 排队和执行中的任务数上限
+JOB_PERSIST_INTERVAL = 2.0  # 执行中的任务进度最多每隔多少秒写入一次
+
+# 导出配置(通过 API 提交的导出任务只写入 EXPORT_DIR)
+EXPORT_DIR = os.path.join(os.path.dirname(__file__), "exports")
+EXPORT_FORMATS = ("json", "jsonl", "csv", "txt")
+
+# 工具结果配置(发送给 LLM 的工具结果只包含摘要,完整数据按句柄保留在服务端)
+TOOL_RESULT_MAX_CHARS = 6000  # 单个工具结果发送给 LLM 的字符上限
+TOOL_RESULT_TOP_K = 10  # 列表结果中直接发送的行数
+TOOL_RESULT_DESCRIPTION_CHARS = 120  # 发送给 LLM 的拍品描述截断长度
+TOOL_RESULT_HANDLES = 50  # 保留的结果句柄数,超出后按最近最少使用淘汰
+
+# 工具调用配置(同一次回复中的多个工具调用并发执行)
+AGENT_MAX_STEPS = 6  # 一条指令最多请求模型的次数,模型可以连续调用工具
+TOOL_CALL_WORKERS = 4  # 同时执行的工具调用数
+TOOL_CALL_TIMEOUT = 180  # 单个工具调用的默认超时(秒),超时后取消并返回错误结果
+TOOL_CALL_TIMEOUTS = {  # 按工具覆盖超时
+    "search_stored_lots": 30,
+    "analyze_lots": 300,
+    "search_and_export_lots": 900,
+}
+ANALYZE_MAX_BINS = 100  # analyze_lots 直方图区间数上限
+
+# LLM 缓存配置(相同请求直接使用缓存的回复,重复的问题直接执行缓存的工具调用计划)
+LLM_CACHE_ENABLED = True
+LLM_CACHE_MAX_ENTRIES = 256  # 每级缓存的最大条目数
+LLM_CACHE_TTL_SECONDS = 3600  # 模型回复的缓存时间
+PLAN_CACHE_TTL_SECONDS = 86400  # 意图计划的缓存时间,工具每次重新执行,数据不会过时
+
+# 意图解析配置(简单的拍卖搜索指令用规则解析,不请求模型)
+INTENT_FAST_PATH_ENABLED = True
+INTENT_MIN_CONFIDENCE = 0.8  # 低于该置信度的指令交给 LLM 处理
+
+# 对话历史配置(超出预算时先省略较早的工具结果,再把最早的轮次折叠为摘要)
+HISTORY_MAX_TOKENS = 16000  # 每次请求的 prompt 估算 token 上限(含系统提示和工具定义)
+HISTORY_KEEP_TURNS = 3  # 始终原样保留的最近轮数
+HISTORY_SUMMARY_MAX_CHARS = 2000  # 较早对话摘要的字符上限
+
+# Web API 配置(阻塞操作在有界线程池中执行,不阻塞事件循环)
+API_WORKERS = 8  # 执行阻塞操作的线程数
+API_REQUEST_TIMEOUT = 300  # 单个请求的超时(秒),超时返回 504
+API_MAX_SESSIONS = 200  # 同时保留的会话数,超出时淘汰最久未使用的会话
+API_SESSION_IDLE_TTL = 1800  # 会话空闲超过该时间(秒)后淘汰
+API_TOOL_WORKERS = 16  # 所有会话共用的工具线程数
+API_SESSION_RESULT_HANDLES = 10  # 每个会话按句柄保留的完整工具结果数
 
 # 日志配置
 LOG_LEVEL = "INFO"
@@ -0,0 +1,49 @@
+"""
+测试共用的模型客户端替身
+
+测试脚本直接导入这里的函数;用 pytest 运行时也可以通过 fake_llm_client fixture 获取 fake_client。
+"""
+
+from types import SimpleNamespace
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+
+def fake_client(create):
+    """用 create 代替 client.chat.completions.create,同步和异步客户端都可使用"""
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def chat_response(content=None, tool_calls=None, usage=None):
+    """非流式请求的模型回复"""
+    message = SimpleNamespace(tool_calls=tool_calls, content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def fake_tool_call(call_id: str, name: str, arguments: str = "{}"):
+    """模型回复中的工具调用"""
+    return SimpleNamespace(
+        id=call_id, function=SimpleNamespace(name=name, arguments=arguments),
+        model_dump=lambda: {"id": call_id, "type": "function",
+                            "function": {"name": name, "arguments": arguments}})
+
+
+def stream_chunk(content=None, tool_calls=None, usage=None):
+    """流式请求的一个分片,传入 usage 时为最后的用量分片"""
+    choices = [] if usage else [SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def call_fragment(index, call_id=None, name=None, arguments=None):
+    """流式分片中的工具调用片段"""
+    return SimpleNamespace(index=index, id=call_id,
+                           function=SimpleNamespace(name=name, arguments=arguments))
+
+
+if pytest:
+    @pytest.fixture
+    def fake_llm_client():
+        return fake_client
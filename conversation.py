@@ -0,0 +1,189 @@
+"""
+对话历史模块 - 按 token 预算管理发送给 LLM 的对话历史
+
+超出预算时先把较早轮次的工具结果替换为简短占位(保留结果句柄),仍超出时把最早的
+轮次折叠进滚动摘要。最近 keep_turns 轮始终原样保留,每轮的 prompt token 数会被记录。
+"""
+
+import re
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+from config import HISTORY_MAX_TOKENS, HISTORY_KEEP_TURNS, HISTORY_SUMMARY_MAX_CHARS
+from tool_results import compact_json, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+EVICTED_PREFIX = "[较早的工具结果已省略"
+HANDLE_PATTERN = re.compile(r'"handle":\s*"(res_\d+)"')
+
+
+def message_tokens(message: Dict) -> int:
+    """估算一条消息的 token 数"""
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "")
+    if message.get("tool_calls"):
+        tokens += estimate_tokens(compact_json(message["tool_calls"]))
+    return tokens
+
+
+def _clip(text: Optional[str], limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class ConversationHistory:
+    """
+    有 token 预算的对话历史
+    
+    一轮从一条用户消息开始,包括之后的工具调用、工具结果和助手回复。
+    折叠按整轮进行,工具调用和对应的工具结果不会被拆开。
+    """
+    
+    def __init__(self, max_tokens: int = HISTORY_MAX_TOKENS,
+                 keep_turns: int = HISTORY_KEEP_TURNS,
+                 summary_max_chars: int = HISTORY_SUMMARY_MAX_CHARS):
+        """
+        Args:
+            max_tokens: 发送给 LLM 的 prompt(系统提示、摘要和历史)估算 token 上限
+            keep_turns: 始终原样保留的最近轮数
+            summary_max_chars: 滚动摘要的字符上限,超出时丢弃最早的摘要行
+        """
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.summary_max_chars = summary_max_chars
+        self.messages: List[Dict] = []
+        self.summary_lines: List[str] = []
+        self.turn = 0
+        self.summarized_turns = 0
+        self.evicted_results = 0
+        self.turn_stats = deque(maxlen=100)
+    
+    def __len__(self) -> int:
+        return len(self.messages)
+    
+    @property
+    def summary(self) -> str:
+        return "\n".join(self.summary_lines)
+    
+    def add_user(self, content: str):
+        """开始新的一轮"""
+        self.turn += 1
+        self.messages.append({"role": "user", "content": content})
+    
+    def append(self, message: Dict):
+        self.messages.append(message)
+    
+    def close_pending_calls(self, content: str):
+        """给最后一批还没有结果的工具调用补上结果,中断的一轮之后仍能继续对话"""
+        for i in range(len(self.messages) - 1, -1, -1):
+            if self.messages[i].get("tool_calls"):
+                answered = {m.get("tool_call_id") for m in self.messages[i + 1:]}
+                for call in self.messages[i]["tool_calls"]:
+                    if call["id"] not in answered:
+                        self.messages.append({"role": "tool", "tool_call_id": call["id"], "content": content})
+                return
+    
+    def clear(self):
+        self.messages = []
+        self.summary_lines = []
+        self.turn = 0
+        self.summarized_turns = 0
+        self.evicted_results = 0
+        self.turn_stats.clear()
+    
+    def build(self, system_message: Dict, reserved_tokens: int = 0) -> List[Dict]:
+        """
+        生成发送给 LLM 的消息列表,必要时先按预算压缩历史
+        
+        Args:
+            system_message: 系统提示
+            reserved_tokens: 不在消息中但计入预算的 token 数,如工具定义
+        """
+        budget = self.max_tokens - reserved_tokens - message_tokens(system_message)
+        self._fit(budget)
+        
+        messages = [system_message]
+        if self.summary_lines:
+            messages.append({"role": "system", "content": f"较早对话的摘要:\n{self.summary}"})
+        return messages + self.messages
+    
+    def record_usage(self, estimated_tokens: int, prompt_tokens: Optional[int] = None):
+        """
+        记录一次 LLM 调用的 prompt token 数
+        
+        Args:
+            estimated_tokens: 发送前估算的 token 数
+            prompt_tokens: API 返回的实际 prompt token 数
+        """
+        stats = {
+            "turn": self.turn,
+            "estimated_tokens": estimated_tokens,
+            "prompt_tokens": prompt_tokens,
+            "history_messages": len(self.messages),
+            "summarized_turns": self.summarized_turns
+        }
+        self.turn_stats.append(stats)
+        logger.info(f"第 {self.turn} 轮 prompt: 估算 {estimated_tokens} tokens, 实际 {prompt_tokens}, "
+                    f"历史 {len(self.messages)} 条消息, 已摘要 {self.summarized_turns} 轮")
+    
+    def _total_tokens(self) -> int:
+        tokens = sum(message_tokens(m) for m in self.messages)
+        if self.summary_lines:
+            tokens += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(self.summary)
+        return tokens
+    
+    def _turn_starts(self) -> List[int]:
+        return [i for i, m in enumerate(self.messages) if m.get("role") == "user"]
+    
+    def _fit(self, budget: int):
+        total = self._total_tokens()
+        if total <= budget:
+            return
+        
+        # 1. 较早轮次的工具结果替换为占位,保留句柄以便之后翻页或导出
+        starts = self._turn_starts()
+        protected = starts[-self.keep_turns] if len(starts) >= self.keep_turns else 0
+        for message in self.messages[:protected]:
+            if total <= budget:
+                return
+            content = message.get("content") or ""
+            if message.get("role") != "tool" or content.startswith(EVICTED_PREFIX):
+                continue
+            handles = HANDLE_PATTERN.findall(content)
+            message["content"] = (f"{EVICTED_PREFIX},句柄: {', '.join(handles)}]" if handles
+                                  else f"{EVICTED_PREFIX}]")
+            total += estimate_tokens(message["content"]) - estimate_tokens(content)
+            self.evicted_results += 1
+        
+        # 2. 最早的轮次折叠进摘要,至少保留当前一轮
+        while total > budget:
+            starts = self._turn_starts()
+            if len(starts) < 2:
+                logger.warning(f"当前一轮已超过历史预算: {total} > {budget} tokens")
+                return
+            end = starts[1]
+            self._summarize_turn(self.messages[:end])
+            del self.messages[:end]
+            total = self._total_tokens()
+    
+    def _summarize_turn(self, messages: List[Dict]):
+        """把一轮对话压缩为一行摘要: 用户问题、调用的工具和助手回复"""
+        question = next((m.get("content") for m in messages if m.get("role") == "user"), "")
+        tools = [call["function"]["name"] for m in messages for call in m.get("tool_calls") or []]
+        answer = next((m.get("content") for m in reversed(messages)
+                       if m.get("role") == "assistant" and m.get("content")), "")
+        
+        line = f"- 用户: {_clip(question, 150)}"
+        if tools:
+            line += f" | 工具: {', '.join(tools)}"
+        if answer:
+            line += f" | 回复: {_clip(answer, 300)}"
+        
+        self.summary_lines.append(line)
+        self.summarized_turns += 1
+        while len(self.summary_lines) > 1 and len(self.summary) > self.summary_max_chars:
+            self.summary_lines.pop(0)
@@ -2,30 +2,30 @@
 增强版数据获取模块 - 直接从网站获取实时数据
 """
 
-import requests
 from bs4 import BeautifulSoup
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 import re
 import logging
 
+from http_client import HttpClient, get_http_client
+
 logger = logging.getLogger(__name__)
 
 
 class LiveAuctionFetcher:
     """实时拍卖数据获取器"""
     
-    def __init__(self):
+    def __init__(self, http: Optional[HttpClient] = None):
         self.base_url = "https://auctions.stacksbowers.com"
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        })
+        # 共享 HTTP 客户端,默认 User-Agent 已在客户端会话中设置
+        self.http = http or get_http_client()
+        self.session = self.http.session
     
     def fetch_auctions(self) -> List[Dict]:
         """获取拍卖列表"""
         try:
-            response = self.session.get(self.base_url, timeout=30)
+            response = self.http.get(self.base_url, timeout=30)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.text, 'html.parser')
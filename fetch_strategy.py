@@ -0,0 +1,174 @@
+"""
+抓取模式选择模块 - 先用便宜的模式抓取,必要时才使用浏览器渲染
+
+抓取模式从便宜到昂贵依次为:
+    http: 直接 HTTP 请求,不消耗 Zyte 调用
+    zyte-http: Zyte API 返回原始响应(httpResponseBody),可绕过部分封锁,不执行 JavaScript
+    zyte-browser: Zyte API 浏览器渲染(browserHtml),最慢也最贵
+
+请求失败、页面是 Cloudflare 验证页或解析不到拍品时升级到下一个模式。每个主机/路径模式记住
+最便宜的成功模式,之后的请求直接从该模式开始;学到较贵的模式后每隔 FETCH_MODE_PROBE_INTERVAL
+次请求重新从最便宜的模式尝试一次,站点不再需要浏览器渲染时能降回便宜的模式。
+每个模式的请求数、耗时和费用单位都有统计。
+"""
+
+import re
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+from config import LOT_FETCH_MODES, FETCH_MODE_COSTS, FETCH_MODE_PROBE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+FETCH_MODES = ("http", "zyte-http", "zyte-browser")
+
+# Cloudflare 验证页和封锁页的特征
+CHALLENGE_MARKERS = (
+    "cf-browser-verification",
+    "cf_chl_",
+    "challenge-platform",
+    "<title>Just a moment...</title>",
+    "Attention Required! | Cloudflare",
+    "cf-error-details",
+)
+
+# 路径中含数字的段(拍卖场次 ID 等)视为同一模式
+NUMBERED_SEGMENT = re.compile(r'\d')
+
+
+def is_challenge_page(html: Optional[str]) -> bool:
+    """页面是否是 Cloudflare 验证页或封锁页"""
+    if not html:
+        return False
+    # 验证页很小,标记都在页面开头附近
+    head = html[:20000]
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+def url_pattern(url: str) -> str:
+    """
+    URL 对应的主机/路径模式,忽略查询参数
+    
+    例如 https://example.com/auctions/12345?page=2 -> example.com/auctions/*
+    """
+    parts = urlsplit(url)
+    segments = ['*' if NUMBERED_SEGMENT.search(s) else s for s in parts.path.split('/') if s]
+    return '/'.join([(parts.hostname or '').lower()] + segments)
+
+
+class FetchStrategy:
+    """
+    按 URL 模式选择抓取模式并记录各模式的统计,线程安全
+    
+    统计信息(每个模式):
+        requests: 请求次数
+        accepted: 页面被接受的次数
+        escalated: 页面是验证页或没有拍品、升级到下一个模式的次数
+        errors: 请求失败的次数
+        avg_latency_ms: 平均耗时
+        cost_units: 累计费用单位(按 FETCH_MODE_COSTS)
+    
+    另外统计 probes: 已学到较贵模式的 URL 模式重新从最便宜的模式尝试的次数。
+    """
+    
+    def __init__(self, modes: Optional[Sequence[str]] = None,
+                 costs: Optional[Dict[str, float]] = None,
+                 probe_interval: Optional[int] = None):
+        """
+        Args:
+            modes: 依次尝试的抓取模式,默认 LOT_FETCH_MODES
+            costs: 每个模式单次请求的费用单位,默认 FETCH_MODE_COSTS
+            probe_interval: 重新尝试最便宜模式的间隔(请求数),默认 FETCH_MODE_PROBE_INTERVAL
+        """
+        self.modes = list(modes or LOT_FETCH_MODES)
+        unknown = set(self.modes) - set(FETCH_MODES)
+        if unknown or not self.modes:
+            raise ValueError(f"未知的抓取模式: {', '.join(sorted(unknown))}")
+        self.costs = dict(FETCH_MODE_COSTS if costs is None else costs)
+        # URL 模式 -> 成功的最便宜模式在 self.modes 中的位置
+        self._learned: Dict[str, int] = {}
+        # URL 模式 -> 学到较贵模式后的请求次数
+        self._uses: Dict[str, int] = {}
+        self.probe_interval = FETCH_MODE_PROBE_INTERVAL if probe_interval is None else probe_interval
+        self._probes = 0
+        self._stats = {mode: {"requests": 0, "accepted": 0, "escalated": 0, "errors": 0, "latency": 0.0}
+                       for mode in self.modes}
+        self._lock = threading.Lock()
+    
+    def modes_for(self, url: str) -> List[str]:
+        """
+        url 依次尝试的抓取模式: 从所属 URL 模式上次成功的抓取模式开始
+        
+        学到较贵的模式后,每隔 probe_interval 次请求从最便宜的模式开始一次。
+        """
+        pattern = url_pattern(url)
+        with self._lock:
+            start = self._learned.get(pattern, 0)
+            probe = False
+            if start and self.probe_interval:
+                uses = self._uses.get(pattern, 0) + 1
+                self._uses[pattern] = uses
+                if uses % self.probe_interval == 0:
+                    self._probes += 1
+                    probe = True
+        if probe:
+            logger.info(f"抓取模式: {pattern} 重新尝试 {self.modes[0]}")
+            return list(self.modes)
+        return self.modes[start:]
+    
+    def learned_mode(self, url: str) -> Optional[str]:
+        """url 所属模式已学到的抓取模式,没有时返回 None"""
+        with self._lock:
+            index = self._learned.get(url_pattern(url))
+        return None if index is None else self.modes[index]
+    
+    def is_last(self, mode: str) -> bool:
+        return mode == self.modes[-1]
+    
+    def record(self, mode: str, latency: float, outcome: str):
+        """
+        记录一次请求
+        
+        Args:
+            mode: 抓取模式
+            latency: 耗时(秒)
+            outcome: "accepted"、"escalated" 或 "errors"
+        """
+        with self._lock:
+            stats = self._stats[mode]
+            stats["requests"] += 1
+            stats[outcome] += 1
+            stats["latency"] += latency
+    
+    def learn(self, url: str, mode: str):
+        """记录 url 所属模式成功的抓取模式"""
+        pattern = url_pattern(url)
+        index = self.modes.index(mode)
+        with self._lock:
+            previous = self._learned.get(pattern)
+            self._learned[pattern] = index
+            if previous != index:
+                self._uses.pop(pattern, None)
+        if previous != index:
+            logger.info(f"抓取模式: {pattern} 使用 {mode}")
+    
+    def stats(self) -> Dict:
+        """返回各模式的统计和已学到的 URL 模式"""
+        with self._lock:
+            modes = {mode: dict(stats) for mode, stats in self._stats.items()}
+            learned = {pattern: self.modes[index] for pattern, index in self._learned.items()}
+            probes = self._probes
+        
+        for mode, stats in modes.items():
+            latency = stats.pop("latency")
+            stats["avg_latency_ms"] = round(latency / stats["requests"] * 1000, 1) if stats["requests"] else 0.0
+            stats["cost_units"] = stats["requests"] * self.costs.get(mode, 0)
+        
+        return {
+            "modes": modes,
+            "cost_units": sum(stats["cost_units"] for stats in modes.values()),
+            "probes": probes,
+            "patterns": learned
+        }
@@ -0,0 +1,238 @@
+"""
+HTTP 请求模块 - scraper、lot_scraper 和 data_fetcher 共享的请求层
+
+请求在后台事件循环中调度: 每个主机有独立的并发上限,失败时按指数退避加随机抖动重试。
+实际的网络 I/O 由连接池化的 requests.Session 在线程池中完成,保持长连接复用。
+同时提供异步接口 (arequest / azyte_extract) 和同步接口 (request / get / post / zyte_extract)。
+"""
+
+import asyncio
+import base64
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    ZYTE_API_KEY, HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_PER_HOST_LIMIT,
+    HTTP_HOST_LIMITS, HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+ZYTE_API_URL = "https://api.zyte.com/v1/extract"
+
+DEFAULT_USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+# 这些状态码通常是暂时性的,值得重试
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504, 520, 521)
+
+
+class FetchError(RuntimeError):
+    """请求最终失败,status_code 为 None 表示网络层错误"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class HttpClient:
+    """共享的 HTTP 客户端,线程安全,可同时被同步和异步代码使用"""
+    
+    def __init__(self,
+                 timeout: float = HTTP_TIMEOUT,
+                 max_connections: int = HTTP_MAX_CONNECTIONS,
+                 per_host_limit: int = HTTP_PER_HOST_LIMIT,
+                 host_limits: Optional[Dict[str, int]] = None,
+                 max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_base: float = HTTP_BACKOFF_BASE,
+                 backoff_max: float = HTTP_BACKOFF_MAX):
+        """
+        Args:
+            timeout: 默认请求超时(秒)
+            max_connections: 连接池大小,也是执行网络 I/O 的线程数
+            per_host_limit: 每个主机的默认并发上限
+            host_limits: 按主机覆盖并发上限,如 {"api.zyte.com": 8}
+            max_retries: 最大重试次数
+            backoff_base: 指数退避的初始等待时间(秒)
+            backoff_max: 单次退避等待的上限(秒)
+        """
+        self.timeout = timeout
+        self.per_host_limit = max(1, per_host_limit)
+        self.host_limits = dict(HTTP_HOST_LIMITS if host_limits is None else host_limits)
+        self.max_retries = max(0, max_retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        
+        # 连接池化的会话,所有请求复用长连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": DEFAULT_USER_AGENT})
+        
+        # Zyte API 的认证头只需编码一次
+        auth_base64 = base64.b64encode(f"{ZYTE_API_KEY}:".encode('ascii')).decode('ascii')
+        self.zyte_headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Basic {auth_base64}"
+        }
+        
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_connections),
+                                            thread_name_prefix="http-io")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """在后台线程中启动事件循环(仅首次调用时)"""
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="http-client-loop", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+    
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        """获取主机对应的并发信号量,只在后台事件循环中调用"""
+        host = urlsplit(url).hostname or ""
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.host_limits.get(host, self.per_host_limit))
+            self._host_semaphores[host] = semaphore
+        return semaphore
+    
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """计算第 attempt 次重试前的等待时间,优先遵循 Retry-After"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+    
+    async def _request(self, method: str, url: str, retries: Optional[int] = None,
+                       **kwargs) -> requests.Response:
+        """带主机并发限制和重试的请求,在后台事件循环中执行"""
+        kwargs.setdefault("timeout", self.timeout)
+        retries = self.max_retries if retries is None else retries
+        loop = asyncio.get_running_loop()
+        semaphore = self._host_semaphore(url)
+        
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            
+            async with semaphore:
+                try:
+                    response = await loop.run_in_executor(
+                        self._executor, lambda: self.session.request(method, url, **kwargs)
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+            
+            retryable = error is not None or response.status_code in RETRY_STATUS_CODES
+            if not retryable or attempt >= retries:
+                if error is not None:
+                    raise FetchError(f"{method} {url} 请求失败: {error}") from error
+                return response
+            
+            delay = self._backoff_delay(attempt, response)
+            reason = error if error is not None else f"HTTP {response.status_code}"
+            logger.warning(f"{method} {url} 失败({reason}),{delay:.1f}s 后第 {attempt + 1} 次重试")
+            await asyncio.sleep(delay)
+            attempt += 1
+    
+    async def arequest(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        异步发送请求,可在任意事件循环中 await
+        
+        Args:
+            method: HTTP 方法
+            url: 请求 URL
+            **kwargs: 传给 requests 的参数,另支持 retries 覆盖重试次数
+        
+        Returns:
+            最后一次尝试的响应(非 2xx 也会返回,由调用方判断)
+        """
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+    
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """arequest 的同步版本,阻塞直到请求完成"""
+        future = asyncio.run_coroutine_threadsafe(self._request(method, url, **kwargs), self._ensure_loop())
+        return future.result()
+    
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """同步 GET 请求"""
+        return self.request("GET", url, **kwargs)
+    
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """同步 POST 请求"""
+        return self.request("POST", url, **kwargs)
+    
+    def _zyte_request_kwargs(self, url: str, options: Dict) -> Dict:
+        return {"json": {"url": url, **options}, "headers": self.zyte_headers}
+    
+    def _parse_zyte_response(self, response: requests.Response) -> Dict:
+        if response.status_code != 200:
+            raise FetchError(f"Zyte API 请求失败: {response.status_code}, {response.text}",
+                             response.status_code)
+        return response.json()
+    
+    def zyte_extract(self, url: str, timeout: Optional[float] = None, **options) -> Dict:
+        """
+        调用 Zyte API 抓取页面
+        
+        Args:
+            url: 目标页面 URL
+            timeout: 请求超时(秒)
+            **options: Zyte 请求参数,如 browserHtml=True
+        
+        Returns:
+            Zyte API 返回的 JSON 数据
+        """
+        response = self.post(ZYTE_API_URL, timeout=timeout or self.timeout,
+                             **self._zyte_request_kwargs(url, options))
+        return self._parse_zyte_response(response)
+    
+    async def azyte_extract(self, url: str, timeout: Optional[float] = None, **options) -> Dict:
+        """zyte_extract 的异步版本"""
+        response = await self.arequest("POST", ZYTE_API_URL, timeout=timeout or self.timeout,
+                                       **self._zyte_request_kwargs(url, options))
+        return self._parse_zyte_response(response)
+    
+    def close(self):
+        """关闭连接池和后台事件循环"""
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+        self._host_semaphores = {}
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_default_client: Optional[HttpClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """获取进程内共享的默认 HTTP 客户端"""
+    global _default_client
+    
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
@@ -0,0 +1,288 @@
+"""
+意图解析模块 - 不调用 LLM,用规则把简单的拍卖搜索指令转换为 search_auctions 参数
+
+支持中文和英文的时间范围、拍卖类别和关键词,例如:
+- "列出未来二周的拍卖列表" -> {"time_range_days": 14}
+- "搜索最近14天内world coin中的金币" -> {"time_range_days": 14, "categories": ["World Coins"], "keywords": ["gold"]}
+- "使用gold作为关键词搜索" -> {"keywords": ["gold"]}
+
+涉及具体拍卖场次、拍品、导出、价格分析、否定条件、已经过去的时间范围或指代上文的指令,
+以及有无法识别内容的指令,置信度低,交给 LLM 处理。
+"""
+
+import re
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 类别映射,与系统提示中的类别映射一致;较长的说法在前,先匹配
+CATEGORY_TERMS: List[Tuple[Tuple[str, ...], List[str]]] = [
+    (("world paper currency", "world currency", "外国纸币", "世界纸币"), ["World Paper Currency"]),
+    (("u.s. paper currency", "us paper currency", "us currency", "美国纸币"), ["U.S. Paper Currency"]),
+    (("world coins", "world coin", "世界硬币", "外国硬币", "外国钱币"), ["World Coins"]),
+    (("u.s. coins", "us coins", "american coins", "美国硬币", "美国钱币"), ["U.S. Coins & Related"]),
+    (("ancient coins", "ancient", "古币", "古钱币", "古钱"), ["Ancient Coins"]),
+    (("硬币", "钱币", "coins", "coin"), ["U.S. Coins & Related", "World Coins"]),
+    (("纸币", "paper money", "banknotes", "banknote", "currency"), ["U.S. Paper Currency", "World Paper Currency"]),
+    (("代币", "奖章", "tokens", "token", "medals", "medal"), ["Numismatic Americana"]),
+]
+
+# 中文说法 -> 拍卖标题中使用的英文关键词
+KEYWORD_TERMS: List[Tuple[Tuple[str, ...], str]] = [
+    (("金币", "黄金", "金质"), "gold"),
+    (("银币", "白银", "银质"), "silver"),
+    (("铜币", "铜质"), "copper"),
+    (("铂金", "白金"), "platinum"),
+    (("双鹰",), "double eagle"),
+    (("摩根",), "morgan"),
+    (("香港",), "Hong Kong"),
+    (("纽约",), "New York"),
+]
+
+# 不需要标记即可识别为关键词的英文词
+KNOWN_KEYWORDS = (
+    "double eagle", "morgan dollar", "hong kong", "new york", "gold", "silver", "copper", "platinum",
+    "morgan", "eagle", "dollar", "sovereign", "showcase",
+)
+
+# 出现这些内容时不是单纯的拍卖搜索,交给 LLM
+ESCALATION_PATTERNS = [
+    (re.compile(r'拍品|\blots?\b'), "涉及拍品"),
+    (re.compile(r'这场|这一场|那场|这个拍卖|该拍卖|this auction|\bsession\b|https?://'), "指定拍卖场次"),
+    (re.compile(r'导出|保存|下载|文件|\bexport\b|\bsave\b|\bcsv\b|\bjson\b'), "导出"),
+    (re.compile(r'价格|出价|均价|最贵|便宜|统计|分布|\bprices?\b|\bbids?\b|cheapest|expensive|average'), "价格分析"),
+    (re.compile(r'刷新|更新|变化|\brefresh\b|\bupdates?\b'), "刷新"),
+    (re.compile(r'它们|这些|那些|上面|刚才|之前的|\bthem\b|\bthose\b|\bthese\b'), "指代上文"),
+    # search_auctions 没有排除条件,"不要金币" 不能解析为 keywords=["gold"]
+    (re.compile(r'不要|不含|不包括|除了|除去|排除|没有|\bnot\b|\bno\b|\bwithout\b|\bexcept\b|\bexclud'), "否定条件"),
+    # time_range_days 只表示未来的天数
+    (re.compile(r'过去|以前|之前|上周|上个?星期|上个?月|昨天|前天|去年|已经?结束|'
+                r'\bpast\b|\blast\b|\bprevious\b|\bago\b|\byesterday\b|\bended\b'), "过去的时间范围"),
+]
+
+CHINESE_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5,
+                  "六": 6, "七": 7, "八": 8, "九": 9}
+ENGLISH_NUMBERS = {"a": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                   "ten": 10, "fourteen": 14, "thirty": 30}
+UNIT_DAYS = {"天": 1, "日": 1, "周": 7, "星期": 7, "礼拜": 7, "月": 30,
+             "day": 1, "week": 7, "month": 30}
+
+NUMBER = r'(\d+|[零一二两三四五六七八九十]+)'
+TIME_PATTERNS = [
+    (re.compile(NUMBER + r'\s*个?\s*(天|日|周|星期|礼拜|月)'), None),
+    (re.compile(r'\b(\d+|a|one|two|three|four|five|six|seven|ten|fourteen|thirty)\s+(day|week|month)s?\b'), None),
+    (re.compile(r'半个月'), 15),
+    (re.compile(r'下周|下个星期|next week'), 14),
+    (re.compile(r'本周|这周|这个星期|this week'), 7),
+    (re.compile(r'本月|这个月|this month'), 30),
+    (re.compile(r'今天|today'), 1),
+]
+
+# 由多个英文词组成的已知关键词,关键词标记后出现时整体作为一个关键词
+MULTI_WORD_KEYWORDS = '|'.join(re.escape(k) + 's?' for k in KNOWN_KEYWORDS if ' ' in k)
+
+# 显式的关键词标记
+KEYWORD_MARKERS = [
+    re.compile(r'(?:使用|用|以)\s*["“\']?([^"”\'，,。]+?)["”\']?\s*(?:作为|做为|当作|为)\s*(?:关键词|关键字)'),
+    re.compile(r'(?:关键词|关键字|keywords?)\s*(?:是|为|[:：])?\s*["“\']?(' + MULTI_WORD_KEYWORDS +
+               r'|[a-z][a-z\s\-]*?|[^\s"”\'，,。]+)["”\']?(?=$|[\s,，。])'),
+    re.compile(r'(?:包含|含有|containing)\s*["“\']?(' + MULTI_WORD_KEYWORDS +
+               r'|[^"”\'，,。]+?)["”\']?(?=的|$|[\s,，。])'),
+    re.compile(r'["“]([^"”]+)["”]'),
+]
+
+# 搜索指令中常见的、不影响参数的词
+FILLER_PATTERN = re.compile(
+    r'搜索|查找|查询|寻找|找一下|找出|找|列出|显示|展示|给我|帮我|请|看看|看一下|返回|'
+    r'所有的?|全部的?|的|拍卖会?|场次|列表|信息|有哪些|有什么|哪些|中的?|里的?|之内|以内|内|在|'
+    r'最近|近期|未来|接下来|即将|截止|结束|开始|一下|吗|呢|使用|作为|关键词|关键字|用|'
+    r'\b(?:search|find|list|show|me|all|the|auctions?|for|in|within|of|with|please|upcoming|recent|'
+    r'any|get|give|what|are|there|which|closing|ending|next|keywords?|containing)\b'
+)
+
+PUNCTUATION_PATTERN = re.compile(r'[\s\W_]+')
+SCRIPT_BOUNDARY = re.compile(r'(?<=[a-z0-9])(?=[^\x00-\x7f])|(?<=[^\x00-\x7f])(?=[a-z0-9])')
+
+
+@lru_cache(maxsize=None)
+def _term_pattern(term: str, plural: bool = False) -> re.Pattern:
+    """英文词只匹配完整的词"""
+    if not term.isascii():
+        return re.compile(re.escape(term))
+    return re.compile(rf'\b{re.escape(term)}{"s?" if plural else ""}\b')
+
+
+def normalize_text(text: str) -> str:
+    """转小写,合并空白,在英文/数字和汉字之间加空格,如 "world coin中的金币" -> "world coin 中的金币" """
+    text = " ".join((text or "").casefold().split())
+    return SCRIPT_BOUNDARY.sub(" ", text)
+
+
+def parse_chinese_number(text: str) -> Optional[int]:
+    """解析阿拉伯数字或中文数字,如 "14" / "十四" / "三十" / "两" """
+    if text.isdigit():
+        return int(text)
+    if not text or any(ch not in CHINESE_DIGITS and ch != "十" for ch in text):
+        return None
+    if "十" not in text:
+        return CHINESE_DIGITS[text] if len(text) == 1 else None
+    tens, _, ones = text.partition("十")
+    value = (CHINESE_DIGITS.get(tens, 0) if tens else 1) * 10
+    return value + (CHINESE_DIGITS.get(ones, 0) if ones else 0)
+
+
+class IntentResult:
+    """解析结果: 工具参数、置信度和原因"""
+    
+    def __init__(self, arguments: Dict, confidence: float, explicit: bool = False,
+                 reason: Optional[str] = None):
+        self.tool = "search_auctions"
+        self.arguments = arguments
+        self.confidence = confidence
+        # 指令中明确提到了"拍卖",有上文时也可以直接处理
+        self.explicit = explicit
+        self.reason = reason
+    
+    def to_dict(self) -> Dict:
+        return {"tool": self.tool, "arguments": self.arguments, "confidence": self.confidence,
+                "explicit": self.explicit, "reason": self.reason}
+    
+    def __repr__(self) -> str:
+        return f"IntentResult({self.arguments}, confidence={self.confidence:.2f})"
+
+
+class IntentParser:
+    """规则意图解析器"""
+    
+    def parse(self, text: str) -> IntentResult:
+        """
+        解析用户指令
+        
+        Returns:
+            IntentResult,confidence 为 0-1;有需要交给 LLM 的内容或无法识别的内容时较低
+        """
+        normalized = normalize_text(text)
+        if not normalized:
+            return IntentResult({}, 0.0, reason="空指令")
+        
+        for pattern, reason in ESCALATION_PATTERNS:
+            if pattern.search(normalized):
+                return IntentResult({}, 0.0, reason=reason)
+        
+        explicit = bool(re.search(r'拍卖|\bauctions?\b', normalized))
+        remaining = normalized
+        arguments: Dict = {}
+        
+        keywords, remaining = self._extract_keywords(remaining)
+        days, remaining = self._extract_time_range(remaining)
+        categories, remaining = self._extract_categories(remaining)
+        
+        if days:
+            arguments["time_range_days"] = days
+        if categories:
+            arguments["categories"] = categories
+        if keywords:
+            arguments["keywords"] = keywords
+        
+        if not arguments:
+            return IntentResult({}, 0.0, explicit, reason="没有识别出搜索条件")
+        
+        # 去掉常见的搜索用语后,剩余无法识别的内容越多,置信度越低
+        residue = PUNCTUATION_PATTERN.sub("", FILLER_PATTERN.sub(" ", remaining))
+        total = len(PUNCTUATION_PATTERN.sub("", normalized))
+        confidence = max(0.0, 1.0 - len(residue) / max(total, 1))
+        reason = f"无法识别: {residue}" if residue else None
+        return IntentResult(arguments, round(confidence, 2), explicit, reason)
+    
+    def _extract_time_range(self, text: str) -> Tuple[Optional[int], str]:
+        for pattern, days in TIME_PATTERNS:
+            match = pattern.search(text)
+            if not match:
+                continue
+            if days is None:
+                number, unit = match.group(1), match.group(2)
+                count = ENGLISH_NUMBERS.get(number) or parse_chinese_number(number)
+                if not count:
+                    continue
+                days = count * UNIT_DAYS[unit]
+            return days, text[:match.start()] + " " + text[match.end():]
+        return None, text
+    
+    def _extract_categories(self, text: str) -> Tuple[List[str], str]:
+        categories: List[str] = []
+        for terms, mapped in CATEGORY_TERMS:
+            for term in terms:
+                pattern = _term_pattern(term)
+                if pattern.search(text):
+                    text = pattern.sub(" ", text)
+                    categories.extend(c for c in mapped if c not in categories)
+        return categories, text
+    
+    def _extract_keywords(self, text: str) -> Tuple[List[str], str]:
+        keywords: List[str] = []
+        
+        def add(keyword: str):
+            keyword = keyword.strip()
+            if keyword and keyword.casefold() not in (k.casefold() for k in keywords):
+                keywords.append(keyword)
+        
+        for pattern in KEYWORD_MARKERS:
+            for match in list(pattern.finditer(text)):
+                value = match.group(1).strip()
+                mapped = self._map_keyword(value)
+                add(mapped or value)
+            text = pattern.sub(" ", text)
+        
+        for terms, keyword in KEYWORD_TERMS:
+            for term in terms:
+                if term in text:
+                    add(keyword)
+                    text = text.replace(term, " ")
+        
+        for keyword in KNOWN_KEYWORDS:
+            pattern = _term_pattern(keyword, plural=True)
+            if pattern.search(text):
+                add(keyword)
+                text = pattern.sub(" ", text)
+        
+        return keywords, text
+    
+    def _map_keyword(self, value: str) -> Optional[str]:
+        for terms, keyword in KEYWORD_TERMS:
+            if value in terms:
+                return keyword
+        for keyword in KNOWN_KEYWORDS:
+            if _term_pattern(keyword, plural=True).fullmatch(value):
+                return keyword
+        return None
+
+
+def describe_search(arguments: Dict) -> str:
+    """把搜索参数描述为中文,用于模板回复"""
+    parts = []
+    if arguments.get("time_range_days"):
+        parts.append(f"未来 {arguments['time_range_days']} 天内")
+    if arguments.get("categories"):
+        parts.append(f"类别 {', '.join(arguments['categories'])}")
+    if arguments.get("keywords"):
+        parts.append(f"关键词 {', '.join(arguments['keywords'])}")
+    return ",".join(parts) or "全部拍卖"
+
+
+def format_auction_answer(arguments: Dict, auctions: List[Dict]) -> str:
+    """搜索结果的模板回复"""
+    condition = describe_search(arguments)
+    if not auctions:
+        return f"没有找到符合条件的拍卖场次({condition})。"
+    
+    lines = [f"找到 {len(auctions)} 个拍卖场次({condition}):"]
+    for i, auction in enumerate(auctions, 1):
+        details = ", ".join(str(v) for v in (auction.get("date"),
+                                              f"{auction['lots_count']} 个拍品" if auction.get("lots_count") else None,
+                                              auction.get("category")) if v)
+        lines.append(f"{i}. {auction.get('title')}" + (f"({details})" if details else ""))
+        if auction.get("url"):
+            lines.append(f"   {auction['url']}")
+    return "\n".join(lines)
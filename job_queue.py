@@ -0,0 +1,361 @@
+"""
+后台任务模块 - 在有界线程池中执行耗时的抓取和导出,随时查询进度和已获得的结果
+
+- 提交任务立即返回任务 ID,任务在 JobQueue 的工作线程中执行
+- 进度(已完成页面、找到的拍品、预计剩余时间)和结果写入 JOB_DIR,服务重启后仍可查询
+- 参数相同的任务在排队或执行中时,再次提交直接返回已有任务
+"""
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import JOB_DIR, JOB_WORKERS, JOB_MAX_PENDING, JOB_PERSIST_INTERVAL
+from lot_scraper import ScrapeProgress
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+# 服务重启时仍在排队或执行中的任务
+JOB_INTERRUPTED = "interrupted"
+
+ACTIVE_STATES = (JOB_QUEUED, JOB_RUNNING)
+
+# 内存中保留的已结束任务数,更早的任务从 JOB_DIR 读取
+MAX_FINISHED_IN_MEMORY = 100
+
+
+class JobQueueFull(Exception):
+    """排队和执行中的任务数已达上限"""
+
+
+def job_key(kind: str, params: Dict) -> str:
+    """任务去重键: 任务类型和参数相同的任务视为同一任务"""
+    data = json.dumps({"kind": kind, "params": params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+
+class Job:
+    """一个后台任务,进度可在执行过程中随时读取"""
+    
+    def __init__(self, kind: str, params: Dict, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params
+        self.key = job_key(kind, params)
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.results_count = 0
+        self.cancel_event = threading.Event()
+        self._auctions: List[ScrapeProgress] = []
+        # 从 JOB_DIR 读取的任务没有 ScrapeProgress 对象,使用保存时的进度
+        self._saved_progress: Optional[Dict] = None
+        self._results_sink: Optional[Callable[['Job', List[Dict]], None]] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status not in ACTIVE_STATES
+    
+    def track(self, progress: ScrapeProgress):
+        """登记一个拍卖场次的抓取进度,任务进度由所有拍卖场次汇总"""
+        with self._lock:
+            self._auctions.append(progress)
+    
+    def add_results(self, rows: List[Dict]):
+        """追加已获得的结果,执行过程中即可通过 JobQueue.results 读取"""
+        if not rows:
+            return
+        if self._results_sink:
+            self._results_sink(self, rows)
+        with self._lock:
+            self.results_count += len(rows)
+    
+    def progress(self) -> Dict:
+        """汇总进度: 已完成页面、总页数、找到的拍品和预计剩余时间"""
+        with self._lock:
+            auctions = [p.to_dict() for p in self._auctions]
+        if not auctions and self._saved_progress is not None:
+            return self._saved_progress
+        
+        pages_done = sum(a["pages_done"] for a in auctions)
+        known = [a for a in auctions if a["total_pages"]]
+        total_pages = None
+        eta = 0.0 if self.finished else None
+        if known:
+            # 还没开始抓取的拍卖场次按已知拍卖场次的平均页数估算
+            average_pages = sum(a["total_pages"] for a in known) / len(known)
+            total_pages = round(sum(a["total_pages"] if a["total_pages"] else max(average_pages, a["pages_done"])
+                                    for a in auctions))
+            elapsed = time.time() - (self.started_at or time.time())
+            if not self.finished and pages_done and elapsed > 0:
+                eta = round(max(0, total_pages - pages_done) / (pages_done / elapsed), 1)
+        
+        return {
+            "auctions_total": len(auctions),
+            "auctions_done": sum(1 for a in auctions if a["finished"]),
+            "pages_done": pages_done,
+            "total_pages": total_pages,
+            "lots_found": sum(a["lots_found"] for a in auctions),
+            "failed_pages": sum(len(a["failed_pages"]) for a in auctions),
+            "eta_seconds": eta,
+            "auctions": auctions
+        }
+    
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress(),
+            "results_count": self.results_count,
+            "result": self.result,
+            "error": self.error
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Job':
+        job = cls(data["kind"], data.get("params") or {}, data["job_id"])
+        job.status = data.get("status", JOB_FAILED)
+        job.created_at = data.get("created_at", job.created_at)
+        job.started_at = data.get("started_at")
+        job.finished_at = data.get("finished_at")
+        job.result = data.get("result")
+        job.error = data.get("error")
+        job.results_count = data.get("results_count", 0)
+        job._saved_progress = data.get("progress")
+        return job
+
+
+class JobStore:
+    """任务状态(JSON)和结果(JSONL)的文件存储"""
+    
+    def __init__(self, job_dir: str = JOB_DIR):
+        self.job_dir = job_dir
+        self._lock = threading.Lock()
+    
+    def _path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}{suffix}")
+    
+    def save(self, job: Job):
+        data = job.to_dict()
+        path = self._path(job.id, ".json")
+        with self._lock:
+            try:
+                os.makedirs(self.job_dir, exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except (OSError, TypeError) as e:
+                logger.warning(f"保存任务状态失败: {job.id}, {e}")
+    
+    def load(self, job_id: str) -> Optional[Job]:
+        try:
+            with open(self._path(job_id, ".json"), 'r', encoding='utf-8') as f:
+                return Job.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取任务状态失败: {job_id}, {e}")
+            return None
+    
+    def load_all(self) -> List[Job]:
+        if not os.path.isdir(self.job_dir):
+            return []
+        jobs = []
+        for name in os.listdir(self.job_dir):
+            if name.endswith(".json"):
+                job = self.load(name[:-len(".json")])
+                if job:
+                    jobs.append(job)
+        return sorted(jobs, key=lambda j: j.created_at)
+    
+    def append_results(self, job_id: str, rows: List[Dict]):
+        with self._lock:
+            os.makedirs(self.job_dir, exist_ok=True)
+            with open(self._path(job_id, ".jsonl"), 'a', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    
+    def read_results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict]:
+        rows = []
+        try:
+            with open(self._path(job_id, ".jsonl"), 'r', encoding='utf-8') as f:
+                for i, line in enumerate(f):
+                    if i < offset:
+                        continue
+                    if len(rows) >= limit:
+                        break
+                    rows.append(json.loads(line))
+        except FileNotFoundError:
+            pass
+        return rows
+
+
+class JobQueue:
+    """
+    后台任务队列
+    
+    任务按类型交给 handlers 中的函数执行,函数接收 Job,通过 job.track / job.add_results
+    报告进度和结果,检查 job.cancel_event 以响应取消,返回值作为任务结果。
+    """
+    
+    def __init__(self, handlers: Dict[str, Callable[[Job], Any]], max_workers: int = JOB_WORKERS,
+                 max_pending: int = JOB_MAX_PENDING, store: Optional[JobStore] = None,
+                 persist_interval: float = JOB_PERSIST_INTERVAL):
+        """
+        Args:
+            handlers: 任务类型 -> 执行函数
+            max_workers: 同时执行的任务数
+            max_pending: 排队和执行中的任务数上限
+            store: 任务存储,为空时使用 JOB_DIR
+            persist_interval: 执行中的任务进度写入间隔(秒)
+        """
+        self.handlers = handlers
+        self.max_pending = max_pending
+        self.store = store if store is not None else JobStore()
+        self.persist_interval = persist_interval
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        
+        # 上次运行时没有结束的任务无法继续,标记为中断
+        for job in self.store.load_all():
+            if not job.finished:
+                job.status = JOB_INTERRUPTED
+                job.error = "服务重启,任务已中断"
+                job.finished_at = job.finished_at or time.time()
+                self.store.save(job)
+            self._jobs[job.id] = job
+        self._prune()
+        
+        self._persister = threading.Thread(target=self._persist_loop, name="job-persist", daemon=True)
+        self._persister.start()
+    
+    def submit(self, kind: str, params: Dict) -> Tuple[Job, bool]:
+        """
+        提交任务
+        
+        Returns:
+            (任务, 是否新建);相同的任务正在排队或执行时返回已有任务
+        
+        Raises:
+            ValueError: 未知的任务类型
+            JobQueueFull: 排队和执行中的任务数已达上限
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"未知的任务类型: {kind}")
+        
+        with self._lock:
+            existing = self._active.get(job_key(kind, params))
+            if existing is not None:
+                logger.info(f"相同的任务正在进行,复用任务 {existing.id}")
+                return existing, False
+            if len(self._active) >= self.max_pending:
+                raise JobQueueFull(f"排队和执行中的任务已达上限 {self.max_pending}")
+            
+            job = Job(kind, params)
+            job._results_sink = self._append_results
+            self._jobs[job.id] = job
+            self._active[job.key] = job
+        
+        self.store.save(job)
+        self.executor.submit(self._run, job)
+        logger.info(f"提交任务 {job.id}: {kind} {params}")
+        return job, True
+    
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        return job or self.store.load(job_id)
+    
+    def results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict]:
+        """任务已获得的结果,执行过程中可以按 offset 增量读取"""
+        return self.store.read_results(job_id, offset, limit)
+    
+    def cancel(self, job_id: str) -> bool:
+        """取消排队或执行中的任务,返回任务是否存在且未结束"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        logger.info(f"取消任务 {job_id}")
+        return True
+    
+    def list_jobs(self) -> List[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created_at)
+    
+    def shutdown(self, wait: bool = False):
+        """取消所有任务并停止工作线程"""
+        self._closed.set()
+        for job in self.list_jobs():
+            if not job.finished:
+                job.cancel_event.set()
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+    
+    def _run(self, job: Job):
+        if job.cancel_event.is_set():
+            self._finish(job, JOB_CANCELLED)
+            return
+        
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        self.store.save(job)
+        logger.info(f"开始执行任务 {job.id}")
+        
+        try:
+            job.result = self.handlers[job.kind](job)
+            self._finish(job, JOB_CANCELLED if job.cancel_event.is_set() else JOB_SUCCEEDED)
+        except Exception as e:
+            logger.error(f"任务执行失败: {job.id}, {e}")
+            job.error = str(e)
+            self._finish(job, JOB_FAILED)
+    
+    def _finish(self, job: Job, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        self.store.save(job)
+        self._prune()
+        logger.info(f"任务 {job.id} 结束: {status}, {job.results_count} 条结果")
+    
+    def _append_results(self, job: Job, rows: List[Dict]):
+        self.store.append_results(job.id, rows)
+    
+    def _prune(self):
+        """内存中只保留最近结束的任务,更早的任务仍可从 JOB_DIR 读取"""
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job.finished]
+            finished.sort(key=lambda j: j.finished_at or 0)
+            for job in finished[:max(0, len(finished) - MAX_FINISHED_IN_MEMORY)]:
+                del self._jobs[job.id]
+    
+    def _persist_loop(self):
+        while not self._closed.wait(self.persist_interval):
+            for job in self.list_jobs():
+                if job.status == JOB_RUNNING:
+                    self.store.save(job)
@@ -0,0 +1,174 @@
+"""
+LLM 缓存模块 - 缓存模型回复和用户意图对应的工具调用计划
+
+两级缓存:
+1. 回复缓存: 以规范化后的 (模型, 消息, 工具, tool_choice) 的哈希为键,缓存模型回复(文本和工具调用)
+2. 意图计划缓存: 以规范化后的用户指令为键,缓存模型对该指令发出的第一批工具调用;
+   重复的问题直接执行缓存的计划,跳过第一次模型请求
+
+两级缓存都有过期时间,超出容量后按最近最少使用淘汰。
+"""
+
+import copy
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, PLAN_CACHE_TTL_SECONDS
+from lot_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_intent(text: str) -> str:
+    """规范化用户指令: 转小写,去掉标点和多余空白,如 "搜索 Gold!" -> "搜 索 gold" """
+    return " ".join(tokenize(text or ""))
+
+
+def _normalize_messages(messages: List[Dict]) -> List[Dict]:
+    """
+    去掉消息中每次都不同的部分: 文本首尾和连续空白、工具调用 ID
+    
+    工具调用 ID 按出现顺序替换为序号,工具结果通过序号对应到工具调用。
+    """
+    ids: Dict[str, str] = {}
+    normalized = []
+    for message in messages:
+        item = {"role": message.get("role")}
+        if message.get("content"):
+            item["content"] = " ".join(message["content"].split())
+        if message.get("tool_calls"):
+            item["tool_calls"] = [
+                {"ref": ids.setdefault(call.get("id"), str(len(ids))),
+                 "name": call["function"]["name"],
+                 "arguments": call["function"]["arguments"]}
+                for call in message["tool_calls"]
+            ]
+        if message.get("tool_call_id"):
+            item["ref"] = ids.get(message["tool_call_id"], message["tool_call_id"])
+        normalized.append(item)
+    return normalized
+
+
+def response_key(model: str, messages: List[Dict], tools: Optional[List[Dict]] = None,
+                 tool_choice: Optional[str] = None) -> str:
+    """模型请求的缓存键"""
+    payload = {"model": model, "messages": _normalize_messages(messages),
+               "tools": tools or [], "tool_choice": tool_choice}
+    data = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _fresh_ids(tool_calls: List[Dict]) -> List[Dict]:
+    """复制工具调用并换上新的调用 ID,避免同一对话中出现重复 ID"""
+    calls = copy.deepcopy(tool_calls)
+    for call in calls:
+        call["id"] = f"call_{uuid.uuid4().hex[:24]}"
+    return calls
+
+
+class TTLCache:
+    """有过期时间的 LRU 缓存,线程安全"""
+    
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def to_dict(self) -> Dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class LLMCache:
+    """模型回复缓存和意图计划缓存"""
+    
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 plan_ttl_seconds: float = PLAN_CACHE_TTL_SECONDS):
+        """
+        Args:
+            max_entries: 每级缓存的最大条目数
+            ttl_seconds: 模型回复的缓存时间
+            plan_ttl_seconds: 意图计划的缓存时间;计划只决定调用哪些工具,数据每次重新获取,可以缓存更久
+        """
+        self.responses = TTLCache(max_entries, ttl_seconds)
+        self.plans = TTLCache(max_entries, plan_ttl_seconds)
+    
+    def get_response(self, key: str) -> Optional[Tuple[Optional[str], List[Dict]]]:
+        """
+        Returns:
+            (文本, 工具调用),未命中时为 None
+        """
+        cached = self.responses.get(key)
+        if cached is None:
+            return None
+        content, tool_calls = cached
+        return content, _fresh_ids(tool_calls)
+    
+    def put_response(self, key: str, content: Optional[str], tool_calls: List[Dict]):
+        self.responses.put(key, (content, copy.deepcopy(tool_calls)))
+    
+    def get_plan(self, user_input: str) -> Optional[List[Dict]]:
+        """用户指令对应的工具调用计划,未命中时为 None"""
+        intent = normalize_intent(user_input)
+        if not intent:
+            return None
+        plan = self.plans.get(intent)
+        if plan is None:
+            return None
+        logger.info(f"意图计划缓存命中: {intent}")
+        return _fresh_ids(plan)
+    
+    def put_plan(self, user_input: str, tool_calls: List[Dict]):
+        """
+        记录用户指令对应的工具调用计划
+        
+        引用之前结果句柄的计划依赖上下文,不缓存。
+        """
+        intent = normalize_intent(user_input)
+        if not intent or not tool_calls:
+            return
+        if any("res_" in call["function"]["arguments"] for call in tool_calls):
+            return
+        self.plans.put(intent, copy.deepcopy(tool_calls))
+    
+    def clear(self):
+        self.responses.clear()
+        self.plans.clear()
+    
+    def stats(self) -> Dict:
+        return {"responses": self.responses.to_dict(), "plans": self.plans.to_dict()}
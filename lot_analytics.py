@@ -0,0 +1,263 @@
+"""
+拍品分析模块 - 基于 NumPy 列的拍品价格统计
+
+出价、拍品编号和拍卖场次编号保存为 NumPy 数组,按拍卖场次的最低/最高/中位出价、
+出价直方图、最贵的 N 个拍品和价格区间过滤都只需对数组做一次向量化计算。
+结果是紧凑的统计数据,适合直接返回给 LLM。
+"""
+
+import re
+import logging
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from lot_records import Auction, Lot, LotTable, as_dict, parse_bid_amount
+
+logger = logging.getLogger(__name__)
+
+LOT_NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def _lot_number_value(lot_number) -> int:
+    """拍品编号中的数字部分,如 'Lot 70001' -> 70001,没有数字时为 -1"""
+    match = LOT_NUMBER_PATTERN.search(str(lot_number or ''))
+    return int(match.group()) if match else -1
+
+
+def _round(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+class LotFrame:
+    """
+    拍品的 NumPy 列视图
+    
+    bids: float64,没有出价为 NaN
+    lot_numbers: int64,拍品编号中的数字,没有编号为 -1
+    auction_ids: int32,auctions 列表中的下标,没有所属拍卖场次为 -1
+    """
+    
+    def __init__(self, lots: Sequence[Union[Dict, Lot]], bids: np.ndarray, lot_numbers: np.ndarray,
+                 auction_ids: np.ndarray, auctions: List[Optional[Auction]]):
+        self.lots = lots
+        self.bids = bids
+        self.lot_numbers = lot_numbers
+        self.auction_ids = auction_ids
+        self.auctions = auctions
+    
+    @classmethod
+    def from_lots(cls, lots: Iterable[Union[Dict, Lot]]) -> 'LotFrame':
+        """从拍品字典或 Lot 记录创建,拍卖场次按 auction_url 区分"""
+        lots = list(lots)
+        auctions: List[Optional[Auction]] = []
+        auction_index: Dict[str, int] = {}
+        bids = np.empty(len(lots), dtype=np.float64)
+        lot_numbers = np.empty(len(lots), dtype=np.int64)
+        auction_ids = np.empty(len(lots), dtype=np.int32)
+        
+        for row, lot in enumerate(lots):
+            if isinstance(lot, Lot):
+                bid = lot.current_bid
+                auction = lot.auction
+            else:
+                bid = parse_bid_amount(lot.get('current_bid'))
+                url = lot.get('auction_url')
+                auction = Auction.intern(url, lot.get('auction_title'), lot.get('auction_date')) if url else None
+            
+            bids[row] = np.nan if bid is None else bid
+            lot_numbers[row] = _lot_number_value(lot.get('lot_number'))
+            
+            if auction is None:
+                auction_ids[row] = -1
+            else:
+                auction_id = auction_index.get(auction.url)
+                if auction_id is None:
+                    auction_id = auction_index[auction.url] = len(auctions)
+                    auctions.append(auction)
+                auction_ids[row] = auction_id
+        
+        return cls(lots, bids, lot_numbers, auction_ids, auctions)
+    
+    @classmethod
+    def from_table(cls, table: LotTable) -> 'LotFrame':
+        """从 LotTable 创建,出价和拍卖场次列按内存块整体复制,不逐个转换"""
+        if len(table):
+            # 复制后立即释放对 array 缓冲区的引用,LotTable 之后仍可追加拍品
+            bids = np.frombuffer(table.bids, dtype=np.float64).copy()
+            auction_ids = np.frombuffer(table.auction_ids, dtype=np.int32).copy()
+        else:
+            bids = np.empty(0, dtype=np.float64)
+            auction_ids = np.empty(0, dtype=np.int32)
+        lot_numbers = np.fromiter((_lot_number_value(n) for n in table.lot_numbers),
+                                  dtype=np.int64, count=len(table))
+        return cls(table, bids, lot_numbers, auction_ids, list(table.auctions))
+    
+    def __len__(self) -> int:
+        return len(self.bids)
+    
+    def rows(self, indices: Iterable[int], fields: Optional[Sequence[str]] = None) -> List[Dict]:
+        """取出指定行的拍品字典,fields 指定时只保留这些字段"""
+        result = []
+        for row in indices:
+            lot = as_dict(self.lots[int(row)])
+            if fields:
+                lot = {name: lot[name] for name in fields if name in lot}
+            result.append(lot)
+        return result
+    
+    def auction_stats(self) -> List[Dict]:
+        """
+        按拍卖场次统计出价
+        
+        Returns:
+            每个拍卖场次的拍品数、有出价的拍品数、最低/最高/中位/平均出价和出价总额
+        """
+        groups = len(self.auctions) + 1
+        # 没有所属拍卖场次的拍品归入最后一组
+        group_ids = np.where(self.auction_ids < 0, groups - 1, self.auction_ids)
+        lot_counts = np.bincount(group_ids, minlength=groups)
+        
+        valid = ~np.isnan(self.bids)
+        bids = self.bids[valid]
+        valid_groups = group_ids[valid]
+        
+        # 按 (拍卖场次, 出价) 排序后,每组的最小、最大和中位数都可以按下标直接取出
+        order = np.lexsort((bids, valid_groups))
+        sorted_bids = bids[order]
+        bid_counts = np.bincount(valid_groups, minlength=groups)
+        totals = np.bincount(valid_groups, weights=bids, minlength=groups)
+        starts = np.concatenate(([0], np.cumsum(bid_counts)[:-1]))
+        
+        minimums = maximums = medians = means = np.full(groups, np.nan)
+        if len(sorted_bids):
+            # 没有出价的组下标会越界,先截断到有效范围,再用 has_bids 置为 NaN
+            has_bids = bid_counts > 0
+            last = len(sorted_bids) - 1
+            first_index = np.minimum(starts, last)
+            last_index = np.clip(starts + bid_counts - 1, 0, last)
+            low_mid = np.clip(starts + (bid_counts - 1) // 2, 0, last)
+            high_mid = np.minimum(starts + bid_counts // 2, last)
+            
+            minimums = np.where(has_bids, sorted_bids[first_index], np.nan)
+            maximums = np.where(has_bids, sorted_bids[last_index], np.nan)
+            medians = np.where(has_bids, (sorted_bids[low_mid] + sorted_bids[high_mid]) / 2, np.nan)
+            means = np.where(has_bids, totals / np.maximum(bid_counts, 1), np.nan)
+        
+        stats = []
+        for group in range(groups):
+            if lot_counts[group] == 0:
+                continue
+            auction = self.auctions[group] if group < len(self.auctions) else None
+            stats.append({
+                "auction_title": auction.title if auction else None,
+                "auction_url": auction.url if auction else None,
+                "lots": int(lot_counts[group]),
+                "lots_with_bid": int(bid_counts[group]),
+                "min_bid": _round(minimums[group]),
+                "max_bid": _round(maximums[group]),
+                "median_bid": _round(medians[group]),
+                "mean_bid": _round(means[group]),
+                "total_bid": _round(totals[group]) if bid_counts[group] else None
+            })
+        return stats
+    
+    def histogram(self, bins: int = 10, min_bid: Optional[float] = None,
+                  max_bid: Optional[float] = None, log_scale: bool = False) -> Dict:
+        """
+        出价直方图
+        
+        Args:
+            bins: 区间数
+            min_bid / max_bid: 统计范围,默认为全部出价的范围
+            log_scale: 按对数等分区间,出价跨越多个数量级时更有用
+        
+        Returns:
+            {"edges": 区间边界, "counts": 每个区间的拍品数}
+        """
+        if bins < 1:
+            raise ValueError(f"bins 必须大于 0: {bins}")
+        bids = self.bids[~np.isnan(self.bids)]
+        if min_bid is not None:
+            bids = bids[bids >= min_bid]
+        if max_bid is not None:
+            bids = bids[bids <= max_bid]
+        if not len(bids):
+            return {"edges": [], "counts": []}
+        
+        low, high = float(bids.min()), float(bids.max())
+        if log_scale and low > 0 and high > low:
+            edges = np.geomspace(low, high, bins + 1)
+        else:
+            edges = np.linspace(low, high if high > low else low + 1, bins + 1)
+        
+        counts, edges = np.histogram(bids, bins=edges)
+        return {"edges": [round(float(e), 2) for e in edges], "counts": counts.tolist()}
+    
+    def top_n(self, n: int = 10, ascending: bool = False) -> np.ndarray:
+        """出价最高(ascending=True 时最低)的 n 个拍品的行号,按出价排序"""
+        candidates = np.flatnonzero(~np.isnan(self.bids))
+        n = min(n, len(candidates))
+        if n <= 0:
+            return np.empty(0, dtype=np.int64)
+        
+        keys = self.bids[candidates] if ascending else -self.bids[candidates]
+        # 先用 argpartition 选出前 n 个,只对这 n 个排序
+        picked = np.argpartition(keys, n - 1)[:n] if n < len(candidates) else np.arange(len(candidates))
+        picked = picked[np.argsort(keys[picked], kind='stable')]
+        return candidates[picked]
+    
+    def in_price_range(self, min_bid: Optional[float] = None, max_bid: Optional[float] = None) -> np.ndarray:
+        """出价在范围内的拍品行号,没有出价的拍品不计入"""
+        mask = ~np.isnan(self.bids)
+        if min_bid is not None:
+            mask &= self.bids >= min_bid
+        if max_bid is not None:
+            mask &= self.bids <= max_bid
+        return np.flatnonzero(mask)
+    
+    def summary(self, top: int = 10, bins: int = 10, min_bid: Optional[float] = None,
+                max_bid: Optional[float] = None, log_scale: bool = False) -> Dict:
+        """
+        生成适合返回给 LLM 的紧凑统计
+        
+        指定价格区间时,统计、直方图和最贵拍品都只针对区间内的拍品。
+        """
+        frame = self
+        if min_bid is not None or max_bid is not None:
+            frame = self.select(self.in_price_range(min_bid, max_bid))
+        
+        valid = frame.bids[~np.isnan(frame.bids)]
+        top_lots = frame.rows(frame.top_n(top),
+                              fields=('lot_number', 'title', 'current_bid', 'auction_title'))
+        
+        return {
+            "lots": len(frame),
+            "lots_with_bid": int(len(valid)),
+            "min_bid": _round(valid.min()) if len(valid) else None,
+            "max_bid": _round(valid.max()) if len(valid) else None,
+            "median_bid": _round(np.median(valid)) if len(valid) else None,
+            "by_auction": frame.auction_stats(),
+            "histogram": frame.histogram(bins, log_scale=log_scale),
+            "top_lots": top_lots
+        }
+    
+    def select(self, indices: np.ndarray) -> 'LotFrame':
+        """按行号取出子集"""
+        indices = np.asarray(indices, dtype=np.int64)
+        return LotFrame(_RowView(self.lots, indices), self.bids[indices], self.lot_numbers[indices],
+                        self.auction_ids[indices], self.auctions)
+
+
+class _RowView:
+    """按行号映射到原拍品序列,select() 时避免复制拍品"""
+    
+    def __init__(self, lots: Sequence, indices: np.ndarray):
+        self.lots = lots
+        self.indices = indices
+    
+    def __len__(self) -> int:
+        return len(self.indices)
+    
+    def __getitem__(self, row: int):
+        return self.lots[int(self.indices[row])]
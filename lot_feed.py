@@ -0,0 +1,273 @@
+"""
+结构化拍品数据模块 - 从 JSON 接口或页面内嵌的 JSON 中直接提取拍品
+
+很多拍卖站点的列表页由 JavaScript 根据 JSON 数据渲染: 数据要么内嵌在页面中
+(<script type="application/json">、window.__INITIAL_STATE__ = {...}、var lots = [...]),
+要么来自单独的 JSON 接口。直接解析这些数据比解析渲染后的 HTML 快得多,字段也更完整。
+
+内嵌 JSON 用 JSONDecoder.raw_decode 从赋值位置开始增量解码,解析到 JSON 值结束即停止,
+不需要先用正则截取脚本内容,也不需要构建 HTML 文档树。
+不同站点的字段名(lotNumber / lot_number / LotNo 等)统一为 lot_scraper 使用的字段名。
+"""
+
+import re
+import json
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import quote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# <script type="application/json"> 和 <script type="application/ld+json"> 的内容
+JSON_SCRIPT_PATTERN = re.compile(r'<script[^>]*\btype=["\']application/(?:ld\+)?json["\'][^>]*>', re.I)
+# 状态对象和拍品变量的赋值,如 window.__INITIAL_STATE__ = {...}、var lots = [...]。
+# 先用以字面量开头的正则找到 "= {" / "= [",再检查等号前的变量名,比直接匹配变量名快一个数量级
+ASSIGNMENT_PATTERN = re.compile(r'=\s*(?=[\[{])')
+STATE_NAME_PATTERN = re.compile(r'(?:\b(?:var|let|const)\s+\w*lots?\w*|\b(?:window\.)?__[A-Z][A-Z_]*__)\s*$', re.I)
+
+# 规范字段名 -> 各站点使用的字段名(忽略大小写、下划线和连字符),按优先级排列
+FIELD_ALIASES = {
+    'lot_number': ('lotnumber', 'lotno', 'lotnum', 'lot'),
+    'title': ('title', 'lottitle', 'name', 'headline', 'shortdescription'),
+    'description': ('description', 'lotdescription', 'longdescription', 'desc', 'details'),
+    'current_bid': ('currentbid', 'highbid', 'currentprice', 'bid', 'price', 'startingbid'),
+    'image_url': ('imageurl', 'image', 'thumbnailurl', 'thumbnail', 'images', 'photo'),
+    'lot_url': ('loturl', 'url', 'link', 'href'),
+}
+ALIAS_FIELDS = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+# JSON 接口和状态对象中的总页数字段
+TOTAL_PAGES_KEYS = ('totalpages', 'pagecount', 'numpages', 'lastpage')
+
+# 遍历 JSON 时容器的最大嵌套层数
+JSON_MAX_DEPTH = 64
+
+AMOUNT_PATTERN = re.compile(r'\d+(?:,\d{3})*(?:\.\d+)?')
+NUMBERED_SEGMENT = re.compile(r'\d+')
+
+
+def _field_key(name: str) -> str:
+    return name.replace('_', '').replace('-', '').lower()
+
+
+@lru_cache(maxsize=4096)
+def _alias_field(name: str) -> Optional[str]:
+    """JSON 键对应的规范字段名;同一站点的键反复出现,结果缓存"""
+    return ALIAS_FIELDS.get(_field_key(name))
+
+
+def looks_like_json(text: str) -> bool:
+    """响应内容是否是 JSON(JSON 接口返回的数据,而不是 HTML 页面)"""
+    stripped = text.lstrip()[:1]
+    return stripped in ('{', '[')
+
+
+def iter_embedded_json(html: str) -> Iterator:
+    """
+    依次产出页面中内嵌的 JSON 数据
+    
+    从每个 JSON 脚本标签或赋值语句的位置开始解码,无法解码的数据跳过。
+    """
+    decoder = json.JSONDecoder()
+    starts = [m.end() for m in JSON_SCRIPT_PATTERN.finditer(html)]
+    starts += [m.end() for m in ASSIGNMENT_PATTERN.finditer(html)
+               if STATE_NAME_PATTERN.search(html, max(0, m.start() - 100), m.start())]
+    
+    for start in sorted(starts):
+        while start < len(html) and html[start].isspace():
+            start += 1
+        try:
+            data, _ = decoder.raw_decode(html, start)
+        except ValueError:
+            logger.debug(f"内嵌 JSON 解码失败,位置 {start}")
+            continue
+        yield data
+
+
+def _scalar(value) -> Optional[str]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return None
+
+
+def _bid_value(value) -> Optional[str]:
+    """出价统一为不带货币符号和千位分隔符的数字字符串,与 HTML 提取的结果一致"""
+    if isinstance(value, dict):
+        for key in ('amount', 'value', 'displayValue', 'display'):
+            if key in value:
+                return _bid_value(value[key])
+        return None
+    if isinstance(value, str):
+        match = AMOUNT_PATTERN.search(value)
+        return match.group(0).replace(',', '') if match else None
+    return _scalar(value)
+
+
+def _image_value(value) -> Optional[str]:
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = value.get('url') or value.get('src') or value.get('href')
+    return _scalar(value)
+
+
+def _lot_number(key: str, value) -> Optional[str]:
+    """拍品编号字段的值;泛称的 lot 字段只有包含数字时才视为编号"""
+    number = _scalar(value)
+    if number is not None and _field_key(key) == 'lot' and not any(c.isdigit() for c in number):
+        return None
+    return number
+
+
+def is_lot_object(data: Dict) -> bool:
+    """对象是否有拍品编号字段(任一写法),且编号是字符串或数字"""
+    for key, value in data.items():
+        if _alias_field(key) == 'lot_number' and _lot_number(key, value) is not None:
+            return True
+    return False
+
+
+def normalize_lot(raw: Dict) -> Optional[Dict]:
+    """
+    把站点 JSON 中的拍品对象转换为统一的字段
+    
+    Returns:
+        包含 lot_number、title、description、current_bid、image_url、lot_url 中
+        找到的字段;没有拍品编号时返回 None(不是拍品对象)
+    """
+    found: Dict[str, object] = {}
+    ranks: Dict[str, int] = {}
+    
+    for key, value in raw.items():
+        field = _alias_field(key)
+        if field is None or value is None:
+            continue
+        if field == 'lot_number':
+            value = _lot_number(key, value)
+            if value is None:
+                continue
+        rank = FIELD_ALIASES[field].index(_field_key(key))
+        if field not in ranks or rank < ranks[field]:
+            found[field] = value
+            ranks[field] = rank
+    
+    lot_number = found.get('lot_number')
+    if lot_number is None:
+        return None
+    
+    lot = {'lot_number': lot_number}
+    for field, convert in (('title', _scalar), ('description', _scalar), ('current_bid', _bid_value),
+                           ('image_url', _image_value), ('lot_url', _scalar)):
+        value = convert(found[field]) if field in found else None
+        if value is not None:
+            lot[field] = value
+    return lot
+
+
+def iter_normalized_lots(items: Iterable[Dict], seen: Optional[Set[str]] = None) -> Iterator[Dict]:
+    """
+    逐个规范化拍品对象,丢弃没有拍品编号的对象,同一编号只保留第一个
+    
+    Args:
+        items: 拍品对象
+        seen: 已产出的拍品编号,多份 JSON 数据共用时跨数据去重
+    """
+    seen = set() if seen is None else seen
+    
+    for item in items:
+        lot = normalize_lot(item) if isinstance(item, dict) else None
+        if lot is None or lot['lot_number'] in seen:
+            continue
+        seen.add(lot['lot_number'])
+        yield lot
+
+
+def _children(node) -> Iterator[Tuple[str, object]]:
+    """容器的 (路径步, 子节点);列表元素的路径步都是 '*'"""
+    if isinstance(node, dict):
+        return iter(node.items())
+    return (('*', child) for child in node)
+
+
+def iter_lot_objects(data, max_depth: int = JSON_MAX_DEPTH) -> Iterator[Tuple[Tuple[str, ...], Dict]]:
+    """
+    迭代遍历 JSON 数据,逐个产出拍品对象及其路径
+    
+    用显式栈代替递归,栈中只保存每层容器的迭代器,不复制中间列表;拍品对象的
+    子节点不再遍历。路径由对象键和 '*'(列表元素)组成,如 ('auction', 'lots', '*')。
+    超过 max_depth 层的容器会被跳过并记录警告。
+    
+    Yields:
+        (路径, 拍品对象)
+    """
+    if isinstance(data, dict) and is_lot_object(data):
+        yield (), data
+        return
+    if not isinstance(data, (dict, list)):
+        return
+    
+    # 每层保存 (进入该层的路径步, 子节点迭代器),路径只在找到拍品时拼出
+    stack = [(None, _children(data))]
+    truncated = 0
+    
+    while stack:
+        child = next(stack[-1][1], None)
+        if child is None:
+            stack.pop()
+            continue
+        
+        step, value = child
+        if isinstance(value, dict):
+            if is_lot_object(value):
+                yield tuple(level[0] for level in stack[1:]) + (step,), value
+                continue
+        elif not isinstance(value, list):
+            continue
+        
+        if len(stack) >= max_depth:
+            truncated += 1
+            continue
+        stack.append((step, _children(value)))
+    
+    if truncated:
+        logger.warning(f"JSON 数据超过 {max_depth} 层,跳过了 {truncated} 个容器")
+
+
+def find_total_pages(data, max_depth: int = 3) -> Optional[int]:
+    """在 JSON 数据的前几层中查找总页数字段"""
+    level = [data]
+    
+    for _ in range(max_depth):
+        next_level = []
+        for node in level:
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    if _field_key(key) in TOTAL_PAGES_KEYS and isinstance(value, int) and value > 0:
+                        return value
+                    if isinstance(value, (dict, list)):
+                        next_level.append(value)
+            elif isinstance(node, list):
+                next_level.extend(v for v in node if isinstance(v, dict))
+        level = next_level
+    
+    return None
+
+
+def build_feed_url(template: str, auction_url: str, page: int) -> str:
+    """
+    按站点配置的 JSON 接口模板构造分页 URL
+    
+    模板可以使用 {auction_url}(已编码,可直接放在查询参数中)、{auction_id}(拍卖场次
+    URL 路径中最后一个数字)和 {page}。
+    """
+    numbers = NUMBERED_SEGMENT.findall(urlsplit(auction_url).path)
+    return template.format(auction_url=quote(auction_url, safe=''),
+                           auction_id=numbers[-1] if numbers else '', page=page)
@@ -0,0 +1,193 @@
+"""
+拍品关键词索引 - 标题和描述的倒排索引,支持 AND / OR / NOT 和前缀匹配
+
+关键词匹配规则: 文本和关键词都按词切分并转为小写(中文按单字切分),
+关键词中的词需要在拍品文本中连续出现,最后一个词按前缀匹配。
+例如 "gold" 匹配 "Golden","double eagle" 匹配 "Double Eagles",
+"lot 2-" 匹配 "Lot 2-1"。
+"""
+
+import re
+import bisect
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+# 中文按单字切分,其他文字按连续的字母数字切分
+TOKEN_PATTERN = re.compile(r'[\u3400-\u9fff]|[^\W\u3400-\u9fff]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """把文本切分为小写的词"""
+    return TOKEN_PATTERN.findall(text.casefold()) if text else []
+
+
+def lot_text(lot: Dict) -> str:
+    """拍品参与关键词匹配的文本: 标题和描述"""
+    return f"{lot.get('title') or ''} {lot.get('description') or ''}"
+
+
+class Keyword:
+    """一个切分好的关键词"""
+    
+    __slots__ = ('text', 'tokens', 'phrase')
+    
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        # 在 " 词 词 词" 形式的规范化文本中查找,实现连续出现和末词前缀匹配
+        self.phrase = ' ' + ' '.join(self.tokens)
+    
+    def matches(self, normalized: str) -> bool:
+        return bool(self.tokens) and self.phrase in normalized
+
+
+class LotQuery:
+    """
+    关键词查询
+    
+    any_of 中任一关键词匹配、all_of 中所有关键词都匹配、none_of 中没有关键词匹配的拍品
+    符合查询。any_of 和 all_of 都为空时,除 none_of 外的所有拍品都符合。
+    """
+    
+    def __init__(self, any_of: Optional[List[str]] = None,
+                 all_of: Optional[List[str]] = None,
+                 none_of: Optional[List[str]] = None):
+        self.any_of = [Keyword(k) for k in any_of or [] if tokenize(k)]
+        self.all_of = [Keyword(k) for k in all_of or [] if tokenize(k)]
+        self.none_of = [Keyword(k) for k in none_of or [] if tokenize(k)]
+    
+    @property
+    def is_empty(self) -> bool:
+        return not (self.any_of or self.all_of or self.none_of)
+    
+    def matches(self, lot: Dict) -> bool:
+        """逐个拍品判断,用于流式过滤"""
+        return self.matches_normalized(' ' + ' '.join(tokenize(lot_text(lot))))
+    
+    def matches_normalized(self, normalized: str) -> bool:
+        if self.any_of and not any(k.matches(normalized) for k in self.any_of):
+            return False
+        if not all(k.matches(normalized) for k in self.all_of):
+            return False
+        return not any(k.matches(normalized) for k in self.none_of)
+
+
+class KeywordIndex:
+    """
+    拍品倒排索引
+    
+    词 -> 拍品序号集合。拍品可以随抓取逐个加入,查询时按序号顺序返回。
+    前缀匹配通过有序词表二分查找,词表在加入新词后的第一次查询时重新排序。
+    """
+    
+    def __init__(self, lots: Optional[Iterable[Dict]] = None):
+        self.lots: List[Dict] = []
+        self._normalized: List[str] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        
+        if lots is not None:
+            self.add_many(lots)
+    
+    def __len__(self) -> int:
+        return len(self.lots)
+    
+    def add(self, lot: Dict) -> int:
+        """加入一个拍品,返回其序号"""
+        lot_id = len(self.lots)
+        tokens = tokenize(lot_text(lot))
+        
+        self.lots.append(lot)
+        self._normalized.append(' ' + ' '.join(tokens))
+        
+        for token in set(tokens):
+            posting = self._postings.get(token)
+            if posting is None:
+                self._postings[token] = posting = set()
+                self._vocabulary_dirty = True
+            posting.add(lot_id)
+        
+        return lot_id
+    
+    def add_many(self, lots: Iterable[Dict]) -> int:
+        """加入多个拍品,返回加入的数量"""
+        count = 0
+        for lot in lots:
+            self.add(lot)
+            count += 1
+        return count
+    
+    def tee(self, lots: Iterable[Dict]) -> Iterator[Dict]:
+        """原样产出拍品流,同时加入索引"""
+        for lot in lots:
+            self.add(lot)
+            yield lot
+    
+    def search(self, query: LotQuery) -> List[Dict]:
+        """返回符合查询的拍品,保持加入顺序"""
+        return [self.lots[lot_id] for lot_id in sorted(self._search_ids(query))]
+    
+    def filter(self, keywords: Optional[List[str]] = None,
+               all_keywords: Optional[List[str]] = None,
+               exclude_keywords: Optional[List[str]] = None) -> List[Dict]:
+        """
+        按关键词过滤
+        
+        Args:
+            keywords: 任一匹配即可(OR)
+            all_keywords: 需要全部匹配(AND)
+            exclude_keywords: 匹配任一即排除(NOT)
+        """
+        return self.search(LotQuery(keywords, all_keywords, exclude_keywords))
+    
+    def _search_ids(self, query: LotQuery) -> Set[int]:
+        if query.any_of:
+            ids = set()
+            for keyword in query.any_of:
+                ids |= self._keyword_ids(keyword)
+        else:
+            ids = None
+        
+        for keyword in query.all_of:
+            matched = self._keyword_ids(keyword)
+            ids = matched if ids is None else ids & matched
+            if not ids:
+                return set()
+        
+        if ids is None:
+            ids = set(range(len(self.lots)))
+        
+        for keyword in query.none_of:
+            ids -= self._keyword_ids(keyword)
+        
+        return ids
+    
+    def _keyword_ids(self, keyword: Keyword) -> Set[int]:
+        """包含关键词的拍品序号"""
+        *exact, last = keyword.tokens
+        
+        ids = self._prefix_ids(last)
+        for token in exact:
+            if not ids:
+                return ids
+            ids = ids & self._postings.get(token, set())
+        
+        # 多个词的关键词还需确认词是连续出现的
+        if exact:
+            ids = {lot_id for lot_id in ids if keyword.phrase in self._normalized[lot_id]}
+        
+        return ids
+    
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        """包含以 prefix 开头的词的拍品序号"""
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        
+        vocabulary = self._vocabulary
+        ids = set()
+        position = bisect.bisect_left(vocabulary, prefix)
+        while position < len(vocabulary) and vocabulary[position].startswith(prefix):
+            ids |= self._postings[vocabulary[position]]
+            position += 1
+        return ids
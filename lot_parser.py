@@ -0,0 +1,192 @@
+"""
+拍品解析模块 - 预编译的选择器配置和拍品字段提取计划
+"""
+
+import re
+import logging
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+from bs4 import NavigableString, SoupStrainer, Tag
+
+logger = logging.getLogger(__name__)
+
+
+class SelectorProfile:
+    """
+    站点选择器配置
+    
+    描述如何在列表页面中找到拍品容器,以及如何在容器中找到各个字段。
+    所有正则在创建配置时编译一次。
+    """
+    
+    def __init__(self,
+                 name: str,
+                 container_tags: Sequence[str] = ('div', 'article', 'li'),
+                 container_class: str = r'lot|item|product',
+                 pagination_class: str = r'pag',
+                 lot_number_text: str = r'\b\d{5,6}\b',
+                 title_tags: Sequence[str] = ('h1', 'h2', 'h3', 'h4', 'a'),
+                 title_class: str = r'title|name',
+                 description_tags: Sequence[str] = ('p', 'div'),
+                 description_class: str = r'desc|detail',
+                 price_text: str = r'\$\s*\d+',
+                 price_value: str = r'\$\s*(\d+(?:,\d{3})*)',
+                 feed_url: Optional[str] = None):
+        """
+        Args:
+            name: 配置名称
+            container_tags: 拍品容器的标签名
+            container_class: 拍品容器 class 的匹配正则
+            pagination_class: 分页区域 class 的匹配正则
+            lot_number_text: 拍品编号文本的匹配正则
+            title_tags / title_class: 标题元素的标签名和 class 正则
+            description_tags / description_class: 描述元素的标签名和 class 正则
+            price_text: 价格文本的匹配正则
+            price_value: 从价格文本中提取数值的正则,第一个分组为金额
+            feed_url: 站点的 JSON 拍品接口模板,可使用 {auction_url}、{auction_id}、{page};
+                      配置后直接请求 JSON 接口,不抓取 HTML 页面
+        """
+        self.name = name
+        self.container_tags = list(container_tags)
+        self.container_class = re.compile(container_class, re.I)
+        self.pagination_class = re.compile(pagination_class, re.I)
+        self.lot_number_text = re.compile(lot_number_text)
+        self.title_tags = frozenset(title_tags)
+        self.title_class = re.compile(title_class, re.I)
+        self.description_tags = frozenset(description_tags)
+        self.description_class = re.compile(description_class, re.I)
+        self.price_text = re.compile(price_text)
+        self.price_value = re.compile(price_value)
+        self.feed_url = feed_url
+        
+        # 只构建拍品容器和分页区域的节点,跳过导航、样式、页脚等无关内容
+        self.strainer = SoupStrainer(class_=re.compile(f'{container_class}|{pagination_class}', re.I))
+        # 已从结构化数据得到拍品时只需要分页区域
+        self.pagination_strainer = SoupStrainer(class_=self.pagination_class)
+        # 不解析 HTML、粗略统计拍品容器的开始标签
+        tags = '|'.join(map(re.escape, self.container_tags))
+        self.container_marker = re.compile(
+            rf'<(?:{tags})\b[^>]*?\bclass\s*=\s*["\']?[^"\'>]*?(?:{container_class})', re.I)
+    
+    def count_container_markers(self, html: str) -> int:
+        """HTML 中可能是拍品容器的开始标签数,只作为是否需要解析 HTML 的依据"""
+        return sum(1 for _ in self.container_marker.finditer(html))
+
+
+DEFAULT_PROFILE = SelectorProfile("default")
+
+# 按主机名注册的站点配置,未注册的站点使用 DEFAULT_PROFILE
+SITE_PROFILES: Dict[str, SelectorProfile] = {
+    "auctions.stacksbowers.com": SelectorProfile("stacksbowers"),
+}
+
+
+def register_site_profile(host: str, profile: SelectorProfile):
+    """注册站点选择器配置"""
+    SITE_PROFILES[host.lower()] = profile
+
+
+def get_site_profile(url: Optional[str] = None) -> SelectorProfile:
+    """根据页面 URL 的主机名选择站点配置"""
+    if url:
+        host = (urlsplit(url).hostname or "").lower()
+        if host in SITE_PROFILES:
+            return SITE_PROFILES[host]
+    return DEFAULT_PROFILE
+
+
+def _within(node, tags: List[Tag], container: Tag) -> bool:
+    """node 是否位于 tags 中某个元素内(只向上查找到 container)"""
+    if not tags:
+        return False
+    for parent in node.parents:
+        if parent is container:
+            return False
+        if any(parent is tag for tag in tags):
+            return True
+    return False
+
+
+def _has_class(tag: Tag, pattern) -> bool:
+    classes = tag.get('class')
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        classes = [classes]
+    return any(pattern.search(value) for value in classes)
+
+
+class ExtractionPlan:
+    """
+    拍品字段提取计划
+    
+    对每个容器只遍历一次子树,同时收集编号、标题、描述、价格和图片,
+    所有字段都找到后提前结束。每个字段取文档顺序中的第一个匹配,
+    与逐字段调用 find() 的结果一致;标题和描述中的金额(如 "Saint-Gaudens $20")
+    是面值而不是出价,不作为价格。
+    """
+    
+    def __init__(self, profile: SelectorProfile = DEFAULT_PROFILE):
+        self.profile = profile
+    
+    def find_containers(self, soup) -> List[Tag]:
+        """查找页面中所有可能的拍品容器"""
+        return soup.find_all(self.profile.container_tags, class_=self.profile.container_class)
+    
+    def extract(self, container: Tag) -> Optional[Dict]:
+        """
+        从容器中提取拍品信息
+        
+        Returns:
+            拍品字段字典,一个字段都没有找到时返回 None
+        """
+        profile = self.profile
+        lot_number = title = description = current_bid = image_url = None
+        need_number = need_title = need_description = need_price = need_image = True
+        # 已找到的标题和描述元素,其中的文本不参与价格匹配
+        text_fields: List[Tag] = []
+        
+        for node in container.descendants:
+            if isinstance(node, NavigableString):
+                if need_number and profile.lot_number_text.search(node):
+                    lot_number = node.strip()
+                    need_number = False
+                if need_price and profile.price_text.search(node) and not _within(node, text_fields, container):
+                    match = profile.price_value.search(node)
+                    if match:
+                        current_bid = match.group(1).replace(',', '')
+                    need_price = False
+            
+            elif isinstance(node, Tag):
+                name = node.name
+                if need_title and name in profile.title_tags and _has_class(node, profile.title_class):
+                    title = node.get_text(strip=True)
+                    need_title = False
+                    text_fields.append(node)
+                if need_description and name in profile.description_tags \
+                        and _has_class(node, profile.description_class):
+                    description = node.get_text(strip=True)
+                    need_description = False
+                    text_fields.append(node)
+                if need_image and name == 'img':
+                    image_url = node.get('src') or None
+                    need_image = False
+            
+            if not (need_number or need_title or need_description or need_price or need_image):
+                break
+        
+        # 按固定顺序组装,保证导出文件的字段顺序稳定
+        lot_data = {}
+        if lot_number is not None:
+            lot_data['lot_number'] = lot_number
+        if title is not None:
+            lot_data['title'] = title
+        if description is not None:
+            lot_data['description'] = description
+        if current_bid is not None:
+            lot_data['current_bid'] = current_bid
+        if image_url is not None:
+            lot_data['image_url'] = image_url
+        
+        return lot_data if lot_data else None
@@ -0,0 +1,262 @@
+"""
+拍品记录模块 - 紧凑的拍品和拍卖场次记录
+
+Lot / Auction 使用 __slots__,没有每个实例的 __dict__;同一拍卖场次的拍品共享一个
+Auction 对象,而不是在每个拍品中复制 auction_title / auction_url 字符串。
+LotTable 按列保存大量拍品,出价保存在 array('d') 中,便于批量计算。
+只在写入 JSON / 文件或返回工具结果时才转换为字典。
+"""
+
+import re
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+# 有独立字段的拍品字段,其余字段保存在 Lot.extra
+LOT_FIELDS = ('lot_number', 'title', 'description', 'current_bid', 'image_url')
+AUCTION_FIELDS = ('auction_title', 'auction_date', 'auction_url')
+
+BID_AMOUNT_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+
+
+def parse_bid_amount(value) -> Optional[float]:
+    """把 '1,250' / '$1250' / 1250 这样的出价转换为数值"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = BID_AMOUNT_PATTERN.search(str(value).replace(',', ''))
+    return float(match.group()) if match else None
+
+
+def format_bid_amount(value: Optional[float]) -> Optional[str]:
+    """数值出价转换回抓取结果中的字符串形式,如 1250.0 -> '1250'"""
+    if value is None:
+        return None
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+class Auction:
+    """
+    拍卖场次记录
+    
+    通过 Auction.intern() 获取,同一 URL 在进程内只有一个对象。
+    共享表最多保留 max_registered 个场次,超出后淘汰最久未使用的场次;
+    已淘汰场次的拍品仍然持有原对象,之后再获取同一 URL 会得到新的对象。
+    """
+    
+    __slots__ = ('url', 'title', 'date', 'category', 'lots_count')
+    
+    max_registered = 4096
+    _registry: 'OrderedDict[str, Auction]' = OrderedDict()
+    _registry_lock = threading.Lock()
+    
+    def __init__(self, url: str, title: Optional[str] = None, date: Optional[str] = None,
+                 category: Optional[str] = None, lots_count: Optional[int] = None):
+        self.url = url
+        self.title = title
+        self.date = date
+        self.category = category
+        self.lots_count = lots_count
+    
+    @classmethod
+    def intern(cls, url: str, title: Optional[str] = None, date: Optional[str] = None,
+               category: Optional[str] = None, lots_count: Optional[int] = None) -> 'Auction':
+        """获取 URL 对应的共享拍卖场次对象,传入的非空字段会更新到该对象"""
+        with cls._registry_lock:
+            auction = cls._registry.get(url)
+            if auction is None:
+                auction = cls._registry[url] = cls(url)
+                while len(cls._registry) > cls.max_registered:
+                    cls._registry.popitem(last=False)
+            else:
+                cls._registry.move_to_end(url)
+            for name, value in (('title', title), ('date', date), ('category', category),
+                                ('lots_count', lots_count)):
+                if value is not None:
+                    setattr(auction, name, value)
+            return auction
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Auction':
+        """从 search_auctions 返回的拍卖场次字典获取共享对象"""
+        return cls.intern(data['url'], data.get('title'), data.get('date'),
+                          data.get('category'), data.get('lots_count'))
+    
+    def to_dict(self) -> Dict:
+        return {
+            "title": self.title,
+            "date": self.date,
+            "lots_count": self.lots_count,
+            "category": self.category,
+            "url": self.url
+        }
+    
+    def __repr__(self) -> str:
+        return f"Auction({self.url!r})"
+
+
+class Lot:
+    """
+    拍品记录
+    
+    current_bid 为数值(没有出价时为 None),所属拍卖场次以 Auction 引用保存。
+    get() 与字典的 get() 相同,按关键词过滤等只读取字段的代码可以直接使用。
+    """
+    
+    __slots__ = ('lot_number', 'title', 'description', 'current_bid', 'image_url', 'auction', 'extra')
+    
+    def __init__(self, lot_number: Optional[str] = None, title: Optional[str] = None,
+                 description: Optional[str] = None, current_bid: Optional[float] = None,
+                 image_url: Optional[str] = None, auction: Optional[Auction] = None,
+                 extra: Optional[Dict] = None):
+        self.lot_number = lot_number
+        self.title = title
+        self.description = description
+        self.current_bid = current_bid
+        self.image_url = image_url
+        self.auction = auction
+        self.extra = extra
+    
+    @classmethod
+    def from_dict(cls, data: Dict, auction: Optional[Auction] = None) -> 'Lot':
+        """
+        从抓取结果的拍品字典创建记录
+        
+        Args:
+            data: 拍品字典
+            auction: 所属拍卖场次;未传入时从字典中的 auction_url 等字段获取
+        """
+        if auction is None and data.get('auction_url'):
+            auction = Auction.intern(data['auction_url'], data.get('auction_title'), data.get('auction_date'))
+        
+        extra = {k: v for k, v in data.items() if k not in LOT_FIELDS and k not in AUCTION_FIELDS}
+        return cls(data.get('lot_number'), data.get('title'), data.get('description'),
+                   parse_bid_amount(data.get('current_bid')), data.get('image_url'),
+                   auction, extra or None)
+    
+    def get(self, name: str, default=None):
+        """按字典字段名读取"""
+        if name == 'current_bid':
+            value = format_bid_amount(self.current_bid)
+        elif name in LOT_FIELDS:
+            value = getattr(self, name)
+        elif name in AUCTION_FIELDS:
+            value = getattr(self.auction, name[len('auction_'):]) if self.auction else None
+        else:
+            value = self.extra.get(name) if self.extra else None
+        return default if value is None else value
+    
+    def to_dict(self) -> Dict:
+        """转换为与抓取结果相同结构的字典,字段顺序与原来附加拍卖场次信息后的一致"""
+        data = {}
+        for name in LOT_FIELDS:
+            value = self.get(name)
+            if value is not None:
+                data[name] = value
+        if self.extra:
+            data.update(self.extra)
+        if self.auction is not None:
+            data['auction_title'] = self.auction.title
+            data['auction_date'] = self.auction.date
+            data['auction_url'] = self.auction.url
+        return data
+    
+    def __repr__(self) -> str:
+        return f"Lot({self.lot_number!r}, {self.title!r})"
+
+
+def as_dict(lot: Union[Lot, Dict]) -> Dict:
+    """拍品记录或字典统一转换为字典"""
+    return lot.to_dict() if isinstance(lot, Lot) else lot
+
+
+class LotTable:
+    """
+    按列保存的拍品集合
+    
+    文本字段各保存在一个列表中,出价保存在 array('d') 中(没有出价为 NaN),
+    所属拍卖场次保存为 auctions 列表中的下标,不常见的附加字段按行号稀疏保存。
+    """
+    
+    def __init__(self, lots: Optional[Iterable[Union[Lot, Dict]]] = None):
+        self.lot_numbers: List[Optional[str]] = []
+        self.titles: List[Optional[str]] = []
+        self.descriptions: List[Optional[str]] = []
+        self.image_urls: List[Optional[str]] = []
+        self.bids = array('d')
+        self.auction_ids = array('i')
+        self.auctions: List[Auction] = []
+        self.extras: Dict[int, Dict] = {}
+        self._auction_index: Dict[str, int] = {}
+        
+        if lots is not None:
+            self.extend(lots)
+    
+    def __len__(self) -> int:
+        return len(self.lot_numbers)
+    
+    def append(self, lot: Union[Lot, Dict], auction: Optional[Auction] = None):
+        """加入一个拍品记录或拍品字典"""
+        if not isinstance(lot, Lot):
+            lot = Lot.from_dict(lot, auction)
+        elif auction is not None:
+            lot.auction = auction
+        
+        if lot.extra:
+            self.extras[len(self)] = lot.extra
+        self.lot_numbers.append(lot.lot_number)
+        self.titles.append(lot.title)
+        self.descriptions.append(lot.description)
+        self.image_urls.append(lot.image_url)
+        self.bids.append(math.nan if lot.current_bid is None else lot.current_bid)
+        self.auction_ids.append(self._auction_id(lot.auction))
+    
+    def extend(self, lots: Iterable[Union[Lot, Dict]], auction: Optional[Auction] = None):
+        for lot in lots:
+            self.append(lot, auction)
+    
+    def _auction_id(self, auction: Optional[Auction]) -> int:
+        if auction is None:
+            return -1
+        auction_id = self._auction_index.get(auction.url)
+        if auction_id is None:
+            auction_id = self._auction_index[auction.url] = len(self.auctions)
+            self.auctions.append(auction)
+        return auction_id
+    
+    def __getitem__(self, row: int) -> Lot:
+        """按行号取出拍品记录"""
+        bid = self.bids[row]
+        auction_id = self.auction_ids[row]
+        return Lot(self.lot_numbers[row], self.titles[row], self.descriptions[row],
+                   None if math.isnan(bid) else bid, self.image_urls[row],
+                   self.auctions[auction_id] if auction_id >= 0 else None,
+                   self.extras.get(row))
+    
+    def __iter__(self) -> Iterator[Lot]:
+        for row in range(len(self)):
+            yield self[row]
+    
+    def iter_dicts(self) -> Iterator[Dict]:
+        """逐个产出拍品字典,用于写文件和返回工具结果"""
+        for lot in self:
+            yield lot.to_dict()
+    
+    def to_dicts(self) -> List[Dict]:
+        return list(self.iter_dicts())
+    
+    def rows_with_bid(self, min_bid: Optional[float] = None, max_bid: Optional[float] = None) -> List[int]:
+        """出价在范围内的行号,没有出价的拍品不计入"""
+        low = -math.inf if min_bid is None else min_bid
+        high = math.inf if max_bid is None else max_bid
+        return [row for row, bid in enumerate(self.bids) if low <= bid <= high]
+    
+    def select(self, rows: Iterable[int]) -> 'LotTable':
+        """按行号取出子集,共享拍卖场次对象"""
+        table = LotTable()
+        for row in rows:
+            table.append(self[row])
+        return table
@@ -2,243 +2,984 @@
 拍品抓取模块 - 深入拍卖场次获取详细拍品列表
 """
 
-import requests
 import json
 import base64
-from typing import List, Dict, Optional
+from collections import OrderedDict, deque
+from typing import List, Dict, Optional, Callable, Iterable, Iterator, Sequence, Tuple
 from bs4 import BeautifulSoup
 import re
 import logging
 import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
 
-from config import ZYTE_API_KEY
+from config import LOT_FETCH_WORKERS, LOT_FETCH_RATE, LOT_FETCH_BURST, CACHE_ENABLED, LOT_PAGE_CACHE_SECONDS
+from page_cache import PageCache, get_page_cache
+from http_client import FetchError, HttpClient, get_http_client
+from fetch_strategy import FetchStrategy, is_challenge_page
+from lot_feed import (
+    build_feed_url, find_total_pages, iter_embedded_json, iter_lot_objects, iter_normalized_lots, looks_like_json
+)
+from single_flight import SingleFlight
+from lot_index import KeywordIndex, LotQuery
+from lot_parser import ExtractionPlan, SelectorProfile, get_site_profile
+from lot_records import Auction, LotTable, as_dict
+from lot_snapshot import (
+    AuctionSnapshot, SnapshotStore, conditional_headers, content_hash, diff_lot, lot_key, response_validators
+)
 
 logger = logging.getLogger(__name__)
 
+# HTML 解析器后端: 安装了 lxml 时使用 lxml,否则使用标准库 html.parser
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+PAGE_OF_PATTERN = re.compile(r'Page\s+\d+\s+of\s+(\d+)', re.I)
+PAGE_COUNT_PATTERN = re.compile(r'of\s+(\d+)', re.I)
+CHARSET_PATTERN = re.compile(r'charset=([\w-]+)', re.I)
+
+# 页面不论来自哪种抓取模式都按同一个键缓存
+PAGE_CACHE_MODE = "lot-page"
+
+# 保留的抓取时解析结果数,不少于并发抓取的页面数
+PARSED_PAGES_KEPT = 16
+
+
+def merge_page_lots(structured: List[Dict], scanned: List[Dict]) -> List[Dict]:
+    """按 HTML 中的顺序合并同一页面两种来源的拍品,同一拍品优先使用结构化数据"""
+    by_key = {lot_key(lot): lot for lot in structured}
+    merged = [by_key.pop(lot_key(lot), lot) for lot in scanned]
+    return merged + list(by_key.values())
+
+
+class RateLimiter:
+    """令牌桶限速器,多个抓取线程共享同一个实例"""
+    
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        Args:
+            rate: 每秒补充的令牌数,小于等于 0 表示不限速
+            capacity: 令牌桶容量,即允许的突发请求数
+        """
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """获取一个令牌,令牌不足时阻塞等待"""
+        if self.rate <= 0:
+            return
+        
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                wait = (1 - self._tokens) / self.rate
+            
+            time.sleep(wait)
+
+
+class ScrapeProgress:
+    """
+    单个拍卖场次的抓取进度,线程安全,可在抓取过程中随时读取
+    
+    cancel 事件被设置后不再抓取新的页面,正在等待的分页也不再等待。
+    """
+    
+    def __init__(self, auction_url: str, cancel: Optional[threading.Event] = None):
+        self.auction_url = auction_url
+        self.cancel_event = cancel or threading.Event()
+        # 本次抓取的页数(受 max_pages 限制)和站点上的总页数
+        self.total_pages: Optional[int] = None
+        self.site_pages: Optional[int] = None
+        self.pages_done = 0
+        self.lots_found = 0
+        self._failed_pages: List[Dict] = []
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def page_done(self, lots_count: int):
+        with self._lock:
+            self.pages_done += 1
+            self.lots_found += lots_count
+    
+    def page_failed(self, page: int, page_url: str, error: str):
+        with self._lock:
+            self.pages_done += 1
+            self._failed_pages.append({
+                "page": page,
+                "url": page_url,
+                "error": error
+            })
+            self._failed_pages.sort(key=lambda f: f['page'])
+    
+    @property
+    def failed_pages(self) -> List[Dict]:
+        """获取失败的页面(按页码排序的副本)"""
+        with self._lock:
+            return list(self._failed_pages)
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+    
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at = time.time()
+    
+    def update_from(self, other: 'ScrapeProgress'):
+        """复制另一次抓取的页数、拍品数和失败页面,用于共享了其他调用方抓取结果的调用方"""
+        failed_pages = other.failed_pages
+        with self._lock:
+            self.total_pages = other.total_pages
+            self.site_pages = other.site_pages
+            self.pages_done = other.pages_done
+            self.lots_found = other.lots_found
+            self._failed_pages = failed_pages
+        self.finish()
+    
+    @property
+    def elapsed(self) -> float:
+        return (self.finished_at or time.time()) - self.started_at
+    
+    def eta_seconds(self) -> Optional[float]:
+        """按已完成页面的平均耗时估算剩余时间"""
+        with self._lock:
+            if self.finished_at:
+                return 0.0
+            if not self.total_pages or not self.pages_done:
+                return None
+            remaining = max(0, self.total_pages - self.pages_done)
+            return round(self.elapsed / self.pages_done * remaining, 1)
+    
+    def to_dict(self) -> Dict:
+        eta = self.eta_seconds()
+        failed_pages = self.failed_pages
+        
+        return {
+            "auction_url": self.auction_url,
+            "total_pages": self.total_pages,
+            "pages_done": self.pages_done,
+            "lots_found": self.lots_found,
+            "failed_pages": failed_pages,
+            "elapsed_seconds": round(self.elapsed, 2),
+            "eta_seconds": eta,
+            "finished": self.finished_at is not None
+        }
+
 
 class LotScraper:
     """拍品详细信息抓取器"""
     
-    def __init__(self):
-        self.zyte_api_key = ZYTE_API_KEY
-        self.zyte_url = "https://api.zyte.com/v1/extract"
+    def __init__(self, max_workers: int = LOT_FETCH_WORKERS, rate_limiter: Optional[RateLimiter] = None,
+                 cache: Optional[PageCache] = None, http: Optional[HttpClient] = None,
+                 parser: str = HTML_PARSER, snapshots: Optional[SnapshotStore] = None,
+                 fetch_modes: Optional[Sequence[str]] = None):
+        self.http = http or get_http_client()
+        self.parser = parser
+        # 每个站点配置对应的提取计划,首次使用时创建
+        self._plans: Dict[str, ExtractionPlan] = {}
+        self.max_workers = max(1, max_workers)
+        self.rate_limiter = rate_limiter or RateLimiter(LOT_FETCH_RATE, LOT_FETCH_BURST)
+        self.cache = cache or (get_page_cache() if CACHE_ENABLED else None)
+        # 先用便宜的抓取模式,页面是验证页或没有拍品时才升级到浏览器渲染
+        self.fetch_strategy = FetchStrategy(fetch_modes)
+        # 选择抓取模式时解析的页面: URL -> (HTML, 解析结果)
+        self._parsed: OrderedDict = OrderedDict()
+        self._parsed_lock = threading.Lock()
+        # 增量刷新使用的拍品快照
+        self.snapshots = snapshots or SnapshotStore()
+        # 并发抓取同一页面或同一拍卖场次时只请求一次,其余调用方共享结果
+        self.page_flight = SingleFlight("page")
+        self.auction_flight = SingleFlight("auction")
         
-    def fetch_with_zyte(self, url: str) -> Optional[str]:
-        """使用 Zyte API 获取页面内容,绕过 Cloudflare"""
+    def fetch_page(self, url: str, use_cache: bool = True) -> Optional[str]:
+        """获取页面内容,先尝试便宜的抓取模式,必要时使用 Zyte 浏览器渲染绕过 Cloudflare"""
         try:
-            # Zyte API 需要 Base64 编码的 API key
-            auth_string = f"{self.zyte_api_key}:"
-            auth_bytes = auth_string.encode('ascii')
-            auth_base64 = base64.b64encode(auth_bytes).decode('ascii')
-            
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Basic {auth_base64}"
-            }
-            
-            payload = {
-                "url": url,
-                "browserHtml": True,
-                "javascript": True,
-                "httpResponseBody": True
-            }
+            return self._fetch_html(url, use_cache)
+        except Exception as e:
+            logger.error(f"页面获取失败: {e}")
+            return None
+    
+    def fetch_with_zyte(self, url: str, use_cache: bool = True) -> Optional[str]:
+        """兼容旧接口,等同于 fetch_page"""
+        return self.fetch_page(url, use_cache)
+    
+    def _fetch_html(self, url: str, use_cache: bool = True, rate_limited: bool = False) -> str:
+        """
+        优先读取页面缓存,未命中时按抓取模式请求并写入缓存
+        
+        拍品列表页包含实时出价,只读取 LOT_PAGE_CACHE_SECONDS 内缓存的页面。
+        
+        同一 URL 已有请求在进行时等待并共享其结果,不重复请求。
+        
+        Args:
+            url: 页面 URL
+            use_cache: 是否读取页面缓存
+            rate_limited: 为 True 时每次实际请求前先获取令牌,缓存命中和合并的请求不消耗令牌
+        """
+        if use_cache and self.cache:
+            html = self.cache.get(url, PAGE_CACHE_MODE, max_age=LOT_PAGE_CACHE_SECONDS)
+            if html:
+                logger.info(f"页面缓存命中: {url}")
+                return html
+        
+        return self.page_flight.do(url, self._download_page, url, rate_limited)
+    
+    def _download_page(self, url: str, rate_limited: bool) -> str:
+        html, _ = self._fetch_adaptive(url, rate_limited=rate_limited)
+        
+        if self.cache:
+            self.cache.set(url, PAGE_CACHE_MODE, html)
+        
+        return html
+    
+    def _fetch_adaptive(self, url: str, validators: Optional[Dict] = None,
+                        rate_limited: bool = False) -> Tuple[Optional[str], Dict]:
+        """
+        按抓取模式从便宜到昂贵依次请求,直到得到可用的页面
+        
+        请求失败或返回 Cloudflare 验证页时升级到下一个模式,最后一个模式返回的页面(验证页除外)
+        总是被接受。页面解析不到拍品时升级确认: 该模式还没有在这个 URL 模式上成功过时逐级升级,
+        已成功过时只用最后一个模式确认一次;更贵的模式也没有拍品时视为空页面,接受并不改变
+        已学到的模式。
+        成功的模式按 URL 模式记住,同一模式的后续页面直接从该模式开始。
+        
+        判断拍品时的解析结果保留给随后解析同一页面的 parse_page,页面不会解析两次。
+        
+        Returns:
+            (HTML, 本次响应的 ETag / Last-Modified);HTML 为 None 表示页面未修改
+        """
+        error: Optional[Exception] = None
+        # 较便宜的模式返回的没有拍品的页面,更贵的模式都失败时仍使用它
+        empty: Optional[Tuple[str, Dict]] = None
+        modes = self.fetch_strategy.modes_for(url)
+        proven = self.fetch_strategy.learned_mode(url)
+        
+        if validators and modes[0] == "zyte-browser" and "zyte-http" in self.fetch_strategy.modes:
+            unchanged = self._probe_not_modified(url, validators, rate_limited)
+            if unchanged is not None:
+                return None, unchanged
+        
+        confirm_last = False
+        for mode in modes:
+            if confirm_last and not self.fetch_strategy.is_last(mode):
+                continue
+            if rate_limited:
+                self.rate_limiter.acquire()
             
-            logger.info(f"使用 Zyte API 获取: {url}")
-            response = requests.post(self.zyte_url, headers=headers, json=payload, timeout=60)
+            start = time.perf_counter()
+            try:
+                html, page_validators = self._request_mode(mode, url, validators)
+            except Exception as e:
+                self.fetch_strategy.record(mode, time.perf_counter() - start, "errors")
+                logger.warning(f"{mode} 抓取失败: {e}")
+                error = e
+                continue
+            latency = time.perf_counter() - start
             
-            if response.status_code == 200:
-                data = response.json()
-                html = data.get("browserHtml") or data.get("httpResponseBody")
-                if html:
-                    logger.info(f"成功获取页面内容,长度: {len(html)}")
-                    return html
-                else:
-                    logger.error("Zyte API 返回数据中没有 HTML 内容")
-                    return None
+            if html is not None and is_challenge_page(html):
+                reason = "是 Cloudflare 验证页"
             else:
-                logger.error(f"Zyte API 请求失败: {response.status_code}, {response.text}")
-                return None
-                
+                confirm = not self.fetch_strategy.is_last(mode)
+                parsed = self.parse_page(html, url) if html is not None and (confirm or empty) else None
+                if parsed is not None and not parsed[0] and confirm:
+                    # 可能需要浏览器渲染、被软封锁,也可能本来就是空页面: 用更贵的模式确认。
+                    # 已在这个 URL 模式上成功过的模式只确认一次,直接使用最后一个模式
+                    reason = "中没有拍品"
+                    empty = empty or (html, page_validators)
+                    if mode == proven:
+                        confirm_last = True
+                else:
+                    self.fetch_strategy.record(mode, latency, "accepted")
+                    if not (empty and parsed is not None and not parsed[0]):
+                        self.fetch_strategy.learn(url, mode)
+                    if parsed is not None:
+                        self._keep_parsed(url, html, parsed)
+                    return html, page_validators
+            
+            self.fetch_strategy.record(mode, latency, "escalated")
+            logger.info(f"{mode} 返回的页面{reason},升级抓取模式: {url}")
+            error = RuntimeError(f"{mode} 返回的页面{reason}")
+        
+        if empty:
+            logger.info(f"更贵的抓取模式都失败,使用没有拍品的页面: {url}")
+            return empty
+        raise error
+    
+    def _probe_not_modified(self, url: str, validators: Dict, rate_limited: bool = False) -> Optional[Dict]:
+        """
+        浏览器渲染无法发送条件请求: 先用 zyte-http 发送条件请求,页面未修改时不再渲染
+        
+        Returns:
+            页面未修改时返回校验信息,否则返回 None(由调用方按抓取模式正常请求)
+        """
+        if not conditional_headers(validators):
+            return None
+        
+        if rate_limited:
+            self.rate_limiter.acquire()
+        
+        start = time.perf_counter()
+        try:
+            html, page_validators = self._request_zyte_http(url, validators)
         except Exception as e:
-            logger.error(f"Zyte API 调用异常: {e}")
+            self.fetch_strategy.record("zyte-http", time.perf_counter() - start, "errors")
+            logger.warning(f"zyte-http 条件请求失败: {e}")
             return None
+        
+        self.fetch_strategy.record("zyte-http", time.perf_counter() - start,
+                                   "accepted" if html is None else "escalated")
+        if html is None:
+            logger.info(f"页面未修改,跳过浏览器渲染: {url}")
+            return page_validators
+        return None
+    
+    def _request_mode(self, mode: str, url: str, validators: Optional[Dict] = None) -> Tuple[Optional[str], Dict]:
+        """用指定的抓取模式请求页面"""
+        if mode == "http":
+            return self._request_http(url, validators)
+        if mode == "zyte-http":
+            return self._request_zyte_http(url, validators)
+        return self._request_zyte(url, validators)
+    
+    def _request_http(self, url: str, validators: Optional[Dict] = None) -> Tuple[Optional[str], Dict]:
+        """
+        直接 HTTP 请求,有 ETag / Last-Modified 时发送条件请求
+        
+        失败时直接升级抓取模式,不重试。封锁请求的验证页原样返回,由调用方识别。
+        """
+        headers = conditional_headers(validators)
+        
+        logger.info(f"HTTP 请求: {url}")
+        response = self.http.get(url, headers=headers, retries=0)
+        
+        if response.status_code == 304 and validators:
+            return None, {k: v for k, v in validators.items() if k in ('etag', 'last_modified')}
+        if response.status_code != 200 and not is_challenge_page(response.text):
+            raise FetchError(f"HTTP 请求失败: {response.status_code}", response.status_code)
+        return response.text, response_validators(response.headers)
     
-    def parse_lot_list(self, html: str) -> List[Dict]:
+    def _request_zyte_http(self, url: str, validators: Optional[Dict] = None) -> Tuple[Optional[str], Dict]:
+        """
+        调用 Zyte API 获取原始响应,不渲染页面
+        
+        有 ETag / Last-Modified 时通过 customHttpRequestHeaders 发送条件请求,
+        站点返回 304 时 HTML 为 None。
+        """
+        logger.info(f"使用 Zyte API 获取原始响应: {url}")
+        options = {"httpResponseBody": True, "httpResponseHeaders": True}
+        headers = conditional_headers(validators)
+        if headers:
+            options["customHttpRequestHeaders"] = [{"name": k, "value": v} for k, v in headers.items()]
+        data = self.http.zyte_extract(url, **options)
+        
+        if data.get("statusCode") == 304 and headers:
+            return None, {k: v for k, v in validators.items() if k in ('etag', 'last_modified')}
+        
+        body = data.get("httpResponseBody")
+        if not body:
+            raise RuntimeError("Zyte API 返回数据中没有响应内容")
+        
+        headers = {h.get("name", "").lower(): h.get("value", "") for h in data.get("httpResponseHeaders") or []}
+        charset = CHARSET_PATTERN.search(headers.get("content-type", ""))
+        html = base64.b64decode(body).decode(charset.group(1) if charset else "utf-8", errors="replace")
+        return html, response_validators(data.get("httpResponseHeaders"))
+    
+    def _request_zyte(self, url: str, validators: Optional[Dict] = None) -> Tuple[Optional[str], Dict]:
+        """
+        调用 Zyte API 浏览器渲染获取页面内容,失败时抛出异常以便调用方记录原因
+        
+        browserHtml 不能与 httpResponseBody 同时请求(Zyte API 返回 422),只附带响应头。
+        
+        Args:
+            url: 页面 URL
+            validators: 上次抓取时的 ETag / Last-Modified。浏览器渲染无法发送条件请求,
+                        这里总是返回完整页面;条件请求由 _probe_not_modified 通过 zyte-http 发送
+        
+        Returns:
+            (HTML, 本次响应的 ETag / Last-Modified);HTML 为 None 表示页面未修改
+        """
+        logger.info(f"使用 Zyte API 获取: {url}")
+        data = self.http.zyte_extract(url, browserHtml=True, javascript=True, httpResponseHeaders=True)
+        
+        html = data.get("browserHtml")
+        if not html:
+            raise RuntimeError("Zyte API 返回数据中没有 HTML 内容")
+        
+        logger.info(f"成功获取页面内容,长度: {len(html)}")
+        return html, response_validators(data.get("httpResponseHeaders"))
+    
+    def fetch_stats(self) -> Dict:
+        """页面缓存、请求合并和各抓取模式的统计信息"""
+        return {
+            "cache": self.cache.stats() if self.cache else None,
+            "modes": self.fetch_strategy.stats(),
+            "pages": self.page_flight.stats(),
+            "auctions": self.auction_flight.stats()
+        }
+    
+    def parse_lot_list(self, html: str, url: Optional[str] = None) -> List[Dict]:
         """解析拍品列表页面"""
+        lots, _ = self.parse_page(html, url)
+        return lots
+    
+    def parse_page(self, html: str, url: Optional[str] = None) -> Tuple[List[Dict], int]:
+        """
+        解析拍品列表页面,一次解析同时得到拍品和总页数
+        
+        先查找结构化数据(JSON 接口的响应或页面内嵌的 JSON)。HTML 页面中按正则粗略统计的
+        拍品容器不多于结构化数据中的拍品时不再解析 HTML 拍品容器;多于时解析 HTML 确认,
+        容器确实更多时按 HTML 中的顺序合并两者。
+        没有结构化数据时按站点选择器配置解析 HTML。
+        
+        Args:
+            html: 页面 HTML 或 JSON 接口的响应
+            url: 页面 URL,用于选择站点选择器配置
+        
+        Returns:
+            (拍品列表, 总页数)
+        """
+        parsed = self._take_parsed(url, html)
+        if parsed is not None:
+            return parsed
+        
         lots = []
+        total_pages = 1
+        plan = self.get_plan(get_site_profile(url))
         
         try:
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # 尝试多种方式查找拍品信息
-            # 方法 1: 查找包含 lot 信息的容器
-            lot_containers = soup.find_all(['div', 'article', 'li'], class_=re.compile(r'lot|item|product', re.I))
+            lots, feed_pages = self._parse_structured(html, url)
             
-            logger.info(f"找到 {len(lot_containers)} 个可能的拍品容器")
-            
-            for container in lot_containers:
-                lot_data = self._extract_lot_from_container(container)
-                if lot_data and lot_data.get('lot_number'):
-                    lots.append(lot_data)
-            
-            # 方法 2: 如果方法 1 没找到,尝试从脚本中提取 JSON 数据
-            if not lots:
-                lots = self._extract_lots_from_scripts(soup)
+            if looks_like_json(html):
+                if feed_pages is not None:
+                    total_pages = feed_pages
+                elif lots:
+                    soup = BeautifulSoup(html, self.parser, parse_only=plan.profile.pagination_strainer)
+                    total_pages = self._get_total_pages(soup, html, plan.profile)
+            elif lots:
+                # 内嵌 JSON 可能只是页面中的小组件(推荐拍品等): 先用正则粗略统计 HTML 中的拍品容器,
+                # 多于结构化数据中的拍品时才解析 HTML,确认后合并 HTML 中的拍品
+                soup = None
+                if plan.profile.count_container_markers(html) > len(lots):
+                    soup = BeautifulSoup(html, self.parser, parse_only=plan.profile.strainer)
+                    if len(plan.find_containers(soup)) > len(lots):
+                        scanned = self._parse_lots(soup, plan)
+                        logger.info(f"结构化数据只有 {len(lots)} 个拍品,合并 HTML 中的 {len(scanned)} 个拍品")
+                        lots = merge_page_lots(lots, scanned)
+                elif feed_pages is None:
+                    soup = BeautifulSoup(html, self.parser, parse_only=plan.profile.pagination_strainer)
+                
+                # 总页数取 JSON 和 HTML 分页中较大的一个,小组件自己的分页不会截断拍卖场次
+                if soup is not None:
+                    total_pages = max(feed_pages or 1, self._get_total_pages(soup, html, plan.profile))
+                else:
+                    match = PAGE_OF_PATTERN.search(html)
+                    total_pages = max(feed_pages, int(match.group(1)) if match else 1)
+            else:
+                soup = BeautifulSoup(html, self.parser, parse_only=plan.profile.strainer)
+                lots = self._parse_lots(soup, plan)
+                total_pages = self._get_total_pages(soup, html, plan.profile)
             
             logger.info(f"成功解析 {len(lots)} 个拍品")
             
         except Exception as e:
             logger.error(f"解析拍品列表失败: {e}")
         
+        return lots, total_pages
+    
+    def _keep_parsed(self, url: str, html: str, parsed: Tuple[List[Dict], int]):
+        """保留抓取时的解析结果,抓取方随后解析同一页面时直接取用"""
+        with self._parsed_lock:
+            self._parsed[url] = (html, parsed)
+            self._parsed.move_to_end(url)
+            while len(self._parsed) > PARSED_PAGES_KEPT:
+                self._parsed.popitem(last=False)
+    
+    def _take_parsed(self, url: Optional[str], html: str) -> Optional[Tuple[List[Dict], int]]:
+        """取出 _keep_parsed 保留的同一页面的解析结果,只使用一次"""
+        with self._parsed_lock:
+            kept = self._parsed.pop(url, None) if self._parsed else None
+        if kept is not None and kept[0] is html:
+            return kept[1]
+        return None
+    
+    def get_plan(self, profile: SelectorProfile) -> ExtractionPlan:
+        """获取站点配置对应的提取计划"""
+        plan = self._plans.get(profile.name)
+        if plan is None:
+            plan = ExtractionPlan(profile)
+            self._plans[profile.name] = plan
+        return plan
+    
+    def _parse_lots(self, soup, plan: Optional[ExtractionPlan] = None) -> List[Dict]:
+        """从拍品容器中提取拍品"""
+        plan = plan or self.get_plan(get_site_profile())
+        lots = []
+        
+        # 尝试多种方式查找拍品信息
+        # 方法 1: 查找包含 lot 信息的容器
+        lot_containers = plan.find_containers(soup)
+        
+        logger.info(f"找到 {len(lot_containers)} 个可能的拍品容器")
+        
+        for container in lot_containers:
+            lot_data = self._extract_lot_from_container(container, plan)
+            if lot_data and lot_data.get('lot_number'):
+                lots.append(lot_data)
+        
         return lots
     
-    def _extract_lot_from_container(self, container) -> Optional[Dict]:
+    def _extract_lot_from_container(self, container,
+                                    plan: Optional[ExtractionPlan] = None) -> Optional[Dict]:
         """从容器中提取拍品信息"""
         try:
-            lot_data = {}
-            
-            # 提取 lot 编号
-            lot_num = container.find(text=re.compile(r'\b\d{5,6}\b'))
-            if lot_num:
-                lot_data['lot_number'] = lot_num.strip()
-            
-            # 提取标题
-            title_elem = container.find(['h1', 'h2', 'h3', 'h4', 'a'], class_=re.compile(r'title|name', re.I))
-            if title_elem:
-                lot_data['title'] = title_elem.get_text(strip=True)
-            
-            # 提取描述
-            desc_elem = container.find(['p', 'div'], class_=re.compile(r'desc|detail', re.I))
-            if desc_elem:
-                lot_data['description'] = desc_elem.get_text(strip=True)
-            
-            # 提取价格
-            price_elem = container.find(text=re.compile(r'\$\s*\d+'))
-            if price_elem:
-                price_match = re.search(r'\$\s*(\d+(?:,\d{3})*)', price_elem)
-                if price_match:
-                    lot_data['current_bid'] = price_match.group(1).replace(',', '')
-            
-            # 提取图片
-            img_elem = container.find('img')
-            if img_elem and img_elem.get('src'):
-                lot_data['image_url'] = img_elem['src']
-            
-            return lot_data if lot_data else None
+            plan = plan or self.get_plan(get_site_profile())
+            return plan.extract(container)
             
         except Exception as e:
             logger.debug(f"从容器提取拍品信息失败: {e}")
             return None
     
-    def _extract_lots_from_scripts(self, soup) -> List[Dict]:
-        """从页面脚本中提取 JSON 格式的拍品数据"""
-        lots = []
+    def _parse_structured(self, html: str, url: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        从 JSON 接口的响应或页面内嵌的 JSON 中提取拍品
         
-        try:
-            # 查找所有 script 标签
-            scripts = soup.find_all('script', type='application/json')
-            
-            for script in scripts:
-                try:
-                    data = json.loads(script.string)
-                    # 递归查找可能包含拍品信息的数据
-                    lots.extend(self._find_lots_in_json(data))
-                except:
-                    continue
-            
-            # 也尝试查找普通的 JavaScript 变量
-            scripts = soup.find_all('script')
-            for script in scripts:
-                if script.string:
-                    # 查找类似 var lots = [...] 的模式
-                    matches = re.findall(r'(?:var|const|let)\s+\w*lots?\w*\s*=\s*(\[.+?\]);', script.string, re.DOTALL)
-                    for match in matches:
-                        try:
-                            data = json.loads(match)
-                            if isinstance(data, list):
-                                lots.extend(data)
-                        except:
-                            continue
+        每份 JSON 数据都完整遍历,同一编号的拍品只保留一个。
         
-        except Exception as e:
-            logger.error(f"从脚本提取拍品数据失败: {e}")
+        Returns:
+            (规范化的拍品列表, JSON 中的总页数);没有总页数字段时为 None
+        """
+        if looks_like_json(html):
+            try:
+                sources = [json.loads(html)]
+            except ValueError as e:
+                logger.warning(f"JSON 响应解析失败: {e}")
+                sources = []
+        else:
+            sources = iter_embedded_json(html)
         
-        return lots
-    
-    def _find_lots_in_json(self, data, depth=0, max_depth=5) -> List[Dict]:
-        """递归查找 JSON 数据中的拍品信息"""
         lots = []
+        seen = set()
+        total_pages = None
+        for data in sources:
+            lots.extend(iter_normalized_lots((lot for _, lot in iter_lot_objects(data)), seen))
+            if total_pages is None:
+                total_pages = find_total_pages(data)
         
-        if depth > max_depth:
-            return lots
-        
-        if isinstance(data, dict):
-            # 检查是否是拍品对象
-            if 'lot_number' in data or 'lotNumber' in data or 'lot' in data:
-                lots.append(data)
-            else:
-                # 递归查找
-                for value in data.values():
-                    lots.extend(self._find_lots_in_json(value, depth + 1, max_depth))
-        
-        elif isinstance(data, list):
-            for item in data:
-                lots.extend(self._find_lots_in_json(item, depth + 1, max_depth))
-        
-        return lots
+        if lots:
+            logger.info(f"从结构化数据中找到 {len(lots)} 个拍品")
+        return lots, total_pages
     
-    def get_all_lots_from_auction(self, auction_url: str, max_pages: int = 20) -> List[Dict]:
+    def get_all_lots_from_auction(self, auction_url: str, max_pages: int = 20,
+                                  max_workers: Optional[int] = None,
+                                  progress: Optional[ScrapeProgress] = None) -> List[Dict]:
         """
         获取拍卖场次的所有拍品
         
+        第一页用于检测总页数,后续页面由线程池并发抓取,
+        所有请求共享令牌桶限速,结果按页码顺序合并。
+        获取失败的页面记录在 progress.failed_pages 中。
+        同一拍卖场次正在被其他线程抓取时等待并共享其结果,那次抓取的进度复制到 progress。
+        
         Args:
             auction_url: 拍卖场次 URL
             max_pages: 最大抓取页数
+            max_workers: 并发线程数,默认使用 self.max_workers,1 表示逐页抓取
+            progress: 抓取进度,调用方从中读取失败页面
         
         Returns:
             拍品列表
         """
-        all_lots = []
+        progress = progress or ScrapeProgress(auction_url)
+        all_lots, shared = self.auction_flight.do((auction_url, max_pages), self._collect_lots,
+                                                  auction_url, max_pages, max_workers, progress)
+        if shared is not progress:
+            progress.update_from(shared)
+        
+        logger.info(f"总共获取 {len(all_lots)} 个拍品")
+        # 每个调用方得到自己的列表
+        return list(all_lots)
+    
+    def _collect_lots(self, auction_url: str, max_pages: int, max_workers: Optional[int],
+                      progress: ScrapeProgress) -> Tuple[List[Dict], ScrapeProgress]:
+        return list(self.iter_lots(auction_url, max_pages, max_workers, progress)), progress
+    
+    def get_lot_table(self, auction_url: str, max_pages: int = 20,
+                      max_workers: Optional[int] = None,
+                      auction: Optional[Auction] = None) -> LotTable:
+        """
+        获取拍卖场次的所有拍品,按列保存
+        
+        与 get_all_lots_from_auction 相同,但拍品逐个转换为紧凑记录存入 LotTable,
+        适合在内存中保留和批量处理大量拍品。
+        
+        Args:
+            auction_url: 拍卖场次 URL
+            max_pages: 最大抓取页数
+            max_workers: 并发线程数
+            auction: 所属拍卖场次,默认按 URL 获取共享的 Auction 对象
+        """
+        table = LotTable()
+        table.extend(self.iter_lots(auction_url, max_pages, max_workers),
+                     auction or Auction.intern(auction_url))
+        
+        logger.info(f"总共获取 {len(table)} 个拍品")
+        return table
+    
+    def iter_lots(self, auction_url: str, max_pages: int = 20,
+                  max_workers: Optional[int] = None,
+                  progress: Optional[ScrapeProgress] = None,
+                  use_cache: bool = True) -> Iterator[Dict]:
+        """
+        逐页产出拍卖场次的拍品
+        
+        每解析完一页就产出该页的拍品,不在内存中累积整个拍卖场次。
+        同一个 LotScraper 可以在多个线程中同时抓取不同的拍卖场次,
+        所有请求共享同一个令牌桶。
+        
+        Args:
+            auction_url: 拍卖场次 URL
+            max_pages: 最大抓取页数
+            max_workers: 并发线程数,默认使用 self.max_workers
+            progress: 进度对象,传入后可在抓取过程中读取页数、拍品数和失败页面
+            use_cache: 为 False 时不读取页面缓存,获取最新的出价
+        
+        Yields:
+            拍品信息,按页码顺序
+        """
+        progress = progress or ScrapeProgress(auction_url)
         
         logger.info(f"开始获取拍卖场次的所有拍品: {auction_url}")
         
-        # 第一页
-        html = self.fetch_with_zyte(auction_url)
-        if html:
-            lots = self.parse_lot_list(html)
-            all_lots.extend(lots)
+        try:
+            # 第一页
+            html = self._fetch_page(1, self._build_page_url(auction_url, 1), progress, use_cache)
+            if not html:
+                return
+            
+            # 同一次解析得到拍品和分页信息
+            lots, total_pages = self.parse_page(html, auction_url)
             logger.info(f"第 1 页: 找到 {len(lots)} 个拍品")
+            del html
             
-            # 检查是否有分页
-            soup = BeautifulSoup(html, 'html.parser')
-            total_pages = self._get_total_pages(soup)
+            progress.total_pages = min(total_pages, max_pages)
+            progress.site_pages = total_pages
+            progress.page_done(len(lots))
+            yield from lots
             
             if total_pages > 1:
                 logger.info(f"检测到 {total_pages} 页,开始抓取后续页面")
                 
-                for page in range(2, min(total_pages + 1, max_pages + 1)):
-                    # 构造分页 URL (需要根据实际网站调整)
-                    page_url = self._build_page_url(auction_url, page)
-                    
-                    logger.info(f"抓取第 {page} 页: {page_url}")
-                    html = self.fetch_with_zyte(page_url)
-                    
-                    if html:
-                        lots = self.parse_lot_list(html)
-                        all_lots.extend(lots)
-                        logger.info(f"第 {page} 页: 找到 {len(lots)} 个拍品")
+                pages = [(page, self._build_page_url(auction_url, page))
+                         for page in range(2, min(total_pages + 1, max_pages + 1))]
+                
+                fetch = partial(self._fetch_page_lots, use_cache=use_cache)
+                for page, lots in self._fetch_pages(pages, max_workers, progress, fetch):
+                    yield from lots
+        
+        finally:
+            progress.finish()
+            failed_pages = progress.failed_pages
+            if failed_pages:
+                failed = ', '.join(str(f['page']) for f in failed_pages)
+                logger.warning(f"{len(failed_pages)} 个页面获取失败: 第 {failed} 页")
+    
+    def refresh_lots(self, auction_url: str, max_pages: int = 20,
+                     max_workers: Optional[int] = None,
+                     progress: Optional[ScrapeProgress] = None,
+                     keywords: Optional[List[str]] = None) -> Dict:
+        """
+        增量刷新拍卖场次,只返回与上次快照相比新增或字段有变化的拍品
+        
+        快照中保存每个页面的 ETag / Last-Modified、内容哈希和拍品。条件请求返回
+        未修改、或内容哈希与上次相同的页面不再解析,直接沿用快照中的拍品;
+        获取失败的页面同样沿用快照,其中的拍品不会被当作已移除。
+        没有快照时所有拍品都视为新增。
+        
+        Args:
+            auction_url: 拍卖场次 URL
+            max_pages: 最大抓取页数
+            max_workers: 并发线程数,默认使用 self.max_workers
+            progress: 抓取进度
+            keywords: 过滤关键词,只影响返回的拍品和已移除的拍品,快照仍记录全部拍品
+        
+        Returns:
+            {
+                "lots": 新增或有变化的拍品,
+                "changes": [{"lot_number", "status": "added" / "updated", "fields": 变化的字段}],
+                "removed": 本次没有再出现的拍品编号,
+                "total_lots", "pages_fetched", "pages_unchanged", "failed_pages", "error"
+            }
+        """
+        progress = progress or ScrapeProgress(auction_url)
+        snapshot = self.snapshots.load(auction_url)
+        
+        result = {
+            "auction_url": auction_url,
+            "first_snapshot": snapshot.is_empty,
+            "lots": [],
+            "changes": [],
+            "removed": [],
+            "total_lots": len(snapshot.lots),
+            "pages_fetched": 0,
+            "pages_unchanged": 0,
+            "failed_pages": [],
+            "error": None
+        }
+        
+        logger.info(f"增量刷新拍卖场次: {auction_url}")
+        
+        try:
+            first_url = self._build_page_url(auction_url, 1)
+            first = self._fetch_page_revision(1, first_url, snapshot, progress)
+            if first is None:
+                result["error"] = "第一页获取失败"
+                return result
+            
+            site_pages = first[2]
+            total_pages = min(site_pages, max_pages)
+            progress.total_pages = total_pages
+            progress.site_pages = site_pages
+            revisions = [(first_url, first)]
+            
+            pages = [(page, self._build_page_url(auction_url, page)) for page in range(2, total_pages + 1)]
+            page_urls = dict(pages)
+            
+            def fetch(page: int, page_url: str, progress: ScrapeProgress):
+                return self._fetch_page_revision(page, page_url, snapshot, progress)
+            
+            for page, revision in self._fetch_pages(pages, max_workers, progress, fetch):
+                revisions.append((page_urls[page], revision))
+            if progress.cancelled:
+                # 没有抓取的页面不能当作拍品已移除,不保存快照
+                result["error"] = "刷新已取消"
+                return result
+            
+            new_pages: Dict[str, Dict] = {}
+            new_lots: Dict[str, Dict] = {}
+            
+            for page_url, revision in revisions:
+                if revision is None or revision[1] is None:
+                    # 页面未变化或获取失败: 沿用快照中的拍品
+                    record = revision[0] if revision else snapshot.pages.get(page_url)
+                    if record is None:
+                        continue
+                    new_pages[page_url] = record
+                    for key in record['lots']:
+                        if key in snapshot.lots:
+                            new_lots.setdefault(key, snapshot.lots[key])
+                    if revision:
+                        result["pages_unchanged"] += 1
+                    continue
+                
+                record, lots, _ = revision
+                new_pages[page_url] = record
+                result["pages_fetched"] += 1
+                
+                for lot in lots:
+                    key = lot_key(lot)
+                    if key is None or key in new_lots:
+                        continue
+                    new_lots[key] = lot
                     
-                    # 避免请求过快
-                    time.sleep(2)
+                    old = snapshot.lots.get(key)
+                    fields = diff_lot(old, lot)
+                    if fields:
+                        result["lots"].append(lot)
+                        result["changes"].append({
+                            "lot_number": key,
+                            "status": "updated" if old else "added",
+                            "fields": fields
+                        })
+            
+            result["removed"] = [key for key in snapshot.lots if key not in new_lots]
+            result["total_lots"] = len(new_lots)
+            
+            # 快照保存站点的总页数,不受本次 max_pages 的限制
+            self.snapshots.save(AuctionSnapshot(auction_url, site_pages, new_pages, new_lots))
+            
+            if keywords:
+                result["lots"] = self.filter_lots_by_keyword(result["lots"], keywords)
+                matched = {lot_key(lot) for lot in result["lots"]}
+                result["changes"] = [c for c in result["changes"] if c["lot_number"] in matched]
+                removed = self.filter_lots_by_keyword([snapshot.lots[key] for key in result["removed"]], keywords)
+                result["removed"] = [lot_key(lot) for lot in removed]
+            
+            logger.info(f"增量刷新完成: 解析 {result['pages_fetched']} 页,"
+                        f"{result['pages_unchanged']} 页未变化,{len(result['lots'])} 个拍品有变化,"
+                        f"{len(result['removed'])} 个拍品已移除")
         
-        logger.info(f"总共获取 {len(all_lots)} 个拍品")
-        return all_lots
+        finally:
+            progress.finish()
+            result["failed_pages"] = progress.failed_pages
+        
+        return result
+    
+    def _fetch_page_revision(self, page: int, page_url: str, snapshot: AuctionSnapshot,
+                             progress: Optional[ScrapeProgress] = None) -> Optional[Tuple]:
+        """
+        抓取单个页面并与快照比较
+        
+        Returns:
+            (页面记录, 拍品列表, 总页数);页面未变化时拍品列表为 None,获取失败时返回 None
+        """
+        previous = snapshot.pages.get(page_url)
+        if progress and progress.cancelled:
+            return None
+        logger.info(f"刷新第 {page} 页: {page_url}")
+        
+        try:
+            html, validators = self._fetch_adaptive(page_url, previous, rate_limited=True)
+            if html is None and previous is None:
+                raise RuntimeError("页面返回未修改,但没有对应的快照")
+        except Exception as e:
+            logger.error(f"第 {page} 页获取失败: {e}")
+            if progress:
+                progress.page_failed(page, page_url, str(e))
+            return None
+        
+        digest = content_hash(html) if html is not None else previous['hash']
+        
+        if previous is not None and digest == previous['hash']:
+            logger.info(f"第 {page} 页未变化")
+            if progress:
+                progress.page_done(len(previous['lots']))
+            return {**previous, **validators}, None, previous.get('total_pages', snapshot.total_pages)
+        
+        if self.cache:
+            self.cache.set(page_url, PAGE_CACHE_MODE, html)
+        
+        lots, total_pages = self.parse_page(html, page_url)
+        keys = list(dict.fromkeys(key for key in map(lot_key, lots) if key is not None))
+        
+        if progress:
+            progress.page_done(len(lots))
+        return {**validators, 'hash': digest, 'lots': keys, 'total_pages': total_pages}, lots, total_pages
     
-    def _get_total_pages(self, soup) -> int:
-        """获取总页数"""
+    def _fetch_pages(self, pages: List, max_workers: Optional[int] = None,
+                     progress: Optional[ScrapeProgress] = None,
+                     fetch: Optional[Callable] = None) -> Iterator:
+        """
+        并发抓取并解析多个分页
+        
+        最多提前抓取 2 * max_workers 个页面,消费方处理较慢时不会无限堆积结果。
+        progress 被取消时停止产出,尚未开始的页面不再抓取。
+        
+        Args:
+            pages: (页码, URL) 列表
+            max_workers: 并发线程数
+            progress: 抓取进度
+            fetch: 处理单个页面的函数 fetch(页码, URL, progress),默认抓取并解析拍品
+        
+        Yields:
+            按页码顺序产出 (页码, fetch 的返回值)
+        """
+        fetch = fetch or self._fetch_page_lots
+        workers = max(1, min(max_workers or self.max_workers, len(pages) or 1))
+        
+        cancelled = progress.cancel_event if progress else threading.Event()
+        
+        if workers == 1:
+            for page, page_url in pages:
+                if cancelled.is_set():
+                    return
+                yield page, fetch(page, page_url, progress)
+            return
+        
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lot-page")
+        pending = deque()
+        remaining = iter(pages)
+        
+        def submit_next():
+            item = next(remaining, None)
+            if item:
+                page, page_url = item
+                pending.append((page, executor.submit(fetch, page, page_url, progress)))
+        
+        try:
+            for _ in range(workers * 2):
+                submit_next()
+            
+            # 按提交顺序取结果,保证页码顺序;每取走一页就补充提交一页
+            while pending:
+                page, future = pending.popleft()
+                submit_next()
+                # 等待时定期检查取消,不让取消的抓取一直占用调用方的线程
+                while True:
+                    try:
+                        result = future.result(timeout=0.5)
+                        break
+                    except FutureTimeoutError:
+                        if cancelled.is_set():
+                            logger.warning(f"抓取已取消,放弃 {len(pending) + 1} 个未完成的页面")
+                            return
+                if cancelled.is_set():
+                    return
+                yield page, result
+        
+        finally:
+            # 消费方提前停止时取消尚未开始的页面
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _fetch_page_lots(self, page: int, page_url: str,
+                         progress: Optional[ScrapeProgress] = None, use_cache: bool = True) -> List[Dict]:
+        """抓取并解析单个分页,失败时返回空列表"""
+        html = self._fetch_page(page, page_url, progress, use_cache)
+        if not html:
+            return []
+        
+        lots = self.parse_lot_list(html, page_url)
+        logger.info(f"第 {page} 页: 找到 {len(lots)} 个拍品")
+        
+        if progress:
+            progress.page_done(len(lots))
+        return lots
+    
+    def _fetch_page(self, page: int, page_url: str,
+                    progress: Optional[ScrapeProgress] = None, use_cache: bool = True) -> Optional[str]:
+        """经令牌桶限速后抓取单个页面,失败时记录到 progress.failed_pages;已取消时不再抓取"""
+        if progress and progress.cancelled:
+            return None
+        logger.info(f"抓取第 {page} 页: {page_url}")
+        
+        try:
+            return self._fetch_html(page_url, use_cache, rate_limited=True)
+        except Exception as e:
+            logger.error(f"第 {page} 页获取失败: {e}")
+            if progress:
+                progress.page_failed(page, page_url, str(e))
+            return None
+    
+    def _get_total_pages(self, soup, html: Optional[str] = None,
+                         profile: Optional[SelectorProfile] = None) -> int:
+        """
+        获取总页数
+        
+        Args:
+            soup: 页面解析结果
+            html: 原始 HTML;soup 只包含部分节点时,用它查找 "Page 1 of 14" 文本
+            profile: 站点选择器配置
+        """
+        profile = profile or get_site_profile()
+        
         try:
             # 查找分页信息
-            pagination = soup.find(['div', 'nav'], class_=re.compile(r'pag', re.I))
+            pagination = soup.find(['div', 'nav'], class_=profile.pagination_class)
             if pagination:
                 # 查找页码
                 page_links = pagination.find_all('a', href=True)
@@ -253,9 +994,15 @@ class LotScraper:
                     return max(page_numbers)
             
             # 尝试从文本中提取 "Page 1 of 14" 这样的信息
-            page_info = soup.find(text=re.compile(r'Page\s+\d+\s+of\s+(\d+)', re.I))
+            if html is not None:
+                match = PAGE_OF_PATTERN.search(html)
+                if match:
+                    return int(match.group(1))
+                return 1
+            
+            page_info = soup.find(text=PAGE_OF_PATTERN)
             if page_info:
-                match = re.search(r'of\s+(\d+)', page_info, re.I)
+                match = PAGE_COUNT_PATTERN.search(page_info)
                 if match:
                     return int(match.group(1))
         
@@ -265,95 +1012,187 @@ class LotScraper:
         return 1
     
     def _build_page_url(self, base_url: str, page: int) -> str:
-        """构造分页 URL"""
+        """构造分页 URL,站点配置了 JSON 拍品接口时构造接口 URL"""
+        feed_url = get_site_profile(base_url).feed_url
+        if feed_url:
+            return build_feed_url(feed_url, base_url, page)
+        if page == 1:
+            return base_url
+        
         # 根据实际网站的分页参数调整
         if '?' in base_url:
             return f"{base_url}&page={page}"
         else:
             return f"{base_url}?page={page}"
     
-    def filter_lots_by_keyword(self, lots: List[Dict], keywords: List[str]) -> List[Dict]:
+    def filter_lots_by_keyword(self, lots, keywords: Optional[List[str]] = None,
+                               all_keywords: Optional[List[str]] = None,
+                               exclude_keywords: Optional[List[str]] = None) -> List[Dict]:
         """
         按关键词过滤拍品
         
+        拍品列表逐个匹配,不保留对列表的引用;需要对同一批拍品反复查询时,
+        传入 KeywordIndex 由倒排索引查询。匹配规则见 lot_index 模块说明。
+        
         Args:
-            lots: 拍品列表
-            keywords: 关键词列表
+            lots: 拍品列表或 KeywordIndex
+            keywords: 任一匹配即可(OR)
+            all_keywords: 需要全部匹配(AND)
+            exclude_keywords: 匹配任一即排除(NOT)
         
         Returns:
             过滤后的拍品列表
         """
-        if not keywords:
+        query = LotQuery(keywords, all_keywords, exclude_keywords)
+        
+        if isinstance(lots, KeywordIndex):
+            return lots.search(query)
+        if query.is_empty:
             return lots
         
-        filtered = []
-        
-        for lot in lots:
-            # 在标题和描述中搜索关键词
-            title = lot.get('title', '').lower()
-            description = lot.get('description', '').lower()
-            
-            # 检查是否包含任一关键词
-            for keyword in keywords:
-                keyword_lower = keyword.lower()
-                if keyword_lower in title or keyword_lower in description:
-                    filtered.append(lot)
-                    break
+        filtered = [lot for lot in lots if query.matches(lot)]
         
         logger.info(f"关键词过滤: {len(lots)} -> {len(filtered)}")
         return filtered
     
-    def save_lots_to_file(self, lots: List[Dict], filename: str, format: str = 'json'):
+    def iter_filter_lots_by_keyword(self, lots: Iterable[Dict], keywords: Optional[List[str]] = None,
+                                    all_keywords: Optional[List[str]] = None,
+                                    exclude_keywords: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        按关键词过滤拍品流,匹配规则与 filter_lots_by_keyword 相同
+        
+        Args:
+            lots: 拍品迭代器,如 iter_lots 的返回值
+            keywords: 任一匹配即可(OR),为空时不按此条件过滤
+            all_keywords: 需要全部匹配(AND)
+            exclude_keywords: 匹配任一即排除(NOT)
+        
+        Yields:
+            匹配的拍品
+        """
+        query = LotQuery(keywords, all_keywords, exclude_keywords)
+        
+        for lot in lots:
+            if query.is_empty or query.matches(lot):
+                yield lot
+    
+    def save_lots_to_file(self, lots: Iterable, filename: str, format: str = 'json') -> Optional[int]:
         """
         保存拍品到文件
         
+        lots 可以是列表,也可以是 iter_lots 等生成器;生成器会被逐条写入,
+        不会先在内存中收集全部拍品。拍品可以是字典、Lot 记录或 LotTable,
+        记录在写入时才转换为字典。
+        
         Args:
-            lots: 拍品列表
+            lots: 拍品列表、迭代器或 LotTable
             filename: 文件名
-            format: 格式 ('json', 'csv', 'txt')
+            format: 格式 ('json', 'jsonl', 'csv', 'txt')
+        
+        Returns:
+            写入的拍品数量,失败时返回 None
         """
+        if isinstance(lots, LotTable):
+            lots = lots.iter_dicts()
+        elif isinstance(lots, list):
+            lots = [as_dict(lot) for lot in lots]
+        else:
+            lots = map(as_dict, lots)
+        
         try:
             if format == 'json':
-                self._save_as_json(lots, filename)
+                return self._save_as_json(lots, filename)
+            elif format == 'jsonl':
+                return self._save_as_jsonl(lots, filename)
             elif format == 'csv':
-                self._save_as_csv(lots, filename)
+                return self._save_as_csv(lots, filename)
             elif format == 'txt':
-                self._save_as_txt(lots, filename)
+                return self._save_as_txt(lots, filename)
             else:
                 logger.error(f"不支持的格式: {format}")
         
         except Exception as e:
             logger.error(f"保存文件失败: {e}")
+        
+        return None
     
-    def _save_as_json(self, lots: List[Dict], filename: str):
-        """保存为 JSON 格式"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(lots, f, ensure_ascii=False, indent=2)
-        logger.info(f"已保存 {len(lots)} 个拍品到 {filename}")
+    def _save_as_json(self, lots: Iterable[Dict], filename: str) -> int:
+        """保存为 JSON 格式,逐条写入数组元素,输出与 json.dump(indent=2) 一致"""
+        count = 0
+        
+        # 行缓冲,每个拍品写完即落盘
+        with open(filename, 'w', encoding='utf-8', buffering=1) as f:
+            for lot in lots:
+                item = json.dumps(lot, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+                f.write(('[\n  ' if count == 0 else ',\n  ') + item)
+                count += 1
+            
+            f.write('\n]' if count else '[]')
+        
+        logger.info(f"已保存 {count} 个拍品到 {filename}")
+        return count
     
-    def _save_as_csv(self, lots: List[Dict], filename: str):
-        """保存为 CSV 格式"""
-        import csv
+    def _save_as_jsonl(self, lots: Iterable[Dict], filename: str) -> int:
+        """保存为 JSON Lines 格式,每行一个拍品"""
+        count = 0
         
-        if not lots:
-            return
+        with open(filename, 'w', encoding='utf-8', buffering=1) as f:
+            for lot in lots:
+                f.write(json.dumps(lot, ensure_ascii=False) + '\n')
+                count += 1
         
-        # 获取所有字段
-        fields = set()
-        for lot in lots:
-            fields.update(lot.keys())
-        fields = sorted(list(fields))
+        logger.info(f"已保存 {count} 个拍品到 {filename}")
+        return count
+    
+    def _save_as_csv(self, lots: Iterable[Dict], filename: str) -> int:
+        """
+        保存为 CSV 格式,列为所有拍品字段的并集
+        
+        流式输入先逐条写入临时文件并收集字段,表头确定后再写出 CSV,
+        不在内存中保留拍品。
+        """
+        if isinstance(lots, list):
+            if not lots:
+                return 0
+            
+            # 获取所有字段
+            fields = set()
+            for lot in lots:
+                fields.update(lot.keys())
+            return self._write_csv(lots, sorted(fields), filename)
         
-        with open(filename, 'w', encoding='utf-8', newline='') as f:
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as spool:
+            fields = set()
+            for lot in lots:
+                fields.update(lot.keys())
+                spool.write(json.dumps(lot, ensure_ascii=False) + '\n')
+            
+            if not fields:
+                return 0
+            
+            spool.seek(0)
+            return self._write_csv(map(json.loads, spool), sorted(fields), filename)
+    
+    def _write_csv(self, rows: Iterable[Dict], fields: List[str], filename: str) -> int:
+        import csv
+        
+        count = 0
+        
+        with open(filename, 'w', encoding='utf-8', newline='', buffering=1) as f:
             writer = csv.DictWriter(f, fieldnames=fields)
             writer.writeheader()
-            writer.writerows(lots)
+            for lot in rows:
+                writer.writerow(lot)
+                count += 1
         
-        logger.info(f"已保存 {len(lots)} 个拍品到 {filename}")
+        logger.info(f"已保存 {count} 个拍品到 {filename}")
+        return count
     
-    def _save_as_txt(self, lots: List[Dict], filename: str):
+    def _save_as_txt(self, lots: Iterable[Dict], filename: str) -> int:
         """保存为文本格式"""
-        with open(filename, 'w', encoding='utf-8') as f:
+        count = 0
+        
+        with open(filename, 'w', encoding='utf-8', buffering=1) as f:
             for i, lot in enumerate(lots, 1):
                 f.write(f"{'='*60}\n")
                 f.write(f"拍品 #{i}\n")
@@ -363,5 +1202,7 @@ class LotScraper:
                     f.write(f"{key}: {value}\n")
                 
                 f.write("\n")
+                count = i
         
-        logger.info(f"已保存 {len(lots)} 个拍品到 {filename}")
+        logger.info(f"已保存 {count} 个拍品到 {filename}")
+        return count
@@ -0,0 +1,165 @@
+"""
+拍品快照模块 - 保存拍卖场次上次抓取的页面校验信息和拍品,用于增量刷新
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+from config import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+# 由调用方附加的拍卖场次字段,不参与变化检测
+IGNORED_FIELDS = frozenset({'auction_title', 'auction_date', 'auction_url'})
+
+
+def content_hash(html: str) -> str:
+    """页面内容的 SHA-256"""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def lot_key(lot: Dict) -> Optional[str]:
+    """拍品的唯一键,优先使用拍品编号"""
+    return lot.get('lot_number') or lot.get('title')
+
+
+def response_validators(headers) -> Dict:
+    """
+    从响应头中取出 ETag 和 Last-Modified
+    
+    Args:
+        headers: 响应头字典,或 Zyte API 返回的 [{"name": ..., "value": ...}] 列表
+    """
+    if not headers:
+        return {}
+    if isinstance(headers, list):
+        headers = {h.get("name", ""): h.get("value") for h in headers}
+    
+    validators = {}
+    for name, value in headers.items():
+        lowered = name.lower()
+        if lowered == 'etag':
+            validators['etag'] = value
+        elif lowered == 'last-modified':
+            validators['last_modified'] = value
+    return validators
+
+
+def conditional_headers(validators: Optional[Dict]) -> Dict:
+    """由上次的 ETag / Last-Modified 生成条件请求头"""
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def diff_lot(old: Optional[Dict], new: Dict) -> Dict:
+    """
+    比较同一拍品的新旧版本
+    
+    Returns:
+        发生变化的字段 {字段: {"old": 旧值, "new": 新值}},没有变化时为空字典
+    """
+    old = old or {}
+    fields = {}
+    for name in sorted((old.keys() | new.keys()) - IGNORED_FIELDS):
+        if old.get(name) != new.get(name):
+            fields[name] = {"old": old.get(name), "new": new.get(name)}
+    return fields
+
+
+class AuctionSnapshot:
+    """
+    一个拍卖场次的快照
+    
+    pages 按页面 URL 保存 ETag、Last-Modified、内容哈希和该页的拍品键,
+    lots 按拍品键保存上次看到的拍品。
+    """
+    
+    def __init__(self, auction_url: str, total_pages: int = 1,
+                 pages: Optional[Dict[str, Dict]] = None,
+                 lots: Optional[Dict[str, Dict]] = None,
+                 updated_at: Optional[float] = None):
+        self.auction_url = auction_url
+        self.total_pages = total_pages
+        self.pages = pages or {}
+        self.lots = lots or {}
+        self.updated_at = updated_at
+    
+    @property
+    def is_empty(self) -> bool:
+        return not self.pages
+    
+    def to_dict(self) -> Dict:
+        return {
+            "auction_url": self.auction_url,
+            "total_pages": self.total_pages,
+            "updated_at": self.updated_at,
+            "pages": self.pages,
+            "lots": self.lots
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AuctionSnapshot':
+        return cls(data["auction_url"], data.get("total_pages", 1), data.get("pages"),
+                   data.get("lots"), data.get("updated_at"))
+
+
+class SnapshotStore:
+    """按拍卖场次 URL 保存快照的 JSON 文件存储"""
+    
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR):
+        """
+        Args:
+            snapshot_dir: 快照目录
+        """
+        self.snapshot_dir = snapshot_dir
+        self._lock = threading.Lock()
+    
+    def _path(self, auction_url: str) -> str:
+        key = hashlib.sha256(auction_url.encode('utf-8')).hexdigest()
+        return os.path.join(self.snapshot_dir, f"{key}.json")
+    
+    def load(self, auction_url: str) -> AuctionSnapshot:
+        """读取快照,不存在或无法读取时返回空快照"""
+        path = self._path(auction_url)
+        
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return AuctionSnapshot.from_dict(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"读取快照失败,将重新建立: {path}, {e}")
+        
+        return AuctionSnapshot(auction_url)
+    
+    def save(self, snapshot: AuctionSnapshot):
+        """保存快照"""
+        snapshot.updated_at = time.time()
+        path = self._path(snapshot.auction_url)
+        
+        with self._lock:
+            try:
+                os.makedirs(self.snapshot_dir, exist_ok=True)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot.to_dict(), f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"保存快照失败: {e}")
+    
+    def delete(self, auction_url: str):
+        """删除快照,下次刷新时重新全量抓取"""
+        try:
+            os.remove(self._path(auction_url))
+        except FileNotFoundError:
+            pass
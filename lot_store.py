@@ -0,0 +1,406 @@
+"""
+拍品存储模块 - 基于 SQLite 的本地拍卖场次和拍品库
+
+抓取到的拍品按 (auction_url, lot_number) 写入本地数据库,之后的查询直接从库中
+回答,不再消耗 Zyte 调用。标题和描述建有 FTS5 全文索引,出价和拍卖日期建有普通索引。
+
+全文索引中保存的是按 lot_index.tokenize 切分后的文本(中文按单字切分),
+查询也按同样的规则切分,库中检索与 KeywordIndex 对新抓取拍品的匹配结果一致。
+"""
+
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from config import LOT_STORE_PATH, LOT_STORE_MAX_AGE_HOURS
+from lot_index import tokenize
+from lot_records import AUCTION_FIELDS, LOT_FIELDS, parse_bid_amount
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS auctions (
+    url TEXT PRIMARY KEY,
+    title TEXT,
+    date TEXT,
+    category TEXT,
+    lots_count INTEGER,
+    scraped_at REAL,
+    scraped_pages INTEGER,
+    site_pages INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_auctions_date ON auctions(date);
+
+CREATE TABLE IF NOT EXISTS lots (
+    id INTEGER PRIMARY KEY,
+    auction_url TEXT NOT NULL,
+    lot_number TEXT NOT NULL,
+    title TEXT,
+    description TEXT,
+    current_bid TEXT,
+    bid_amount REAL,
+    image_url TEXT,
+    extra TEXT,
+    updated_at REAL,
+    UNIQUE (auction_url, lot_number)
+);
+CREATE INDEX IF NOT EXISTS idx_lots_bid ON lots(bid_amount);
+
+-- 旧版本直接索引标题和描述,中文没有切分
+DROP TRIGGER IF EXISTS lots_ai;
+DROP TRIGGER IF EXISTS lots_ad;
+DROP TRIGGER IF EXISTS lots_au;
+DROP TABLE IF EXISTS lots_fts;
+
+-- lot_tokens() 由连接注册,把标题和描述切分为以空格分隔的小写词
+CREATE VIRTUAL TABLE IF NOT EXISTS lots_text USING fts5(
+    text, tokenize="unicode61 remove_diacritics 0 tokenchars '_'"
+);
+CREATE TRIGGER IF NOT EXISTS lots_text_ai AFTER INSERT ON lots BEGIN
+    INSERT INTO lots_text(rowid, text) VALUES (new.id, lot_tokens(new.title, new.description));
+END;
+CREATE TRIGGER IF NOT EXISTS lots_text_ad AFTER DELETE ON lots BEGIN
+    DELETE FROM lots_text WHERE rowid = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS lots_text_au AFTER UPDATE OF title, description ON lots BEGIN
+    UPDATE lots_text SET text = lot_tokens(new.title, new.description) WHERE rowid = new.id;
+END;
+"""
+
+UPSERT_LOT = """
+INSERT INTO lots (auction_url, lot_number, title, description, current_bid, bid_amount,
+                  image_url, extra, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (auction_url, lot_number) DO UPDATE SET
+    title = excluded.title,
+    description = excluded.description,
+    current_bid = excluded.current_bid,
+    bid_amount = excluded.bid_amount,
+    image_url = excluded.image_url,
+    extra = excluded.extra,
+    updated_at = excluded.updated_at
+"""
+
+
+def lot_tokens(title: Optional[str], description: Optional[str]) -> str:
+    """全文索引中保存的文本: 与 KeywordIndex 相同的切分规则,词之间以空格分隔"""
+    return ' '.join(tokenize(f"{title or ''} {description or ''}"))
+
+
+def build_match_query(keywords: List[str]) -> str:
+    """
+    把关键词列表转换为 FTS5 查询
+    
+    关键词按 tokenize 切分后作为短语,最后一个词按前缀匹配,关键词之间为 OR,
+    与 filter_lots_by_keyword 的"任一关键词匹配"一致。
+    """
+    phrases = []
+    for keyword in keywords:
+        tokens = tokenize(keyword)
+        if tokens:
+            escaped = ' '.join(tokens).replace('"', '""')
+            phrases.append(f'"{escaped}"*')
+    return ' OR '.join(phrases)
+
+
+class LotStore:
+    """
+    SQLite 拍品库
+    
+    一个实例只持有一个连接,由锁保护,可以被多个抓取线程共享。
+    数据库文件在第一次使用时创建。
+    """
+    
+    def __init__(self, db_path: str = LOT_STORE_PATH,
+                 max_age_hours: float = LOT_STORE_MAX_AGE_HOURS):
+        """
+        Args:
+            db_path: 数据库文件路径,':memory:' 表示内存数据库
+            max_age_hours: 拍卖场次抓取后多长时间内视为新鲜,可直接从库中回答
+        """
+        self.db_path = db_path
+        self.max_age = max_age_hours * 3600
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+    
+    def _connection(self) -> sqlite3.Connection:
+        """首次使用时打开数据库并建表,调用方需持有锁"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.create_function("lot_tokens", 2, lot_tokens, deterministic=True)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._add_missing_columns(conn)
+            self._rebuild_text_index(conn)
+            self._conn = conn
+        return self._conn
+    
+    @staticmethod
+    def _add_missing_columns(conn: sqlite3.Connection):
+        """旧版本的 auctions 表没有抓取页数列"""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(auctions)")}
+        with conn:
+            for name in ('scraped_pages', 'site_pages'):
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE auctions ADD COLUMN {name} INTEGER")
+    
+    @staticmethod
+    def _rebuild_text_index(conn: sqlite3.Connection):
+        """全文索引为空而库中已有拍品时(从旧版本升级)重建索引"""
+        if conn.execute("SELECT 1 FROM lots_text LIMIT 1").fetchone():
+            return
+        if not conn.execute("SELECT 1 FROM lots LIMIT 1").fetchone():
+            return
+        with conn:
+            conn.execute("INSERT INTO lots_text(rowid, text) SELECT id, lot_tokens(title, description) FROM lots")
+        logger.info("已重建拍品全文索引")
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
+    def upsert_auction(self, auction: Dict, scraped: bool = False,
+                       scraped_pages: Optional[int] = None, site_pages: Optional[int] = None):
+        """
+        写入拍卖场次信息
+        
+        Args:
+            auction: 拍卖场次,至少包含 url
+            scraped: 为 True 时记录本次抓取时间和页数,用于判断库中的拍品是否新鲜
+            scraped_pages: 本次抓取的页数
+            site_pages: 站点上的总页数
+        """
+        scraped_at = time.time() if scraped else None
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO auctions (url, title, date, category, lots_count, scraped_at,
+                                          scraped_pages, site_pages)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (url) DO UPDATE SET
+                        title = COALESCE(excluded.title, title),
+                        date = COALESCE(excluded.date, date),
+                        category = COALESCE(excluded.category, category),
+                        lots_count = COALESCE(excluded.lots_count, lots_count),
+                        scraped_pages = CASE WHEN excluded.scraped_at IS NULL
+                                             THEN scraped_pages ELSE excluded.scraped_pages END,
+                        site_pages = CASE WHEN excluded.scraped_at IS NULL
+                                          THEN site_pages ELSE excluded.site_pages END,
+                        scraped_at = COALESCE(excluded.scraped_at, scraped_at)
+                    """,
+                    (auction['url'], auction.get('title'), auction.get('date'), auction.get('category'),
+                     auction.get('lots_count'), scraped_at,
+                     scraped_pages if scraped else None, site_pages if scraped else None)
+                )
+    
+    def upsert_lots(self, auction_url: str, lots: Iterable[Dict]) -> int:
+        """
+        批量写入拍品,已存在的 (auction_url, lot_number) 会被更新
+        
+        Returns:
+            写入的拍品数(没有拍品编号的拍品会被跳过)
+        """
+        now = time.time()
+        rows = []
+        for lot in lots:
+            lot_number = lot.get('lot_number')
+            if not lot_number:
+                continue
+            # LOT_FIELDS 有独立的列,拍卖场次字段查询时从 auctions 表关联,其余字段以 JSON 保存
+            extra = {k: v for k, v in lot.items() if k not in LOT_FIELDS and k not in AUCTION_FIELDS}
+            rows.append((
+                auction_url, lot_number, lot.get('title'), lot.get('description'),
+                lot.get('current_bid'), parse_bid_amount(lot.get('current_bid')),
+                lot.get('image_url'), json.dumps(extra, ensure_ascii=False) if extra else None, now
+            ))
+        
+        if not rows:
+            return 0
+        
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(UPSERT_LOT, rows)
+        
+        logger.debug(f"写入 {len(rows)} 个拍品: {auction_url}")
+        return len(rows)
+    
+    def tee_lots(self, auction_url: str, lots: Iterable[Dict], auction: Optional[Dict] = None,
+                 progress=None, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        原样产出 lots,同时分批写入数据库
+        
+        全部产出且没有失败页面时记录拍卖场次的抓取时间和页数;调用方提前停止或有页面
+        获取失败时,已产出的拍品仍会写入,但拍卖场次不会被视为新鲜。
+        完整抓取了站点的所有页面时,库中本次没有再出现的拍品(已撤拍)会被删除。
+        本次没有产出任何拍品、库中却有该拍卖场次的拍品时(空页面、解析失败或被软封锁),
+        不删除拍品,也不视为新鲜。
+        
+        Args:
+            auction_url: 拍卖场次 URL
+            lots: 拍品迭代器,通常是 LotScraper.iter_lots()
+            auction: 拍卖场次信息(标题、日期等)
+            progress: 与 lots 对应的 ScrapeProgress,用于检查失败页面
+            batch_size: 每批写入的拍品数
+        """
+        batch = []
+        produced = 0
+        completed = False
+        started = time.time()
+        
+        try:
+            for lot in lots:
+                # 先复制再产出,调用方修改拍品不会影响写入的内容
+                batch.append(dict(lot))
+                produced += 1
+                yield lot
+                if len(batch) >= batch_size:
+                    self.upsert_lots(auction_url, batch)
+                    batch = []
+            # 取消的抓取没有获取全部页面,同样不算完整抓取
+            completed = progress is None or not (progress.failed_pages or progress.cancelled)
+            if completed and not produced and self.count_lots(auction_url):
+                logger.warning(f"抓取没有得到拍品,保留库中已有的拍品: {auction_url}")
+                completed = False
+        
+        finally:
+            self.upsert_lots(auction_url, batch)
+            scraped_pages = progress.total_pages if progress else None
+            site_pages = progress.site_pages if progress else None
+            if completed and scraped_pages is not None and site_pages is not None and scraped_pages >= site_pages:
+                self._delete_stale_lots(auction_url, started)
+            self.upsert_auction({**(auction or {}), 'url': auction_url}, scraped=completed,
+                                scraped_pages=scraped_pages, site_pages=site_pages)
+    
+    def _delete_stale_lots(self, auction_url: str, before: float):
+        """删除拍卖场次中 before 之后没有再写入的拍品"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                deleted = conn.execute("DELETE FROM lots WHERE auction_url = ? AND updated_at < ?",
+                                       (auction_url, before)).rowcount
+        if deleted:
+            logger.info(f"删除 {deleted} 个已撤拍的拍品: {auction_url}")
+    
+    def is_fresh(self, auction_url: str, max_pages: Optional[int] = None) -> bool:
+        """
+        拍卖场次是否在 max_age_hours 内抓取过
+        
+        Args:
+            auction_url: 拍卖场次 URL
+            max_pages: 需要的页数;上次只抓取了前几页、不足 max_pages(和站点总页数)时不视为新鲜
+        """
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT scraped_at, scraped_pages, site_pages FROM auctions WHERE url = ?", (auction_url,)
+            ).fetchone()
+        if not (row and row['scraped_at'] and time.time() - row['scraped_at'] <= self.max_age):
+            return False
+        if max_pages is None or row['scraped_pages'] is None:
+            return True
+        return row['scraped_pages'] >= min(max_pages, row['site_pages'] or max_pages)
+    
+    def search_lots(self, keywords: Optional[List[str]] = None,
+                    auction_url: Optional[str] = None,
+                    min_bid: Optional[float] = None,
+                    max_bid: Optional[float] = None,
+                    date_from: Optional[str] = None,
+                    date_to: Optional[str] = None,
+                    limit: Optional[int] = None,
+                    with_auction: bool = True) -> List[Dict]:
+        """
+        查询库中的拍品
+        
+        Args:
+            keywords: 关键词,匹配标题或描述,任一关键词匹配即可(按词前缀匹配)
+            auction_url: 只查询该拍卖场次
+            min_bid / max_bid: 出价范围
+            date_from / date_to: 拍卖日期范围(YYYY-MM-DD)
+            limit: 最多返回的拍品数
+            with_auction: 是否在拍品中附加 auction_title / auction_date / auction_url
+        
+        Returns:
+            拍品列表,指定拍卖场次时按写入顺序,否则按拍卖日期和写入顺序
+        """
+        conditions = []
+        params = []
+        
+        match = build_match_query(keywords or [])
+        if match:
+            conditions.append("l.id IN (SELECT rowid FROM lots_text WHERE lots_text MATCH ?)")
+            params.append(match)
+        if auction_url:
+            conditions.append("l.auction_url = ?")
+            params.append(auction_url)
+        if min_bid is not None:
+            conditions.append("l.bid_amount >= ?")
+            params.append(min_bid)
+        if max_bid is not None:
+            conditions.append("l.bid_amount <= ?")
+            params.append(max_bid)
+        if date_from:
+            conditions.append("a.date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("a.date <= ?")
+            params.append(date_to)
+        
+        sql = ("SELECT l.*, a.title AS auction_title, a.date AS auction_date "
+               "FROM lots l LEFT JOIN auctions a ON a.url = l.auction_url")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY l.id" if auction_url else " ORDER BY a.date, l.id"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+        
+        return [self._row_to_lot(row, with_auction) for row in rows]
+    
+    def count_lots(self, auction_url: Optional[str] = None) -> int:
+        """库中的拍品数"""
+        with self._lock:
+            conn = self._connection()
+            if auction_url:
+                row = conn.execute("SELECT COUNT(*) FROM lots WHERE auction_url = ?", (auction_url,)).fetchone()
+            else:
+                row = conn.execute("SELECT COUNT(*) FROM lots").fetchone()
+        return row[0]
+    
+    def _row_to_lot(self, row: sqlite3.Row, with_auction: bool = True) -> Dict:
+        """数据库行转换为与抓取结果相同结构的拍品字典"""
+        lot = {name: row[name] for name in LOT_FIELDS if row[name] is not None}
+        if row['extra']:
+            lot.update(json.loads(row['extra']))
+        if not with_auction:
+            return lot
+        lot['auction_title'] = row['auction_title']
+        lot['auction_date'] = row['auction_date']
+        lot['auction_url'] = row['auction_url']
+        return lot
+
+
+_default_store: Optional[LotStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_lot_store() -> LotStore:
+    """获取进程内共享的默认拍品库"""
+    global _default_store
+    
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = LotStore()
+        return _default_store
@@ -0,0 +1,232 @@
+"""
+页面缓存模块 - 将抓取到的 HTML 压缩保存到磁盘,避免重复消耗 Zyte 调用
+"""
+
+import os
+import gzip
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, Optional
+
+from config import CACHE_DIR, CACHE_EXPIRY_HOURS, CACHE_MAX_SIZE_MB
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """
+    基于内容寻址的磁盘页面缓存
+    
+    缓存键由抓取模式和 URL 的 SHA-256 组成,页面以 gzip 压缩保存在
+    CACHE_DIR 下。文件的修改时间用于 TTL 过期判断,访问时间用于 LRU 淘汰。
+    """
+    
+    def __init__(self, cache_dir: str = CACHE_DIR,
+                 expiry_hours: float = CACHE_EXPIRY_HOURS,
+                 max_size_mb: float = CACHE_MAX_SIZE_MB):
+        """
+        Args:
+            cache_dir: 缓存目录
+            expiry_hours: 缓存有效期(小时)
+            max_size_mb: 缓存总大小上限(MB),超出后按最近最少使用淘汰
+        """
+        self.cache_dir = cache_dir
+        self.ttl = expiry_hours * 3600
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+    
+    def _key(self, url: str, mode: str) -> str:
+        """生成缓存键"""
+        return hashlib.sha256(f"{mode}\n{url}".encode('utf-8')).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        """缓存文件路径,按键的前两位分目录"""
+        return os.path.join(self.cache_dir, key[:2], f"{key}.html.gz")
+    
+    def get(self, url: str, mode: str, max_age: Optional[float] = None) -> Optional[str]:
+        """
+        读取缓存页面
+        
+        Args:
+            url: 页面 URL
+            mode: 抓取模式,如 'zyte-browser'、'http'
+            max_age: 本次读取允许的最大缓存时间(秒),默认使用缓存的有效期
+        
+        Returns:
+            缓存的 HTML,不存在或已过期时返回 None
+        """
+        path = self._path(self._key(url, mode))
+        
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        
+        age = time.time() - stat.st_mtime
+        if age > self.ttl:
+            self._count("expired")
+            self._count("misses")
+            self._remove(path, stat.st_size)
+            return None
+        if max_age is not None and age > max_age:
+            # 对本次读取来说太旧,但仍在有效期内,留给允许更旧页面的调用方
+            self._count("misses")
+            return None
+        
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                html = f.read()
+        except Exception as e:
+            logger.warning(f"读取缓存失败,已删除: {path}, {e}")
+            self._count("misses")
+            self._remove(path, stat.st_size)
+            return None
+        
+        # 只更新访问时间,修改时间保留给 TTL 判断
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        
+        self._count("hits")
+        logger.debug(f"缓存命中: [{mode}] {url}")
+        return html
+    
+    def set(self, url: str, mode: str, html: str):
+        """
+        写入缓存页面
+        
+        Args:
+            url: 页面 URL
+            mode: 抓取模式
+            html: 页面内容
+        """
+        path = self._path(self._key(url, mode))
+        data = gzip.compress(html.encode('utf-8'))
+        
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            
+            # 先写临时文件再替换,避免并发读取到不完整的文件
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入缓存失败: {e}")
+            return
+        
+        with self._lock:
+            self._stats["writes"] += 1
+            if self._size is not None:
+                self._size += len(data) - old_size
+        
+        self._evict_if_needed()
+    
+    def clear(self):
+        """清空缓存"""
+        for path, _, _ in self._scan():
+            self._remove(path)
+        
+        with self._lock:
+            self._size = 0
+        
+        logger.info("页面缓存已清空")
+    
+    def stats(self) -> Dict:
+        """返回缓存统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+        
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["size_bytes"] = self._current_size()
+        return stats
+    
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+    
+    def _remove(self, path: str, size: Optional[int] = None):
+        try:
+            if size is None:
+                size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+    
+    def _scan(self):
+        """遍历缓存文件,产出 (路径, 大小, 访问时间)"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.html.gz'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_atime
+    
+    def _current_size(self) -> int:
+        with self._lock:
+            if self._size is not None:
+                return self._size
+        
+        size = sum(entry[1] for entry in self._scan())
+        with self._lock:
+            self._size = size
+        return size
+    
+    def _evict_if_needed(self):
+        """超出大小上限时按访问时间淘汰最久未使用的页面,直到降到上限的 90%"""
+        if self._current_size() <= self.max_size:
+            return
+        
+        with self._lock:
+            entries = sorted(self._scan(), key=lambda entry: entry[2])
+            size = sum(entry[1] for entry in entries)
+            target = self.max_size * 0.9
+            evicted = 0
+            
+            for path, file_size, _ in entries:
+                if size <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= file_size
+                evicted += 1
+            
+            self._size = size
+            self._stats["evictions"] += evicted
+        
+        logger.info(f"页面缓存超出上限,淘汰 {evicted} 个页面")
+
+
+_default_cache: Optional[PageCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_page_cache() -> PageCache:
+    """获取进程内共享的默认页面缓存"""
+    global _default_cache
+    
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = PageCache()
+        return _default_cache
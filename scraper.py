@@ -2,14 +2,15 @@
 数据抓取模块 - 使用 Zyte API 和 requests 从拍卖网站获取数据
 """
 
-import requests
 import json
 from typing import List, Dict, Optional
 from datetime import datetime
 from bs4 import BeautifulSoup
 import logging
 
-from config import ZYTE_API_KEY, AUCTION_SITE_URL
+from config import AUCTION_SITE_URL, CACHE_ENABLED
+from page_cache import PageCache, get_page_cache
+from http_client import HttpClient, get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -17,48 +18,48 @@ logger = logging.getLogger(__name__)
 class AuctionScraper:
     """拍卖网站数据抓取器"""
     
-    def __init__(self):
-        self.zyte_api_key = ZYTE_API_KEY
+    def __init__(self, cache: Optional[PageCache] = None, http: Optional[HttpClient] = None):
+        self.http = http or get_http_client()
         self.base_url = AUCTION_SITE_URL
-        self.session = requests.Session()
+        self.session = self.http.session
+        self.cache = cache or (get_page_cache() if CACHE_ENABLED else None)
     
-    def fetch_page_with_zyte(self, url: str) -> Optional[str]:
+    def fetch_page_with_zyte(self, url: str, use_cache: bool = True) -> Optional[str]:
         """使用 Zyte API 获取页面内容"""
+        if use_cache and self.cache:
+            html = self.cache.get(url, "zyte")
+            if html:
+                return html
+        
         try:
-            zyte_url = "https://api.zyte.com/v1/extract"
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Basic {self.zyte_api_key}"
-            }
-            
-            payload = {
-                "url": url,
-                "httpResponseBody": True,
-                "browserHtml": True
-            }
-            
-            response = requests.post(zyte_url, headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("browserHtml") or data.get("httpResponseBody")
-            else:
-                logger.error(f"Zyte API 请求失败: {response.status_code}")
+            # browserHtml 不能与 httpResponseBody 同时请求(Zyte API 返回 422)
+            data = self.http.zyte_extract(url, browserHtml=True)
+            html = data.get("browserHtml")
+            if not html:
+                logger.error("Zyte API 返回数据中没有 HTML 内容")
                 return None
+            if self.cache:
+                self.cache.set(url, "zyte", html)
+            return html
                 
         except Exception as e:
             logger.error(f"Zyte API 调用异常: {e}")
             return None
     
-    def fetch_page_simple(self, url: str) -> Optional[str]:
+    def fetch_page_simple(self, url: str, use_cache: bool = True) -> Optional[str]:
         """简单的 HTTP 请求获取页面"""
+        if use_cache and self.cache:
+            html = self.cache.get(url, "http")
+            if html:
+                return html
+        
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            }
-            response = self.session.get(url, headers=headers, timeout=30)
+            # 使用共享会话的请求头(含 User-Agent)
+            response = self.http.get(url, timeout=30)
             
             if response.status_code == 200:
+                if self.cache:
+                    self.cache.set(url, "http", response.text)
                 return response.text
             else:
                 logger.error(f"HTTP 请求失败: {response.status_code}")
@@ -0,0 +1,134 @@
+"""
+会话池模块 - 按 session_id 保存每个客户端自己的 Agent(对话历史和工具结果)
+
+会话空闲超过 idle_ttl 后淘汰,会话数超过 max_sessions 时淘汰最久未使用的会话;
+正在处理指令的会话(锁被占用)不会被淘汰,全部会话都在处理指令时暂时超出上限。
+每个会话有自己的 asyncio 锁,同一会话的指令依次处理,不同会话并行处理。
+"""
+
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from config import API_MAX_SESSIONS, API_SESSION_IDLE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class Session:
+    """一个客户端会话"""
+    
+    def __init__(self, session_id: str, agent):
+        self.session_id = session_id
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.queries = 0
+    
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "session_id": self.session_id,
+            "queries": self.queries,
+            "age_seconds": round(now - self.created, 1),
+            "idle_seconds": round(now - self.last_used, 1),
+            "history_messages": len(self.agent.history),
+            "busy": self.lock.locked()
+        }
+
+
+class SessionPool:
+    """有容量上限和空闲过期时间的会话池,线程安全"""
+    
+    def __init__(self, factory: Callable[[], object], max_sessions: int = API_MAX_SESSIONS,
+                 idle_ttl: float = API_SESSION_IDLE_TTL):
+        """
+        Args:
+            factory: 创建新会话 Agent 的函数,通常让所有会话共用一份 AgentResources
+            max_sessions: 同时保留的会话数
+            idle_ttl: 空闲过期时间(秒)
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+        self._sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+    
+    def get(self, session_id: Optional[str] = None) -> Session:
+        """
+        获取会话,不存在或已过期时创建新会话
+        
+        Args:
+            session_id: 会话 ID,为空时生成新的 ID
+        """
+        with self._lock:
+            self._expire_idle()
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex, self.factory())
+                self._sessions[session.session_id] = session
+                self.created += 1
+                logger.info(f"创建会话 {session.session_id}, 当前 {len(self._sessions)} 个会话")
+                self._evict_over_limit(keep=session.session_id)
+            self._sessions.move_to_end(session.session_id)
+            session.last_used = time.monotonic()
+            return session
+    
+    def _evict_over_limit(self, keep: str):
+        """会话数超过上限时按最久未使用的顺序淘汰空闲的会话,keep 为刚创建的会话"""
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        idle = [sid for sid, s in self._sessions.items() if sid != keep and not s.lock.locked()][:excess]
+        for session_id in idle:
+            del self._sessions[session_id]
+            self.evicted += 1
+            logger.info(f"会话数超过上限 {self.max_sessions},淘汰最久未使用的会话 {session_id}")
+        if len(idle) < excess:
+            logger.warning(f"{excess - len(idle)} 个会话正在处理指令,会话数暂时超过上限 {self.max_sessions}")
+    
+    def remove(self, session_id: str) -> bool:
+        """删除会话,返回会话是否存在"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+    
+    def expire_idle(self) -> int:
+        """淘汰空闲过期的会话,返回淘汰数"""
+        with self._lock:
+            return self._expire_idle()
+    
+    def _expire_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_ttl
+        expired = [sid for sid, s in self._sessions.items() if s.last_used < cutoff and not s.lock.locked()]
+        for session_id in expired:
+            del self._sessions[session_id]
+        if expired:
+            self.expired += len(expired)
+            logger.info(f"淘汰 {len(expired)} 个空闲会话")
+        return len(expired)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "busy": sum(1 for s in self._sessions.values() if s.lock.locked())
+            }
@@ -0,0 +1,113 @@
+"""
+请求合并模块 - 相同键的并发调用只执行一次
+
+多个会话同时抓取同一页面或同一拍卖场次时,第一个调用方执行实际的抓取,
+其余调用方等待并共享它的结果(或异常),不会重复消耗 Zyte 调用和限速令牌。
+结果不会被缓存: 调用结束后,同一键的下一次调用会重新执行。
+设置 wait_timeout 后,等待超时的调用方收到 TimeoutError,不会被卡住的执行无限期阻塞。
+"""
+
+import logging
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次进行中的调用"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    线程安全的请求合并器
+    
+    统计信息:
+        calls: 调用总数
+        executions: 实际执行的次数
+        coalesced: 等待并共享了进行中调用结果的次数
+        errors: 执行失败的次数
+        timeouts: 等待超时的次数
+        in_flight: 当前正在执行的键数
+    """
+    
+    def __init__(self, name: str = "single-flight", wait_timeout: Optional[float] = None):
+        """
+        Args:
+            name: 日志中的名称
+            wait_timeout: 等待进行中调用的最长时间(秒),为空时一直等待
+        """
+        self.name = name
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+    
+    def do(self, key: Hashable, func: Callable, *args, **kwargs):
+        """
+        执行 func(*args, **kwargs),同一 key 已有调用在执行时等待其结果
+        
+        Args:
+            key: 合并键,如页面 URL
+            func: 实际执行的函数,在第一个调用方的线程中执行
+        
+        Returns:
+            func 的返回值,同一次执行的所有调用方得到同一个对象
+        
+        Raises:
+            func 抛出的异常,所有等待的调用方都会收到
+            TimeoutError: 等待进行中的调用超过 wait_timeout
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+                self._stats["executions"] += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self._stats["coalesced"] += 1
+        
+        if not leader:
+            logger.info(f"[{self.name}] 等待进行中的相同请求: {key}")
+            if not call.done.wait(self.wait_timeout):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                logger.warning(f"[{self.name}] 等待相同请求超时 ({self.wait_timeout}s): {key}")
+                raise TimeoutError(f"等待进行中的相同请求超时 ({self.wait_timeout}s): {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+            if call.waiters:
+                logger.info(f"[{self.name}] {call.waiters} 个相同请求共享了结果: {key}")
+    
+    def stats(self) -> Dict:
+        """返回合并统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        
+        stats["coalesce_rate"] = round(stats["coalesced"] / stats["calls"], 3) if stats["calls"] else 0.0
+        return stats
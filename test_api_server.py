@@ -0,0 +1,274 @@
+"""
+测试异步 API 服务: 阻塞操作不占用事件循环,并发请求并行处理
+"""
+
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+from conftest import call_fragment, chat_response, fake_client, fake_tool_call, stream_chunk
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _ticker(ticks: list, stop: asyncio.Event):
+    """每 10ms 计数一次,事件循环被阻塞时计数停止增长"""
+    while not stop.is_set():
+        ticks.append(time.perf_counter())
+        await asyncio.sleep(0.01)
+
+
+def test_async_agent():
+    """测试异步 Agent: 等待模型和工具时事件循环继续运行,取消后对话历史仍然完整"""
+    print("\n" + "="*60)
+    print("测试: 异步 Agent")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.llm_cache = None
+    agent.intent_parser = None
+    agent.search_auctions = lambda **kwargs: time.sleep(0.3) or [{"title": "Gold Auction", "url": "u"}]
+    
+    async def create(**kwargs):
+        await asyncio.sleep(0.1)
+        wants_tool = kwargs["messages"][-1]["role"] == "user"
+        if not kwargs.get("stream"):
+            return (chat_response(tool_calls=[fake_tool_call("call_1", "search_auctions")])
+                    if wants_tool else chat_response("找到 Gold Auction"))
+        
+        async def chunks():
+            if wants_tool:
+                yield stream_chunk(tool_calls=[call_fragment(0, "call_2", "search_auctions", "{}")])
+            else:
+                for text in ("找到", " Gold Auction"):
+                    await asyncio.sleep(0.05)
+                    yield stream_chunk(content=text)
+            yield stream_chunk(usage=SimpleNamespace(prompt_tokens=42))
+        return chunks()
+    
+    agent.aclient = fake_client(create)
+    
+    async def run():
+        ticks, stop = [], asyncio.Event()
+        ticker = asyncio.create_task(_ticker(ticks, stop))
+        start = time.perf_counter()
+        answer = await agent.aprocess_command("搜索金币拍卖")
+        events = [event async for event in agent.astream_command("再搜索一次")]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+        return answer, events, ticks, elapsed
+    
+    answer, events, ticks, elapsed = asyncio.run(run())
+    print(f"两条指令耗时 {elapsed:.2f}s, 期间事件循环计数 {len(ticks)}")
+    assert answer == "找到 Gold Auction"
+    assert [e["type"] for e in events] == ["tool_call", "tool_result", "token", "token", "done"]
+    assert events[-1]["content"] == "找到 Gold Auction"
+    # 两次工具调用共阻塞 0.6s,事件循环仍然按时计数
+    assert len(ticks) >= elapsed / 0.01 * 0.5
+    
+    # 请求在工具执行中被取消: 补齐工具结果,对话可以继续
+    agent.reset_conversation()
+    
+    async def cancelled():
+        await asyncio.wait_for(agent.aprocess_command("搜索金币拍卖"), timeout=0.2)
+    
+    try:
+        asyncio.run(cancelled())
+        raise AssertionError("应当超时")
+    except asyncio.TimeoutError:
+        pass
+    roles = [m["role"] for m in agent.conversation_history]
+    assert roles == ["user", "assistant", "tool"]
+    assert agent.conversation_history[-1]["content"] == "[工具调用已中断]"
+    
+    # 规则解析的快速路径同样在工具线程池中执行搜索
+    from intent_parser import IntentParser
+    
+    agent.intent_parser = IntentParser()
+    agent.reset_conversation()
+    
+    async def fast_path():
+        ticks, stop = [], asyncio.Event()
+        ticker = asyncio.create_task(_ticker(ticks, stop))
+        start = time.perf_counter()
+        events = [event async for event in agent.astream_command("列出未来三十天的金币拍卖")]
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+        return events, ticks, elapsed
+    
+    events, ticks, elapsed = asyncio.run(fast_path())
+    assert [e["type"] for e in events] == ["tool_call", "tool_result", "token", "done"]
+    assert "Gold Auction" in events[-1]["content"]
+    assert len(ticks) >= elapsed / 0.01 * 0.5
+    print("✓ 异步路径不阻塞事件循环,取消后对话历史完整")
+
+
+def test_concurrent_requests():
+    """测试并发的 /api/search 请求并行处理,超时返回 504"""
+    print("\n" + "="*60)
+    print("测试: API 并发请求")
+    print("="*60)
+    
+    from fastapi import HTTPException
+    
+    import api_server
+    
+    api_server.agent.search_auctions = lambda **kwargs: time.sleep(0.2) or [{"title": "Auction"}]
+    requests = [api_server.SearchRequest(keywords=["gold"]) for _ in range(8)]
+    
+    async def run():
+        start = time.perf_counter()
+        health = asyncio.create_task(api_server.health_check())
+        results = await asyncio.gather(*(api_server.search(r) for r in requests))
+        return results, await health, time.perf_counter() - start
+    
+    results, health, elapsed = asyncio.run(run())
+    print(f"8 个并发搜索请求(每个 0.2s)耗时 {elapsed:.2f}s")
+    assert all(r["count"] == 1 for r in results) and health == {"status": "healthy"}
+    assert elapsed < 0.2 * 8 / 2
+    
+    timeout = api_server.API_REQUEST_TIMEOUT
+    api_server.API_REQUEST_TIMEOUT = 0.05
+    try:
+        asyncio.run(api_server.search(requests[0]))
+        raise AssertionError("应当超时")
+    except HTTPException as e:
+        assert e.status_code == 504
+    finally:
+        api_server.API_REQUEST_TIMEOUT = timeout
+    print("✓ 并发请求并行处理,超时返回 504")
+
+
+def test_session_pool():
+    """测试会话池: 空闲过期、容量上限淘汰最久未使用的会话、共享资源"""
+    print("\n" + "="*60)
+    print("测试: 会话池")
+    print("="*60)
+    
+    from agent_v2 import AgentResources, AuctionAgentV2
+    from session_pool import SessionPool
+    
+    resources = AgentResources(tool_workers=2)
+    pool = SessionPool(lambda: AuctionAgentV2(resources, max_results=3), max_sessions=3, idle_ttl=0.2)
+    
+    a = pool.get("a")
+    assert pool.get("a") is a and a.agent.result_shaper.store.max_results == 3
+    b, c = pool.get("b"), pool.get()
+    assert len(c.session_id) == 32 and len(pool) == 3
+    
+    # a 最近使用过,超出上限时淘汰 b
+    pool.get("a")
+    pool.get("d")
+    assert "b" not in pool and "a" in pool and pool.stats()["evicted"] == 1
+    
+    # 正在处理指令的会话不会被淘汰,跳过它淘汰下一个空闲的会话
+    async def evict_while_busy():
+        async with c.lock:
+            pool.get("e")
+            assert c.session_id in pool and "a" not in pool
+            # 全部会话都在处理指令时暂时超出上限,新会话仍然可用,之后再创建会话时恢复到上限
+            async with pool.get("d").lock, pool.get("e").lock:
+                f = pool.get("f")
+                assert len(pool) == 4 and f.session_id in pool
+    
+    asyncio.run(evict_while_busy())
+    assert pool.stats()["evicted"] == 2
+    pool.get("a")
+    assert len(pool) == 3 and pool.stats()["evicted"] == 4 and "a" in pool
+    
+    # 所有会话共用抓取器、工具线程池和模型客户端,对话历史各自独立
+    assert a.agent.lot_scraper is b.agent.lot_scraper
+    assert a.agent.tool_executor is resources.tool_executor and a.agent.history is not b.agent.history
+    
+    time.sleep(0.25)
+    assert pool.expire_idle() == 3 and len(pool) == 0
+    assert pool.get("a") is not a and pool.remove("a") and not pool.remove("a")
+    print(f"✓ 会话池统计: {pool.stats()}")
+
+
+def test_session_isolation():
+    """测试不同会话的查询并行处理、历史互不影响,同一会话的查询依次处理"""
+    print("\n" + "="*60)
+    print("测试: 会话隔离")
+    print("="*60)
+    
+    from fastapi import HTTPException
+    
+    import api_server
+    
+    api_server.resources.llm_cache = None
+    api_server.resources.intent_parser = None
+    
+    async def create(**kwargs):
+        await asyncio.sleep(0.2)
+        question = kwargs["messages"][-1]["content"]
+        turns = sum(1 for m in kwargs["messages"] if m["role"] == "user")
+        return chat_response(f"第 {turns} 轮: {question}")
+    
+    api_server.resources.aclient = fake_client(create)
+    
+    async def run():
+        start = time.perf_counter()
+        first = await asyncio.gather(*(api_server.query(api_server.QueryRequest(query=f"问题 {i}"))
+                                       for i in range(5)))
+        parallel = time.perf_counter() - start
+        
+        session_id = first[0].session_id
+        start = time.perf_counter()
+        second = await asyncio.gather(*(api_server.query(api_server.QueryRequest(query=q, session_id=session_id))
+                                        for q in ("追问 A", "追问 B")))
+        serial = time.perf_counter() - start
+        return first, second, parallel, serial
+    
+    first, second, parallel, serial = asyncio.run(run())
+    print(f"5 个会话并行 {parallel:.2f}s, 同一会话 2 条指令 {serial:.2f}s")
+    assert len({r.session_id for r in first}) == 5
+    assert all(r.response == f"第 1 轮: 问题 {i}" for i, r in enumerate(first))
+    assert parallel < 0.5 and serial >= 0.4
+    assert sorted(r.response for r in second) == ["第 2 轮: 追问 A", "第 3 轮: 追问 B"]
+    
+    # 重置只影响指定会话
+    session_id = first[0].session_id
+    asyncio.run(api_server.reset_conversation(api_server.ResetRequest(session_id=session_id)))
+    assert session_id not in api_server.sessions and first[1].session_id in api_server.sessions
+    try:
+        asyncio.run(api_server.reset_conversation(api_server.ResetRequest(session_id=session_id)))
+        raise AssertionError("应当返回 404")
+    except HTTPException as e:
+        assert e.status_code == 404
+    print(f"✓ 会话互不影响: {asyncio.run(api_server.session_stats())}")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("API 服务测试")
+    print("="*60)
+    
+    try:
+        test_async_agent()
+        test_concurrent_requests()
+        test_session_pool()
+        test_session_isolation()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
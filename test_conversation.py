@@ -0,0 +1,218 @@
+"""
+测试对话历史的 token 预算
+"""
+
+import json
+import logging
+import time
+from types import SimpleNamespace
+
+from conftest import call_fragment, chat_response, fake_client, fake_tool_call, stream_chunk
+from conversation import ConversationHistory, EVICTED_PREFIX, message_tokens
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_MESSAGE = {"role": "system", "content": "你是一个拍卖信息处理助手。"}
+
+
+def _tool_turn(history: ConversationHistory, turn: int, result_chars: int = 4000):
+    """模拟一轮带工具调用的对话"""
+    call_id = f"call_{turn}"
+    history.add_user(f"第 {turn} 个问题: 找出 Morgan Dollar 拍品")
+    history.append({"role": "assistant", "content": None, "tool_calls": [{
+        "id": call_id, "type": "function",
+        "function": {"name": "get_lots_from_auction", "arguments": "{}"}}]})
+    history.append({"role": "tool", "tool_call_id": call_id,
+                    "content": json.dumps({"count": 300, "handle": f"res_{turn}", "rows": "x" * result_chars})})
+    history.append({"role": "assistant", "content": f"第 {turn} 轮找到 300 个拍品"})
+
+
+def _check_pairs(messages):
+    """每条工具结果前都有对应的工具调用"""
+    pending = set()
+    for message in messages:
+        for call in message.get("tool_calls") or []:
+            pending.add(call["id"])
+        if message["role"] == "tool":
+            assert message["tool_call_id"] in pending
+            pending.discard(message["tool_call_id"])
+
+
+def test_budget_and_summary():
+    """测试超出预算时先省略工具结果,再折叠为摘要"""
+    print("\n" + "="*60)
+    print("测试: 对话历史预算")
+    print("="*60)
+    
+    history = ConversationHistory(max_tokens=5000, keep_turns=2, summary_max_chars=600)
+    
+    # 预算足够时不做任何改动
+    _tool_turn(history, 1, result_chars=400)
+    messages = history.build(SYSTEM_MESSAGE)
+    assert len(messages) == 5 and history.evicted_results == 0
+    
+    sizes = []
+    for turn in range(2, 41):
+        _tool_turn(history, turn)
+        messages = history.build(SYSTEM_MESSAGE, reserved_tokens=500)
+        sizes.append(sum(message_tokens(m) for m in messages) + 500)
+        _check_pairs(messages)
+    
+    print(f"prompt 估算 token: 第 2 轮 {sizes[0]}, 第 40 轮 {sizes[-1]}, 最大 {max(sizes)}")
+    assert max(sizes) <= 5000
+    assert history.evicted_results > 30 and history.summarized_turns > 0
+    
+    # 最近的轮次原样保留,较早的工具结果只保留句柄
+    assert messages[-1]["content"] == "第 40 轮找到 300 个拍品"
+    assert messages[-2]["content"].startswith('{"count": 300')
+    evicted = [m for m in messages if m["role"] == "tool" and m["content"].startswith(EVICTED_PREFIX)]
+    assert all("res_" in m["content"] for m in evicted)
+    
+    # 摘要按字符上限滚动,保留最近折叠的轮次
+    assert messages[1]["role"] == "system" and "get_lots_from_auction" in history.summary
+    assert len(history.summary) <= 600 and "第 1 个问题" not in history.summary
+    
+    history.clear()
+    assert len(history) == 0 and history.summary == "" and history.turn == 0
+    print("✓ 历史大小保持在预算内,工具调用与结果成对保留")
+
+
+def test_agent_history():
+    """测试 Agent 长会话中每轮的 prompt 大小保持稳定"""
+    print("\n" + "="*60)
+    print("测试: Agent 长会话")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.history = ConversationHistory(max_tokens=6000, keep_turns=2)
+    agent.search_auctions = lambda **kwargs: [
+        {"title": f"Auction {i}", "url": f"https://example.com/a{i}", "date": "2025-12-15"} for i in range(40)
+    ]
+    
+    calls = []
+    
+    def create(model, messages, tools=None, tool_choice=None):
+        calls.append(messages)
+        usage = SimpleNamespace(prompt_tokens=len(json.dumps(messages, ensure_ascii=False)) // 3)
+        if tools and len(calls) % 2 == 1:
+            return chat_response(tool_calls=[fake_tool_call(f"call_{len(calls)}", "search_auctions")], usage=usage)
+        return chat_response("找到 40 个拍卖场次。" * 20, usage=usage)
+    
+    agent.client = fake_client(create)
+    
+    for turn in range(25):
+        agent.process_command(f"搜索拍卖场次 {turn}")
+    
+    estimated = [s["estimated_tokens"] for s in agent.history.turn_stats]
+    assert len(estimated) == 50 and all(s["prompt_tokens"] for s in agent.history.turn_stats)
+    print(f"估算 prompt token: 前 4 次 {estimated[:4]}, 最后 4 次 {estimated[-4:]}")
+    assert max(estimated) <= 6000 and agent.history.summarized_turns > 0
+    assert agent.conversation_history is agent.history.messages
+    
+    agent.reset_conversation()
+    assert agent.conversation_history == []
+    print("✓ 长会话中每轮 prompt 大小不再增长")
+
+
+def test_multi_step_stream():
+    """测试多步工具循环和流式输出"""
+    print("\n" + "="*60)
+    print("测试: 多步工具循环与流式输出")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.search_auctions = lambda **kwargs: [{"title": "Showcase", "url": "https://example.com/a1"}]
+    agent.get_lots_from_auction = lambda auction_url, **kwargs: (
+        time.sleep(0.2) or [{"lot_number": "1", "title": "Morgan Dollar", "current_bid": "100"}])
+    
+    requests = []
+    
+    def stream_step(step):
+        if step == 1:
+            # 工具调用的名称和参数分多个片段到达
+            yield stream_chunk(tool_calls=[call_fragment(0, "c1", "search_", '{"keywords":')])
+            yield stream_chunk(tool_calls=[call_fragment(0, None, "auctions", ' ["silver"]}')])
+        elif step == 2:
+            yield stream_chunk(tool_calls=[call_fragment(0, "c2", "get_lots_from_auction",
+                                                    '{"auction_url": "https://example.com/a1"}')])
+        else:
+            for text in ("找到", " 1 个", "拍品。"):
+                time.sleep(0.05)
+                yield stream_chunk(content=text)
+        yield stream_chunk(usage=SimpleNamespace(prompt_tokens=1000 + step))
+    
+    def create(**kwargs):
+        requests.append(kwargs)
+        assert kwargs["stream"] and kwargs["stream_options"] == {"include_usage": True}
+        return stream_step(len(requests))
+    
+    agent.client = fake_client(create)
+    
+    start = time.perf_counter()
+    events = []
+    first_token = None
+    for event in agent.stream_command("找出 silver 拍卖中的拍品"):
+        if event["type"] == "token" and first_token is None:
+            first_token = time.perf_counter() - start
+        events.append(event)
+    total = time.perf_counter() - start
+    
+    print(f"首个文本片段 {first_token:.2f}s, 完成 {total:.2f}s")
+    assert [e["type"] for e in events] == ["tool_call", "tool_result", "tool_call", "tool_result",
+                                           "token", "token", "token", "done"]
+    assert events[0] == {"type": "tool_call", "name": "search_auctions", "arguments": '{"keywords": ["silver"]}'}
+    assert events[-1]["content"] == "找到 1 个拍品。" and total - first_token >= 0.09
+    assert len(requests) == 3 and all(r["tool_choice"] == "auto" for r in requests)
+    assert [s["prompt_tokens"] for s in agent.history.turn_stats] == [1001, 1002, 1003]
+    
+    roles = [m["role"] for m in agent.conversation_history]
+    assert roles == ["user", "assistant", "tool", "assistant", "tool", "assistant"]
+    
+    # 模型一直调用工具时,最后一次请求要求直接回答
+    agent.reset_conversation()
+    agent.max_steps = 3
+    choices = []
+    
+    def always_tools(**kwargs):
+        choices.append(kwargs["tool_choice"])
+        if kwargs["tool_choice"] == "none":
+            return chat_response("根据已有结果回答")
+        return chat_response(tool_calls=[fake_tool_call(f"c{len(choices)}", "search_auctions")])
+    
+    agent.client = fake_client(always_tools)
+    assert agent.process_command("一直搜索") == "根据已有结果回答"
+    assert choices == ["auto", "auto", "none"]
+    print("✓ 工具可以连续调用,文本片段到达后立即产出")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("对话历史测试")
+    print("="*60)
+    
+    try:
+        test_budget_and_summary()
+        test_agent_history()
+        test_multi_step_stream()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
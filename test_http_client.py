@@ -0,0 +1,171 @@
+"""
+测试共享 HTTP 请求层
+"""
+
+import asyncio
+import tempfile
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_client import DEFAULT_USER_AGENT, HttpClient
+from page_cache import PageCache
+from scraper import AuctionScraper
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """/flaky 前两次返回 503,/slow 记录同时处理中的请求数,/ua 返回请求的 User-Agent"""
+    
+    lock = threading.Lock()
+    flaky_calls = 0
+    active = 0
+    max_active = 0
+    
+    def do_GET(self):
+        cls = type(self)
+        
+        if self.path == '/flaky':
+            with cls.lock:
+                cls.flaky_calls += 1
+                calls = cls.flaky_calls
+            self._reply(503 if calls <= 2 else 200, f"call {calls}")
+        
+        elif self.path == '/ua':
+            self._reply(200, self.headers.get("User-Agent", ""))
+        
+        elif self.path.startswith('/slow'):
+            with cls.lock:
+                cls.active += 1
+                cls.max_active = max(cls.max_active, cls.active)
+            time.sleep(0.1)
+            with cls.lock:
+                cls.active -= 1
+            self._reply(200, self.path)
+        
+        else:
+            self._reply(404, "not found")
+    
+    def _reply(self, status: int, body: str):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_retry_and_host_limit():
+    """测试暂时性错误重试、主机并发上限和异步接口"""
+    print("\n" + "="*60)
+    print("测试: HTTP 请求层重试与并发控制")
+    print("="*60)
+    
+    server, base_url = start_server()
+    client = HttpClient(per_host_limit=2, max_retries=3, backoff_base=0.01, backoff_max=0.05)
+    
+    try:
+        # 同步接口: 503 两次后成功
+        response = client.get(f"{base_url}/flaky")
+        print(f"/flaky: {response.status_code} {response.text}")
+        assert response.status_code == 200 and response.text == "call 3"
+        
+        # 非暂时性错误不重试
+        response = client.get(f"{base_url}/missing")
+        assert response.status_code == 404
+        
+        # 异步接口: 8 个并发请求,同一主机同时最多 2 个
+        async def fetch_all():
+            return await asyncio.gather(*[client.arequest("GET", f"{base_url}/slow/{i}") for i in range(8)])
+        
+        start = time.perf_counter()
+        responses = asyncio.run(fetch_all())
+        elapsed = time.perf_counter() - start
+        
+        print(f"8 个并发请求耗时 {elapsed:.2f}s,最大同时处理数 {FlakyHandler.max_active}")
+        assert [r.text for r in responses] == [f"/slow/{i}" for i in range(8)]
+        assert FlakyHandler.max_active == 2
+        print("✓ 重试、主机并发上限和异步接口正常")
+    
+    finally:
+        client.close()
+        server.shutdown()
+
+
+class ZyteRecorder(HttpClient):
+    """记录 Zyte API 请求参数,返回预设数据的 HTTP 客户端"""
+    
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+        self.options = []
+    
+    def zyte_extract(self, url, **options):
+        self.options.append(options)
+        return self.data
+
+
+def test_auction_scraper_requests():
+    """测试拍卖列表抓取使用共享会话的 User-Agent,Zyte 请求只要求 browserHtml"""
+    print("\n" + "="*60)
+    print("测试: 拍卖列表抓取请求")
+    print("="*60)
+    
+    server, base_url = start_server()
+    client = HttpClient()
+    try:
+        scraper = AuctionScraper(cache=PageCache(tempfile.mkdtemp(prefix='auction_cache_')), http=client)
+        assert scraper.fetch_page_simple(f"{base_url}/ua", use_cache=False) == DEFAULT_USER_AGENT
+    finally:
+        client.close()
+        server.shutdown()
+    
+    # 没有 browserHtml 时不把 base64 的响应内容当作 HTML 返回或缓存
+    zyte = ZyteRecorder({"httpResponseBody": "PGh0bWw+PC9odG1sPg=="})
+    scraper = AuctionScraper(cache=PageCache(tempfile.mkdtemp(prefix='auction_cache_')), http=zyte)
+    assert scraper.fetch_page_with_zyte("https://example.com/auctions") is None
+    assert zyte.options == [{"browserHtml": True}]
+    assert scraper.cache.get("https://example.com/auctions", "zyte") is None
+    
+    zyte.data = {"browserHtml": "<html>ok</html>"}
+    assert scraper.fetch_page_with_zyte("https://example.com/auctions") == "<html>ok</html>"
+    assert scraper.cache.get("https://example.com/auctions", "zyte") == "<html>ok</html>"
+    print("✓ 请求参数与共享会话一致")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("HTTP 请求层测试")
+    print("="*60)
+    
+    try:
+        test_retry_and_host_limit()
+        test_auction_scraper_requests()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+测试规则意图解析和跳过 LLM 的快速路径
+"""
+
+import ast
+import logging
+import os
+import re
+import time
+
+from conftest import chat_response, fake_client
+from intent_parser import IntentParser, parse_chinese_number
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+COINS = ["U.S. Coins & Related", "World Coins"]
+CURRENCY = ["U.S. Paper Currency", "World Paper Currency"]
+
+LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "auction_agent.log")
+LOG_COMMAND = re.compile(r' - INFO - 处理用户指令: (.*)$')
+LOG_TOOL_CALL = re.compile(r' - INFO - 调用工具: (\w+), 参数: (.*)$')
+
+# auction_agent.log 中出现过的指令,期望值为新对话中第一句时的参数(手工标注);None 表示应交给 LLM
+COMMAND_QUERIES = [
+    ("搜索最近14天内world coin中的金币", {"time_range_days": 14, "categories": ["World Coins"], "keywords": ["gold"]}),
+    ("使用gold作为关键词搜索", {"keywords": ["gold"]}),
+    ("gold", {"keywords": ["gold"]}),
+    ("列出未来二周的拍卖列表", {"time_range_days": 14}),
+    ("最近三十天内", {"time_range_days": 30}),
+    ("列出所有金币", {"keywords": ["gold"]}),
+    ("返回最近七天的所有拍品", None),
+    ("搜索最近在香港的拍卖中的所有金币拍品", None),
+    ("December 2025 Showcase Auction - Session 1 列出这一场的所有double eagle金币", None),
+    ("最近有一场纽约的拍卖,看看里面有什么英国金币", None),
+    ("搜索吧", None),
+    ("q", None),
+    ("tuichu", None),
+]
+
+# 同类指令的其他说法,包括英文
+VARIANT_QUERIES = [
+    ("最近七天的纸币拍卖", {"time_range_days": 7, "categories": CURRENCY}),
+    ("未来一个月的古币拍卖", {"time_range_days": 30, "categories": ["Ancient Coins"]}),
+    ("帮我找一下下周的银币拍卖", {"time_range_days": 14, "keywords": ["silver"]}),
+    ("查找包含Denmark的拍卖", {"keywords": ["denmark"]}),
+    ("7天内的world coins拍卖", {"time_range_days": 7, "categories": ["World Coins"]}),
+    ("find gold coin auctions in the next 2 weeks",
+     {"time_range_days": 14, "categories": COINS, "keywords": ["gold"]}),
+    ("show me currency auctions this week", {"time_range_days": 7, "categories": CURRENCY}),
+    ('search auctions with keyword "morgan"', {"keywords": ["morgan"]}),
+    ("keyword double eagle auctions", {"keywords": ["double eagle"]}),
+    ("搜索关键词 hong kong 的拍卖", {"keywords": ["hong kong"]}),
+    ("search auctions containing new york", {"keywords": ["new york"]}),
+    ("30天内结束的拍卖", {"time_range_days": 30}),
+    ("list all token auctions within 10 days", {"time_range_days": 10, "categories": ["Numismatic Americana"]}),
+    ("导出最近七天的金币拍品到 CSV", None),
+    ("金币的平均价格是多少", None),
+    ("把它们保存下来", None),
+    ("What is the weather like", None),
+    # 否定条件和已经过去的时间范围无法用 search_auctions 的参数表达
+    ("不要金币的拍卖", None),
+    ("除了world coins以外的拍卖", None),
+    ("find gold coins not silver", None),
+    ("auctions without gold", None),
+    ("过去30天的拍卖", None),
+    ("上周的拍卖", None),
+    ("last 30 days auctions", None),
+    ("已经结束的拍卖", None),
+]
+
+
+def test_accuracy():
+    """测试日志中的指令: 能解析的参数与模型一致,其余交给 LLM"""
+    print("\n" + "="*60)
+    print("测试: 意图解析")
+    print("="*60)
+    
+    assert parse_chinese_number("十四") == 14 and parse_chinese_number("三十") == 30
+    assert parse_chinese_number("二") == 2 and parse_chinese_number("两") == 2 and parse_chinese_number("周") is None
+    
+    parser = IntentParser()
+    threshold = 0.8
+    errors = []
+    handled = 0
+    for query, expected in COMMAND_QUERIES + VARIANT_QUERIES:
+        result = parser.parse(query)
+        actual = result.arguments if result.confidence >= threshold else None
+        handled += actual is not None
+        if actual != expected:
+            errors.append((query, expected, result.to_dict()))
+    
+    total = len(COMMAND_QUERIES) + len(VARIANT_QUERIES)
+    print(f"{total} 条指令: 直接处理 {handled} 条, 交给 LLM {total - handled} 条")
+    assert not errors, errors
+    print("✓ 简单搜索指令解析正确,复杂指令交给 LLM")
+
+
+def _read_log_line(raw: bytes) -> str:
+    # 早期的日志以 GBK 编码写入
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("gbk", errors="replace")
+
+
+def _logged_commands():
+    """
+    从 auction_agent.log 读取用户指令和模型随后选择的第一个工具调用
+    
+    Returns:
+        [(指令, 是否为会话的第一条指令, 工具名或 None, 参数或 None)]
+    """
+    commands = []
+    first_in_session = True
+    with open(LOG_FILE, "rb") as f:
+        for raw in f:
+            line = _read_log_line(raw).rstrip("\r\n")
+            if " - __main__ - " in line and "初始化完成" in line:
+                first_in_session = True
+            elif LOG_COMMAND.search(line):
+                commands.append([LOG_COMMAND.search(line).group(1), first_in_session, None, None])
+                first_in_session = False
+            elif LOG_TOOL_CALL.search(line) and commands and commands[-1][2] is None:
+                match = LOG_TOOL_CALL.search(line)
+                commands[-1][2:] = [match.group(1), ast.literal_eval(match.group(2))]
+    return [tuple(command) for command in commands]
+
+
+def test_logged_commands():
+    """测试快速路径会直接处理的日志指令,参数与当时模型选择的工具调用一致"""
+    print("\n" + "="*60)
+    print("测试: 与日志中模型的选择比较")
+    print("="*60)
+    
+    parser = IntentParser()
+    threshold = 0.8
+    commands = _logged_commands()
+    assert len(commands) >= 10
+    
+    handled = []
+    for query, first_in_session, tool, arguments in commands:
+        result = parser.parse(query)
+        # 与 AuctionAgentV2._parse_intent 相同: 有上文时只直接处理明确提到拍卖的指令
+        if result.confidence < threshold or not (first_in_session or result.explicit):
+            continue
+        handled.append(query)
+        assert tool == "search_auctions" and result.arguments == arguments, (query, tool, arguments, result)
+    
+    print(f"日志中 {len(commands)} 条指令, 快速路径直接处理 {len(handled)} 条: {handled}")
+    assert handled
+    print("✓ 直接处理的指令与模型当时的工具调用一致")
+
+
+def test_agent_fast_path():
+    """测试置信度足够的指令不请求模型,结果照常写入对话历史"""
+    print("\n" + "="*60)
+    print("测试: Agent 快速路径")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.llm_cache = None
+    requests = []
+    
+    def create(**kwargs):
+        requests.append(kwargs)
+        time.sleep(0.05)
+        return chat_response("模型回复")
+    
+    agent.client = fake_client(create)
+    
+    start = time.perf_counter()
+    events = list(agent.stream_command("列出未来三十天的world coins拍卖"))
+    elapsed = time.perf_counter() - start
+    assert not requests
+    assert [e["type"] for e in events] == ["tool_call", "tool_result", "token", "done"]
+    assert events[0]["arguments"] == '{"time_range_days": 30, "categories": ["World Coins"]}'
+    print(f"快速路径耗时 {elapsed * 1000:.1f} ms")
+    
+    roles = [m["role"] for m in agent.conversation_history]
+    assert roles == ["user", "assistant", "tool", "assistant"]
+    assert agent.conversation_history[1]["tool_calls"][0]["id"] == agent.conversation_history[2]["tool_call_id"]
+    
+    # 有上下文时,没有明确提到拍卖的指令可能指上文的拍卖场次,交给模型
+    assert agent.process_command("列出所有金币") == "模型回复" and len(requests) == 1
+    assert "找到" in agent.process_command("搜索 gold 拍卖") and len(requests) == 1
+    
+    # 置信度不足时交给模型
+    agent.reset_conversation()
+    assert agent.process_command("最近有一场纽约的拍卖,看看里面有什么英国金币") == "模型回复"
+    assert len(requests) == 2
+    
+    # 快速路径中搜索出错时补上工具结果,下一条指令发送给模型的对话历史仍然完整
+    agent.reset_conversation()
+    search_auctions = agent.search_auctions
+    
+    def failing_search(**kwargs):
+        raise RuntimeError("搜索服务不可用")
+    
+    agent.search_auctions = failing_search
+    events = list(agent.stream_command("列出未来三十天的world coins拍卖"))
+    assert events[-1] == {"type": "error", "message": "搜索服务不可用"}
+    agent.search_auctions = search_auctions
+    assert agent.process_command("列出所有金币") == "模型回复" and len(requests) == 3
+    sent = requests[-1]["messages"]
+    call_ids = [call["id"] for m in sent if m.get("tool_calls") for call in m["tool_calls"]]
+    assert call_ids and call_ids == [m["tool_call_id"] for m in sent if m["role"] == "tool"]
+    assert "搜索服务不可用" in next(m["content"] for m in sent if m["role"] == "tool")
+    
+    agent.intent_parser = None
+    agent.reset_conversation()
+    assert agent.process_command("gold") == "模型回复" and len(requests) == 4
+    print("✓ 简单搜索不请求模型,其余指令照常交给模型")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("意图解析测试")
+    print("="*60)
+    
+    try:
+        test_accuracy()
+        test_logged_commands()
+        test_agent_fast_path()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
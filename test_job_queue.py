@@ -0,0 +1,217 @@
+"""
+测试后台任务队列: 进度、增量结果、去重、取消和重启后查询
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from job_queue import (
+    Job, JobQueue, JobQueueFull, JobStore,
+    JOB_CANCELLED, JOB_INTERRUPTED, JOB_RUNNING, JOB_SUCCEEDED
+)
+from lot_scraper import RateLimiter
+from lot_store import LotStore
+from test_lot_scraper import FakePagedScraper
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _wait(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.02)
+
+
+def test_scrape_job():
+    """测试抓取任务: 立即返回,执行中可读取进度和部分结果,相同任务去重,重启后仍可查询"""
+    print("\n" + "="*60)
+    print("测试: 后台抓取任务")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.store = LotStore(":memory:")
+    agent.lot_scraper = FakePagedScraper(total_pages=10, page_delay=0.2, max_workers=1,
+                                         rate_limiter=RateLimiter(rate=0))
+    
+    job_dir = tempfile.mkdtemp(prefix='jobs_')
+    jobs = JobQueue({"scrape": agent.run_scrape_job}, store=JobStore(job_dir), persist_interval=0.1)
+    params = {"auction_urls": ["https://example.com/auctions/a", "https://example.com/auctions/b"]}
+    
+    start = time.perf_counter()
+    job, created = jobs.submit("scrape", params)
+    assert created and time.perf_counter() - start < 0.1
+    
+    # 参数相同的任务正在进行时返回同一任务
+    same, created = jobs.submit("scrape", dict(params))
+    assert same is job and not created
+    
+    _wait(lambda: job.progress()["pages_done"] >= 4)
+    progress = job.progress()
+    assert job.status == JOB_RUNNING and progress["auctions_total"] == 2
+    assert progress["total_pages"] == 20 and progress["eta_seconds"] > 0
+    print(f"执行中: {progress['pages_done']}/{progress['total_pages']} 页, "
+          f"预计剩余 {progress['eta_seconds']}s")
+    
+    _wait(lambda: job.results_count > 0)
+    partial = jobs.results(job.id, 0, 1000)
+    assert partial and not job.finished
+    
+    _wait(lambda: job.finished)
+    assert job.status == JOB_SUCCEEDED, job.error
+    assert job.results_count == 60 and job.result["lots_count"] == 60
+    assert job.progress()["lots_found"] == 60 and job.progress()["eta_seconds"] == 0
+    rest = jobs.results(job.id, len(partial), 1000)
+    assert len(partial) + len(rest) == 60
+    assert {lot["lot_number"] for lot in partial + rest} == {str(70000 + p * 10 + i)
+                                                             for p in range(1, 11) for i in range(3)}
+    
+    # 任务结束后可以提交新的相同任务
+    assert jobs.submit("scrape", params)[0] is not job
+    jobs.shutdown(wait=True)
+    
+    # 重启后从任务目录读取已结束的任务
+    restarted = JobQueue({"scrape": agent.run_scrape_job}, store=JobStore(job_dir))
+    loaded = restarted.get(job.id)
+    assert loaded.status == JOB_SUCCEEDED and loaded.progress()["lots_found"] == 60
+    assert len(restarted.results(job.id, 0, 1000)) == 60
+    restarted.shutdown()
+    print(f"✓ 任务完成: {job.result['lots_count']} 个拍品, 耗时 {job.finished_at - job.started_at:.2f}s")
+
+
+def test_cancel_and_limits():
+    """测试取消任务、任务数上限和重启时中断的任务"""
+    print("\n" + "="*60)
+    print("测试: 取消与上限")
+    print("="*60)
+    
+    job_dir = tempfile.mkdtemp(prefix='jobs_')
+    started = threading.Event()
+    
+    def slow(job: Job):
+        started.set()
+        job.cancel_event.wait(10)
+        return {"stopped": True}
+    
+    jobs = JobQueue({"slow": slow}, max_workers=1, max_pending=2, store=JobStore(job_dir))
+    first, _ = jobs.submit("slow", {"n": 1})
+    queued, _ = jobs.submit("slow", {"n": 2})
+    try:
+        jobs.submit("slow", {"n": 3})
+        raise AssertionError("应当超出上限")
+    except JobQueueFull:
+        pass
+    try:
+        jobs.submit("unknown", {})
+        raise AssertionError("应当拒绝未知的任务类型")
+    except ValueError:
+        pass
+    
+    started.wait(5)
+    assert jobs.cancel(queued.id) and jobs.cancel(first.id)
+    _wait(lambda: first.finished and queued.finished)
+    assert first.status == JOB_CANCELLED and queued.status == JOB_CANCELLED and queued.started_at is None
+    assert not jobs.cancel(first.id)
+    jobs.shutdown(wait=True)
+    
+    # 模拟服务在任务执行中退出
+    store = JobStore(job_dir)
+    crashed = Job("slow", {"n": 4})
+    crashed.status = JOB_RUNNING
+    store.save(crashed)
+    restarted = JobQueue({"slow": slow}, store=store)
+    assert restarted.get(crashed.id).status == JOB_INTERRUPTED
+    restarted.shutdown()
+    print("✓ 任务可以取消,超出上限时拒绝提交,重启时未完成的任务标记为中断")
+
+
+def test_job_api():
+    """测试任务 API: 提交返回 202 和任务 ID,查询返回进度和分页结果"""
+    print("\n" + "="*60)
+    print("测试: 任务 API")
+    print("="*60)
+    
+    from fastapi import HTTPException
+    
+    import api_server
+    
+    def fake(job: Job):
+        for i in range(5):
+            job.add_results([{"lot_number": str(i)}])
+        return {"lots_count": 5}
+    
+    api_server.jobs = JobQueue({"scrape": fake}, store=JobStore(tempfile.mkdtemp(prefix='jobs_')))
+    
+    async def run():
+        submitted = await api_server.submit_job(api_server.JobRequest(auction_urls=["https://example.com/a"]))
+        _wait(lambda: api_server.jobs.get(submitted["job_id"]).finished)
+        page = await api_server.job_status(submitted["job_id"], offset=2, limit=2)
+        return submitted, page
+    
+    submitted, page = asyncio.run(run())
+    assert submitted["status"] in ("queued", "running", "succeeded") and not submitted["deduplicated"]
+    assert page["status"] == JOB_SUCCEEDED and page["results_count"] == 5
+    assert [r["lot_number"] for r in page["results"]] == ["2", "3"] and page["next_offset"] == 4
+    
+    # 导出文件只能写入 EXPORT_DIR,不接受路径和未知的格式
+    api_server.EXPORT_DIR = tempfile.mkdtemp(prefix='exports_')
+    exports = []
+    api_server.jobs = JobQueue({"export": lambda job: exports.append(job.params) or {}},
+                               store=JobStore(tempfile.mkdtemp(prefix='jobs_')))
+    submitted = asyncio.run(api_server.submit_job(api_server.JobRequest(
+        kind="export", lot_keywords=["gold"], output_file="gold.csv", output_format="csv")))
+    _wait(lambda: api_server.jobs.get(submitted["job_id"]).finished)
+    assert exports[0]["output_file"] == os.path.join(api_server.EXPORT_DIR, "gold.csv")
+    
+    for call, status in ((api_server.job_status("missing"), 404),
+                         (api_server.cancel_job(submitted["job_id"]), 404),
+                         (api_server.submit_job(api_server.JobRequest(kind="scrape", output_file="x.csv")), 400),
+                         (api_server.submit_job(api_server.JobRequest(kind="unknown")), 400),
+                         (api_server.submit_job(api_server.JobRequest(
+                             kind="export", output_file="../../etc/cron.d/x")), 400),
+                         (api_server.submit_job(api_server.JobRequest(kind="export", output_file="/tmp/x.csv")), 400),
+                         (api_server.submit_job(api_server.JobRequest(kind="export", output_file="..")), 400),
+                         (api_server.submit_job(api_server.JobRequest(
+                             kind="export", output_file="x.csv", output_format="pickle")), 400)):
+        try:
+            asyncio.run(call)
+            raise AssertionError(f"应当返回 {status}")
+        except HTTPException as e:
+            assert e.status_code == status
+    api_server.jobs.shutdown()
+    print("✓ 任务 API 返回进度和增量结果")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("后台任务测试")
+    print("="*60)
+    
+    try:
+        test_scrape_job()
+        test_cancel_and_limits()
+        test_job_api()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+测试 LLM 回复缓存和意图计划缓存
+"""
+
+import itertools
+import logging
+import time
+
+from conftest import chat_response, fake_client, fake_tool_call
+from llm_cache import LLMCache, TTLCache, normalize_intent, response_key
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def test_cache_keys():
+    """测试缓存键忽略空白和工具调用 ID,过期和 LRU 淘汰"""
+    print("\n" + "="*60)
+    print("测试: 缓存键与淘汰")
+    print("="*60)
+    
+    def conversation(call_id, question):
+        return [
+            {"role": "system", "content": "你是拍卖助手"},
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": None, "tool_calls": [
+                {"id": call_id, "type": "function", "function": {"name": "search_auctions", "arguments": "{}"}}]},
+            {"role": "tool", "tool_call_id": call_id, "content": "[]"},
+        ]
+    
+    key = response_key("deepseek-chat", conversation("call_a", "搜索 gold"), [], "auto")
+    assert key == response_key("deepseek-chat", conversation("call_b", "  搜索   gold "), [], "auto")
+    assert key != response_key("deepseek-chat", conversation("call_a", "搜索 silver"), [], "auto")
+    assert key != response_key("deepseek-chat", conversation("call_a", "搜索 gold"), [], "none")
+    assert normalize_intent("搜索 Gold 拍卖!") == normalize_intent("搜索gold拍卖")
+    
+    cache = TTLCache(max_entries=2, ttl_seconds=0.2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+    time.sleep(0.25)
+    assert cache.get("a") is None and len(cache) == 1
+    
+    # 引用结果句柄的计划依赖上下文,不缓存;取出的计划使用新的调用 ID
+    llm_cache = LLMCache()
+    call = {"id": "call_1", "type": "function",
+            "function": {"name": "save_lots_to_file", "arguments": '{"handle": "res_3"}'}}
+    llm_cache.put_plan("保存它们", [call])
+    assert llm_cache.get_plan("保存它们") is None
+    call["function"]["arguments"] = '{"keywords": ["gold"]}'
+    llm_cache.put_plan("搜索 gold", [call])
+    plan = llm_cache.get_plan("搜索 GOLD")
+    assert plan[0]["function"] == call["function"] and plan[0]["id"] != "call_1"
+    print("✓ 缓存键和淘汰规则正确")
+
+
+def test_agent_cache():
+    """测试重复的问题跳过第一次模型请求"""
+    print("\n" + "="*60)
+    print("测试: Agent 重复问题")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.llm_cache = LLMCache()
+    # 简单的搜索指令会被规则解析直接处理,这里测试经过模型的路径
+    agent.intent_parser = None
+    # 每次搜索的结果不同,第二次模型请求无法命中回复缓存
+    counter = itertools.count()
+    agent.search_auctions = lambda **kwargs: [{"title": f"Gold Auction {next(counter)}", "url": "u"}]
+    
+    requests = []
+    
+    def create(model, messages, tools=None, tool_choice=None):
+        requests.append(messages)
+        time.sleep(0.05)
+        if messages[-1]["role"] == "user":
+            return chat_response(tool_calls=[fake_tool_call(f"call_{len(requests)}", "search_auctions",
+                                                            '{"keywords": ["gold"]}')])
+        return chat_response(f"找到拍卖: {messages[-1]['content']}")
+    
+    agent.client = fake_client(create)
+    
+    start = time.perf_counter()
+    first = agent.process_command("搜索 gold 拍卖")
+    cold = time.perf_counter() - start
+    assert len(requests) == 2 and "Gold Auction 0" in first
+    
+    # 新的对话中重复同一问题: 直接执行缓存的计划,只请求一次模型生成回复
+    agent.reset_conversation()
+    start = time.perf_counter()
+    second = agent.process_command("搜索 Gold 拍卖!")
+    warm = time.perf_counter() - start
+    assert len(requests) == 3 and "Gold Auction 1" in second
+    assert agent.conversation_history[1]["tool_calls"][0]["function"]["name"] == "search_auctions"
+    
+    # 完全相同的请求直接使用缓存的回复,不请求模型
+    agent.reset_conversation()
+    agent.search_auctions = lambda **kwargs: [{"title": "Gold Auction 1", "url": "u"}]
+    assert agent.process_command("搜索 Gold 拍卖!") == second
+    assert len(requests) == 3
+    
+    print(f"首次 {cold * 1000:.0f} ms, 重复问题 {warm * 1000:.0f} ms, 缓存统计 {agent.llm_cache.stats()}")
+    assert agent.llm_cache.stats()["plans"]["hits"] == 2
+    
+    # 有上下文的后续问题不记录计划
+    requests.clear()
+    agent.process_command("搜索 silver 拍卖")
+    agent.reset_conversation()
+    assert agent.llm_cache.get_plan("搜索 silver 拍卖") is None
+    
+    # 有上下文时即使计划已缓存也请求模型,不直接执行计划
+    agent.process_command("你好")
+    hits = agent.llm_cache.stats()["plans"]["hits"]
+    requests.clear()
+    agent.process_command("搜索 gold 拍卖")
+    assert agent.llm_cache.stats()["plans"]["hits"] == hits and requests[0][-1]["content"] == "搜索 gold 拍卖"
+    print("✓ 重复问题跳过第一次模型请求")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("LLM 缓存测试")
+    print("="*60)
+    
+    try:
+        test_cache_keys()
+        test_agent_cache()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
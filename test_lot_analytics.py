@@ -0,0 +1,143 @@
+"""
+测试拍品价格分析
+"""
+
+import json
+import logging
+import statistics
+
+from lot_analytics import LotFrame
+from lot_records import LotTable
+from lot_scraper import RateLimiter
+from lot_store import LotStore
+from test_lot_scraper import FakePagedScraper
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _sample_lots():
+    lots = []
+    for auction, bids in (("a1", ["1,200", "80", "450", None, "2,400"]),
+                          ("a2", ["15", "15,000", "310"])):
+        for i, bid in enumerate(bids):
+            lot = {"lot_number": f"Lot {i + 1}", "title": f"{auction} coin {i + 1}",
+                   "auction_title": f"Auction {auction}", "auction_url": f"https://example.com/{auction}"}
+            if bid is not None:
+                lot["current_bid"] = bid
+            lots.append(lot)
+    lots.append({"lot_number": "Lot 99", "title": "没有所属拍卖场次", "current_bid": "60"})
+    return lots
+
+
+def test_auction_stats():
+    """测试按拍卖场次的统计与逐个计算的结果一致"""
+    print("\n" + "="*60)
+    print("测试: 按拍卖场次统计出价")
+    print("="*60)
+    
+    lots = _sample_lots()
+    for frame in (LotFrame.from_lots(lots), LotFrame.from_table(LotTable(lots))):
+        stats = {s["auction_url"]: s for s in frame.auction_stats()}
+        assert len(stats) == 3
+        
+        a1 = stats["https://example.com/a1"]
+        assert a1["lots"] == 5 and a1["lots_with_bid"] == 4
+        assert a1["min_bid"] == 80 and a1["max_bid"] == 2400
+        assert a1["median_bid"] == statistics.median([1200, 80, 450, 2400])
+        assert a1["total_bid"] == 4130 and a1["auction_title"] == "Auction a1"
+        
+        a2 = stats["https://example.com/a2"]
+        assert a2["median_bid"] == 310 and a2["mean_bid"] == round(15325 / 3, 2)
+        assert stats[None]["lots"] == 1 and stats[None]["max_bid"] == 60
+    
+    print("✓ 最低/最高/中位/平均出价正确")
+
+
+def test_histogram_and_top_n():
+    """测试直方图、最贵拍品和价格区间"""
+    print("\n" + "="*60)
+    print("测试: 直方图与最贵拍品")
+    print("="*60)
+    
+    frame = LotFrame.from_lots(_sample_lots())
+    
+    histogram = frame.histogram(bins=4)
+    assert len(histogram["edges"]) == 5 and sum(histogram["counts"]) == 8
+    log_histogram = frame.histogram(bins=3, log_scale=True)
+    assert log_histogram["edges"][0] == 15 and log_histogram["edges"][-1] == 15000
+    assert log_histogram["counts"] == [3, 3, 2]
+    
+    top = frame.rows(frame.top_n(3), fields=("lot_number", "current_bid"))
+    assert [lot["current_bid"] for lot in top] == ["15,000", "2,400", "1,200"]
+    cheapest = frame.rows(frame.top_n(2, ascending=True))
+    assert [lot["current_bid"] for lot in cheapest] == ["15", "60"]
+    
+    summary = frame.summary(top=2, bins=2, min_bid=100, max_bid=2000)
+    assert summary["lots"] == 3 and summary["max_bid"] == 1200
+    assert [lot["current_bid"] for lot in summary["top_lots"]] == ["1,200", "450"]
+    assert sum(s["lots"] for s in summary["by_auction"]) == 3
+    
+    empty = LotFrame.from_lots([])
+    assert empty.summary()["lots"] == 0 and empty.summary()["histogram"] == {"edges": [], "counts": []}
+    print("✓ 直方图和最贵拍品正确")
+
+
+def test_analyze_lots_tool():
+    """测试 analyze_lots 工具返回紧凑的统计结果"""
+    print("\n" + "="*60)
+    print("测试: analyze_lots 工具")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.store = LotStore(":memory:")
+    agent.lot_scraper = FakePagedScraper(total_pages=3, page_delay=0, rate_limiter=RateLimiter(rate=0))
+    agent.lot_scraper.bids = {str(70000 + page * 10 + i): page * 100 + i for page in range(1, 4) for i in range(3)}
+    url = "https://example.com/auctions/analytics"
+    
+    result = agent.analyze_lots([url], top_n=3)
+    assert result["success"] and result["lots"] == 9
+    assert result["max_bid"] == 302 and result["by_auction"][0]["auction_url"] == url
+    assert [lot["current_bid"] for lot in result["top_lots"]] == ["302", "301", "300"]
+    
+    # 不指定拍卖场次时统计拍品库中的全部拍品,工具结果为 JSON
+    stored = json.loads(agent.execute_tool("analyze_lots", {"min_bid": 200}))
+    assert stored["lots"] == 6 and stored["min_bid"] == 200
+    print(f"✓ 统计结果: {stored['by_auction'][0]}")
+    
+    # 区间数不合法时返回错误结果,不抛出异常也不分配超大的数组
+    for bins in (0, -3, 10 ** 9, "many"):
+        invalid = json.loads(agent.execute_tool("analyze_lots", {"bins": bins}))
+        assert invalid["success"] is False and "bins" in invalid["error"]
+    assert agent.analyze_lots(bins="5")["histogram"]["counts"] and len(agent.analyze_lots(bins=5)["histogram"]["counts"]) == 5
+    print("✓ 不合法的 bins 返回错误")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("拍品分析测试")
+    print("="*60)
+    
+    try:
+        test_auction_stats()
+        test_histogram_and_top_n()
+        test_analyze_lots_tool()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,23 @@
 测试拍品抓取功能
 """
 
+import csv
+import json
 import logging
-from lot_scraper import LotScraper
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from fetch_strategy import FetchStrategy
+from lot_feed import iter_lot_objects, iter_normalized_lots
+from lot_index import KeywordIndex
+from lot_records import Auction, Lot, LotTable
+from lot_parser import SITE_PROFILES, SelectorProfile, get_site_profile, register_site_profile
+from lot_scraper import HTML_PARSER, LotScraper, RateLimiter, ScrapeProgress
+from lot_snapshot import SnapshotStore, content_hash, diff_lot
+from page_cache import PageCache
 
 # 配置日志
 logging.basicConfig(
@@ -14,6 +29,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def isolated_registries():
+    """测试结束后恢复进程内共享的站点配置和拍卖场次对象,可用作测试函数的装饰器"""
+    profiles = dict(SITE_PROFILES)
+    auctions = dict(Auction._registry)
+    try:
+        yield
+    finally:
+        SITE_PROFILES.clear()
+        SITE_PROFILES.update(profiles)
+        with Auction._registry_lock:
+            Auction._registry.clear()
+            Auction._registry.update(auctions)
+
+
 def test_fetch_lots():
     """测试获取拍品"""
     print("\n" + "="*60)
@@ -103,6 +133,723 @@ def test_filter_and_save():
     print("✓ 已保存到 test_lots.txt")
 
 
+def test_keyword_index():
+    """测试关键词索引: AND / OR / NOT、前缀匹配和增量索引"""
+    print("\n" + "="*60)
+    print("测试: 关键词索引")
+    print("="*60)
+    
+    scraper = LotScraper()
+    lots = [
+        {"lot_number": "1", "title": "1907 Saint-Gaudens Double Eagle", "description": "Gold. MS-63 (PCGS)"},
+        {"lot_number": "2", "title": "Great Britain Sovereign", "description": "Golden age. Proof"},
+        {"lot_number": "3", "title": "1881-S Morgan Dollar", "description": "Silver. MS-65"},
+        {"lot_number": "4", "title": "民国三年袁世凯壹圆银币", "description": "PCGS MS-62"},
+    ]
+    
+    def numbers(result):
+        return [lot['lot_number'] for lot in result]
+    
+    assert numbers(scraper.filter_lots_by_keyword(lots, ["gold"])) == ["1", "2"]
+    assert numbers(scraper.filter_lots_by_keyword(lots, ["double eagle", "morgan"])) == ["1", "3"]
+    assert numbers(scraper.filter_lots_by_keyword(lots, ["eagle double"])) == []
+    assert numbers(scraper.filter_lots_by_keyword(lots, ["ms-6"], exclude_keywords=["silver"])) == ["1", "4"]
+    assert numbers(scraper.filter_lots_by_keyword(lots, all_keywords=["pcgs", "gold"])) == ["1"]
+    assert numbers(scraper.filter_lots_by_keyword(lots, ["银币"])) == ["4"]
+    
+    # 过滤后不保留对拍品列表的引用,列表追加拍品后按新内容过滤
+    lots.append({"lot_number": "5", "title": "Mexico 8 Escudos", "description": "Gold"})
+    assert numbers(scraper.filter_lots_by_keyword(lots, ["gold"])) == ["1", "2", "5"]
+    assert not any(lots is value for value in vars(scraper).values())
+    
+    # 反复查询同一批拍品时传入 KeywordIndex
+    index = KeywordIndex(lots)
+    assert numbers(scraper.filter_lots_by_keyword(index, ["gold"], exclude_keywords=["proof"])) == ["1", "5"]
+    
+    # 流式过滤与索引查询的结果一致
+    stream = scraper.iter_filter_lots_by_keyword(iter(lots), ["gold", "dollar"], exclude_keywords=["proof"])
+    assert numbers(stream) == numbers(KeywordIndex(lots).filter(["gold", "dollar"], exclude_keywords=["proof"]))
+    print("✓ 关键词索引查询结果正确")
+
+
+@isolated_registries()
+def test_lot_records():
+    """测试紧凑拍品记录: 与字典互转、共享拍卖场次、按列保存"""
+    print("\n" + "="*60)
+    print("测试: 拍品记录和 LotTable")
+    print("="*60)
+    
+    lot_dict = {"lot_number": "70002", "title": "Admiral Dewey Medal Bronze", "description": "MS-64 BN (PCGS)",
+                "current_bid": "1,320", "grade": "MS-64",
+                "auction_title": "Showcase", "auction_date": "2025-12-15", "auction_url": "https://example.com/a"}
+    
+    lot = Lot.from_dict(lot_dict)
+    assert lot.current_bid == 1320.0 and lot.get('current_bid') == "1320"
+    assert lot.auction is Auction.intern("https://example.com/a")
+    assert lot.to_dict() == {**lot_dict, "current_bid": "1320"}
+    assert list(lot.to_dict()) == list(lot_dict)
+    
+    auction = Auction.intern("https://example.com/b", title="Hong Kong", date="2025-12-20")
+    table = LotTable()
+    table.extend([{"lot_number": str(i), "title": f"Lot {i}", "current_bid": str(i * 100)} for i in range(5)],
+                 auction)
+    table.append({"lot_number": "5", "title": "No bid"}, auction)
+    
+    assert len(table) == 6 and table.auctions == [auction]
+    assert table.rows_with_bid(150, 350) == [2, 3]
+    assert [lot.lot_number for lot in table.select(table.rows_with_bid(min_bid=300))] == ["3", "4"]
+    assert table[5].current_bid is None and table[5].auction is auction
+    
+    filename = os.path.join(tempfile.mkdtemp(prefix='lot_export_'), "table.jsonl")
+    assert LotScraper().save_lots_to_file(table, filename, "jsonl") == 6
+    with open(filename, encoding='utf-8') as f:
+        first = json.loads(f.readline())
+    assert first == {"lot_number": "0", "title": "Lot 0", "current_bid": "0",
+                     "auction_title": "Hong Kong", "auction_date": "2025-12-20", "auction_url": "https://example.com/b"}
+    print("✓ 拍品记录与字典互转一致,同一拍卖场次共享一个对象")
+    
+    # 共享表有上限,淘汰最久未使用的场次,已有拍品仍持有原对象
+    max_registered = Auction.max_registered
+    Auction.max_registered = 3
+    try:
+        Auction.intern("https://example.com/b")
+        for i in range(5):
+            Auction.intern(f"https://example.com/many/{i}")
+        assert len(Auction._registry) == 3
+        assert list(Auction._registry) == [f"https://example.com/many/{i}" for i in range(2, 5)]
+        assert table[0].auction is auction and auction.title == "Hong Kong"
+        assert Auction.intern("https://example.com/b") is not auction
+    finally:
+        Auction.max_registered = max_registered
+    print("✓ 拍卖场次共享表按最近最少使用淘汰")
+
+
+class FakePagedScraper(LotScraper):
+    """用本地生成的 HTML 代替 Zyte API 的测试抓取器"""
+    
+    def __init__(self, total_pages: int, failing_pages=(), page_delay=None, **kwargs):
+        kwargs.setdefault('cache', PageCache(tempfile.mkdtemp(prefix='lot_cache_')))
+        kwargs.setdefault('snapshots', SnapshotStore(tempfile.mkdtemp(prefix='lot_snapshots_')))
+        # 只模拟浏览器渲染模式
+        kwargs.setdefault('fetch_modes', ['zyte-browser'])
+        super().__init__(**kwargs)
+        self.total_pages = total_pages
+        self.failing_pages = set(failing_pages)
+        self.page_delay = page_delay
+        self.requests_made = 0
+        # 拍品编号 -> 当前出价,未设置的拍品出价为 100
+        self.bids = {}
+        # 模拟支持条件请求的站点: 返回 ETag,ETag 未变时不返回页面
+        self.send_etag = False
+        self.not_modified = 0
+    
+    def _render(self, url: str) -> str:
+        self.requests_made += 1
+        page = int(url.rsplit('page=', 1)[1]) if 'page=' in url else 1
+        time.sleep(self.page_delay if self.page_delay is not None else random.uniform(0.01, 0.05))
+        
+        if page in self.failing_pages:
+            raise RuntimeError(f"Zyte API 请求失败: 503 (page {page})")
+        
+        links = ''.join(f'<a href="?page={i}">{i}</a>' for i in range(1, self.total_pages + 1))
+        items = ''.join(
+            f'<div class="lot-item"><span>{70000 + page * 10 + i}</span>'
+            f'<h3 class="lot-title">Lot {page}-{i}</h3>'
+            f'<em>${self.bids.get(str(70000 + page * 10 + i), 100)}</em></div>'
+            for i in range(3)
+        )
+        return f'<html><body>{items}<div class="pagination">{links}</div></body></html>'
+    
+    def _headers(self, html: str):
+        return {'etag': content_hash(html)[:16]} if self.send_etag else {}
+    
+    def _request_zyte(self, url: str, validators=None):
+        # 浏览器渲染不能发送条件请求,总是返回完整页面
+        html = self._render(url)
+        return html, self._headers(html)
+    
+    def _request_zyte_http(self, url: str, validators=None):
+        html = self._render(url)
+        headers = self._headers(html)
+        if validators and headers and validators.get('etag') == headers['etag']:
+            self.not_modified += 1
+            return None, validators
+        return html, headers
+
+
+def test_concurrent_pages():
+    """测试并发分页抓取: 结果按页码顺序返回,失败页面被记录"""
+    print("\n" + "="*60)
+    print("测试: 并发分页抓取")
+    print("="*60)
+    
+    scraper = FakePagedScraper(total_pages=6, failing_pages=[4], max_workers=4,
+                               rate_limiter=RateLimiter(rate=0))
+    
+    start = time.perf_counter()
+    progress = ScrapeProgress("https://example.com/auctions/test")
+    lots = scraper.get_all_lots_from_auction("https://example.com/auctions/test", max_pages=6, progress=progress)
+    elapsed = time.perf_counter() - start
+    
+    titles = [lot['title'] for lot in lots]
+    expected = [f"Lot {page}-{i}" for page in (1, 2, 3, 5, 6) for i in range(3)]
+    
+    print(f"获取 {len(lots)} 个拍品,耗时 {elapsed:.3f}s")
+    print(f"失败页面: {progress.failed_pages}")
+    
+    assert titles == expected, titles
+    assert [f['page'] for f in progress.failed_pages] == [4]
+    print("✓ 拍品按页码顺序返回,失败页面已记录")
+
+
+@isolated_registries()
+def test_site_profile():
+    """测试按站点选择器配置提取拍品字段"""
+    print("\n" + "="*60)
+    print("测试: 站点选择器配置")
+    print("="*60)
+    
+    html = ('<html><body><nav class="pager">Page 1 of 7</nav>'
+            '<section class="card"><b class="heading">1907 Saint-Gaudens $20</b>'
+            '<span>Lot 12345</span><em>Current bid $1,250</em><img src="coin.jpg"></section>'
+            '</body></html>')
+    
+    register_site_profile("coins.example.com", SelectorProfile(
+        "example", container_tags=['section'], container_class=r'card',
+        pagination_class=r'pager', title_tags=['b'], title_class=r'heading'))
+    assert get_site_profile("https://coins.example.com/a/1").name == "example"
+    assert get_site_profile("https://unknown.example.com/").name == "default"
+    
+    scraper = LotScraper()
+    lots, total_pages = scraper.parse_page(html, "https://coins.example.com/a/1")
+    print(f"解析结果: {lots}, 共 {total_pages} 页")
+    
+    assert total_pages == 7
+    # 标题中的面值 "$20" 不是出价
+    assert lots == [{'lot_number': 'Lot 12345', 'title': '1907 Saint-Gaudens $20',
+                     'current_bid': '1250', 'image_url': 'coin.jpg'}]
+    # 默认配置找不到 section.card 容器
+    assert scraper.parse_page(html)[0] == []
+    print("✓ 按主机名选择站点配置,字段按配置提取")
+
+
+def test_parse_page():
+    """测试 parse_page 的各个解析分支,使用构造的小页面"""
+    print("\n" + "="*60)
+    print("测试: 页面解析分支")
+    print("="*60)
+    
+    card = ('<div class="lot-item"><span>{number}</span><h3 class="lot-title">{title}</h3>'
+            '<p class="lot-desc">Synthetic</p><em>${bid}</em><img src="/{number}.jpg"></div>')
+    cards = ''.join(card.format(number=70001 + i, title=f"Lot {i}", bid=100 + i) for i in range(2))
+    links = '<div class="pagination"><a href="?page=1">1</a><a href="?page=2">2</a><a href="?page=5">5</a></div>'
+    
+    for parser in ('html.parser', HTML_PARSER):
+        scraper = LotScraper(parser=parser)
+        
+        # HTML 拍品容器,总页数取分页链接中的最大页码
+        lots, total_pages = scraper.parse_page(f'<html><body><nav>Menu</nav>{cards}{links}</body></html>')
+        assert total_pages == 5
+        assert lots == [
+            {'lot_number': '70001', 'title': 'Lot 0', 'description': 'Synthetic', 'current_bid': '100',
+             'image_url': '/70001.jpg'},
+            {'lot_number': '70002', 'title': 'Lot 1', 'description': 'Synthetic', 'current_bid': '101',
+             'image_url': '/70002.jpg'},
+        ]
+        
+        # 没有分页链接时从 "Page 1 of N" 文本中取总页数
+        lots, total_pages = scraper.parse_page(f'<html><body>{cards}<p>Page 1 of 7</p></body></html>')
+        assert len(lots) == 2 and total_pages == 7
+        
+        # 没有拍品也没有分页
+        assert scraper.parse_page('<html><body><p>No lots</p></body></html>') == ([], 1)
+        
+        # 没有编号的容器不是拍品
+        assert scraper.parse_page('<div class="item"><h3 class="title">Banner</h3></div>') == ([], 1)
+        
+        # 内嵌 JSON 中有拍品时不解析 HTML 容器,分页仍取自 HTML
+        state = {"lots": [{"lotNumber": "80001", "title": "From JSON"}]}
+        html = f'<html><body>{links}<script>window.__STATE__ = {json.dumps(state)};</script></body></html>'
+        assert scraper.parse_page(html) == ([{'lot_number': '80001', 'title': 'From JSON'}], 5)
+        
+        # JSON 接口响应,总页数取自 JSON 字段;无效 JSON 不抛出异常
+        feed = json.dumps({"totalPages": 3, "items": [{"lot_number": 80002}]})
+        assert scraper.parse_page(feed) == ([{'lot_number': '80002'}], 3)
+        assert scraper.parse_page('{"items": [') == ([], 1)
+        
+        # 不完整的 HTML 不抛出异常
+        lots, _ = scraper.parse_page(f'<html><body>{cards[:-20]}')
+        assert lots[0]['lot_number'] == '70001'
+    
+    print(f"✓ 各解析分支结果正确 ({HTML_PARSER})")
+
+
+def test_page_cache():
+    """测试页面缓存: 重复抓取命中缓存,过期和超出容量的页面被淘汰"""
+    print("\n" + "="*60)
+    print("测试: 页面缓存")
+    print("="*60)
+    
+    scraper = FakePagedScraper(total_pages=3, rate_limiter=RateLimiter(rate=0))
+    url = "https://example.com/auctions/cached"
+    
+    first = scraper.get_all_lots_from_auction(url)
+    requests_after_first = scraper.requests_made
+    second = scraper.get_all_lots_from_auction(url)
+    
+    print(f"第一次请求数: {requests_after_first}, 第二次新增请求数: {scraper.requests_made - requests_after_first}")
+    print(f"缓存统计: {scraper.cache.stats()}")
+    
+    assert first == second
+    assert scraper.requests_made == requests_after_first == 3
+    assert scraper.cache.stats()["hits"] == 3
+    
+    # 不读取缓存时重新请求,拿到最新的出价
+    list(scraper.iter_lots(url, use_cache=False))
+    assert scraper.requests_made == 6
+    
+    # 拍品列表页只读取短时间内缓存的页面
+    assert scraper.cache.get(url, "lot-page", max_age=60) is not None
+    os.utime(scraper.cache._path(scraper.cache._key(url, "lot-page")), (time.time(), time.time() - 3600))
+    assert scraper.cache.get(url, "lot-page", max_age=60) is None
+    assert scraper.cache.get(url, "lot-page") is not None
+    scraper.get_all_lots_from_auction(url)
+    assert scraper.requests_made == 7
+    
+    # TTL 过期
+    expired_cache = PageCache(tempfile.mkdtemp(prefix='lot_cache_'), expiry_hours=0)
+    expired_cache.set(url, "zyte-browser", "<html></html>")
+    time.sleep(0.01)
+    assert expired_cache.get(url, "zyte-browser") is None
+    assert expired_cache.stats()["expired"] == 1
+    
+    # 超出容量时淘汰最久未使用的页面
+    small_cache = PageCache(tempfile.mkdtemp(prefix='lot_cache_'), max_size_mb=0.05)
+    page = ''.join(random.choice('abcdefghij<>/ ') for _ in range(20000))
+    for i in range(8):
+        small_cache.set(f"{url}?page={i}", "zyte-browser", page)
+        time.sleep(0.01)
+    
+    stats = small_cache.stats()
+    print(f"容量受限的缓存统计: {stats}")
+    assert stats["evictions"] > 0
+    assert stats["size_bytes"] <= small_cache.max_size
+    assert small_cache.get(f"{url}?page=7", "zyte-browser") == page
+    assert small_cache.get(f"{url}?page=0", "zyte-browser") is None
+    print("✓ 缓存命中、过期与 LRU 淘汰正常")
+
+
+def test_incremental_refresh():
+    """测试增量刷新: 只解析变化的页面,只返回变化的拍品"""
+    print("\n" + "="*60)
+    print("测试: 增量刷新")
+    print("="*60)
+    
+    scraper = FakePagedScraper(total_pages=3, page_delay=0, rate_limiter=RateLimiter(rate=0),
+                               fetch_modes=['zyte-http'])
+    url = "https://example.com/auctions/watch"
+    
+    # 首次刷新: 所有拍品都是新增
+    result = scraper.refresh_lots(url)
+    assert result['first_snapshot'] and result['pages_fetched'] == 3
+    assert len(result['lots']) == result['total_lots'] == 9
+    assert {c['status'] for c in result['changes']} == {'added'}
+    
+    # 一个拍品出价变化: 只有该页被解析,只返回该拍品
+    scraper.bids['70021'] = 250
+    result = scraper.refresh_lots(url)
+    print(f"出价变化后: {result['changes']}")
+    assert result['pages_fetched'] == 1 and result['pages_unchanged'] == 2
+    assert [lot['lot_number'] for lot in result['lots']] == ['70021']
+    assert result['changes'][0]['status'] == 'updated'
+    assert result['changes'][0]['fields'] == {'current_bid': {'old': '100', 'new': '250'}}
+    
+    # 站点开始返回 ETag: 先按内容哈希判断未变化并记录 ETag,之后条件请求直接返回未修改
+    scraper.send_etag = True
+    result = scraper.refresh_lots(url)
+    assert result['lots'] == [] and result['pages_unchanged'] == 3
+    result = scraper.refresh_lots(url)
+    assert result['lots'] == [] and scraper.not_modified == 3
+    
+    # 获取失败的页面沿用快照,页数减少后消失的拍品被报告为已移除
+    scraper.failing_pages = {2}
+    result = scraper.refresh_lots(url)
+    assert result['removed'] == [] and result['total_lots'] == 9
+    scraper.failing_pages = set()
+    scraper.total_pages = 2
+    result = scraper.refresh_lots(url)
+    print(f"页数减少后移除: {result['removed']}")
+    assert result['removed'] == ['70030', '70031', '70032'] and result['total_lots'] == 6
+    
+    # 已移除的拍品同样按关键词过滤
+    scraper.total_pages = 1
+    result = scraper.refresh_lots(url, keywords=["lot 2-1"])
+    assert result['removed'] == ['70021'] and result['lots'] == []
+    
+    # 只刷新第一页后,第一页未修改时仍按站点的总页数刷新全部页面
+    scraper.total_pages = 3
+    scraper.refresh_lots(url, max_pages=1)
+    result = scraper.refresh_lots(url)
+    assert result['pages_unchanged'] == 1 and result['pages_fetched'] == 2 and result['total_lots'] == 9
+    
+    # 附加的拍卖场次字段不算拍品变化
+    assert diff_lot({"lot_number": "1", "auction_date": "2025-12-01"},
+                    {"lot_number": "1", "auction_date": "2025-12-02"}) == {}
+    print("✓ 未变化的页面不再解析,只返回变化的拍品")
+
+
+class HybridScraper(FakePagedScraper):
+    """
+    模拟三种抓取模式的测试抓取器
+    
+    static.example.com 的页面直接 HTTP 请求即可得到拍品;
+    shielded.example.com 直接请求返回 Cloudflare 验证页,原始响应中拍品由 JavaScript 渲染,
+    只有浏览器渲染能得到拍品。路径中含 empty 的拍卖场次没有拍品,
+    路径中含 soft 的拍卖场次直接请求时被软封锁。
+    """
+    
+    CHALLENGE = '<html><head><title>Just a moment...</title></head><body class="cf_chl_opt"></body></html>'
+    SHELL = '<html><body><div id="app"></div><script src="app.js"></script></body></html>'
+    EMPTY = '<html><body><p>No lots found</p></body></html>'
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('fetch_modes', ['http', 'zyte-http', 'zyte-browser'])
+        super().__init__(total_pages=3, page_delay=0, rate_limiter=RateLimiter(rate=0), **kwargs)
+        self.mode_requests = {'http': 0, 'zyte-http': 0, 'zyte-browser': 0}
+    
+    def _render(self, url):
+        html = super()._render(url)
+        return self.EMPTY if 'empty' in url else html
+    
+    def _request_http(self, url, validators=None):
+        self.mode_requests['http'] += 1
+        if 'shielded' in url:
+            return self.CHALLENGE, {}
+        if 'soft' in url:
+            # 没有 Cloudflare 标记的软封锁: 返回不含拍品的页面
+            return self.SHELL, {}
+        return super()._request_zyte_http(url, validators)
+    
+    def _request_zyte_http(self, url, validators=None):
+        self.mode_requests['zyte-http'] += 1
+        html, headers = super()._request_zyte_http(url, validators)
+        if 'shielded' in url and html is not None:
+            return self.SHELL, headers
+        return html, headers
+    
+    def _request_zyte(self, url, validators=None):
+        self.mode_requests['zyte-browser'] += 1
+        time.sleep(0.02)
+        return super()._request_zyte(url, validators)
+
+
+def test_fetch_modes():
+    """测试抓取模式: 先用便宜的模式,验证页或没有拍品时升级,按 URL 模式记住成功的模式"""
+    print("\n" + "="*60)
+    print("测试: 抓取模式选择")
+    print("="*60)
+    
+    scraper = HybridScraper()
+    
+    static_lots = scraper.get_all_lots_from_auction("https://static.example.com/auctions/101")
+    assert len(static_lots) == 9
+    assert scraper.mode_requests == {'http': 3, 'zyte-http': 0, 'zyte-browser': 0}
+    
+    # 第一页逐级升级到浏览器渲染,后续页面直接使用浏览器渲染
+    shielded_lots = scraper.get_all_lots_from_auction("https://shielded.example.com/auctions/202")
+    assert len(shielded_lots) == 9
+    assert scraper.mode_requests == {'http': 4, 'zyte-http': 1, 'zyte-browser': 3}
+    
+    # 同一路径模式下的其他拍卖场次也直接使用浏览器渲染
+    scraper.get_all_lots_from_auction("https://shielded.example.com/auctions/303")
+    assert scraper.mode_requests == {'http': 4, 'zyte-http': 1, 'zyte-browser': 6}
+    
+    stats = scraper.fetch_strategy.stats()
+    print(f"各模式统计: {json.dumps(stats, ensure_ascii=False)}")
+    assert stats["patterns"] == {"static.example.com/auctions/*": "http",
+                                 "shielded.example.com/auctions/*": "zyte-browser"}
+    assert stats["modes"]["http"]["escalated"] == 1 and stats["modes"]["zyte-http"]["escalated"] == 1
+    assert stats["modes"]["zyte-browser"]["accepted"] == 6
+    assert stats["cost_units"] == 1 + 6 * 10
+    assert stats["modes"]["zyte-browser"]["avg_latency_ms"] >= 20
+    
+    # 所有模式都失败时抛出最后一个错误,页面记录为失败
+    scraper.failing_pages = {2}
+    progress = ScrapeProgress("https://static.example.com/auctions/404")
+    scraper.get_all_lots_from_auction("https://static.example.com/auctions/404", progress=progress)
+    assert [f['page'] for f in progress.failed_pages] == [2]
+    assert "503" in progress.failed_pages[0]['error']
+    
+    # 需要浏览器渲染的页面: 刷新时先用 zyte-http 发送条件请求,未修改时不再渲染
+    scraper.failing_pages = set()
+    scraper.send_etag = True
+    shielded = "https://shielded.example.com/auctions/505"
+    scraper.refresh_lots(shielded)
+    before = dict(scraper.mode_requests)
+    result = scraper.refresh_lots(shielded)
+    assert result['pages_unchanged'] == 3 and scraper.not_modified == 3
+    assert scraper.mode_requests['zyte-http'] == before['zyte-http'] + 3
+    assert scraper.mode_requests['zyte-browser'] == before['zyte-browser']
+    
+    # 空页面: 已证明可用的模式只用浏览器渲染确认一次;未知站点逐级确认;都不记住浏览器渲染
+    scraper = HybridScraper()
+    scraper.get_all_lots_from_auction("https://static.example.com/auctions/101")
+    parses = []
+    parse_structured = scraper._parse_structured
+    scraper._parse_structured = lambda *args: parses.append(args[1]) or parse_structured(*args)
+    assert scraper.get_all_lots_from_auction("https://static.example.com/auctions/707-empty") == []
+    assert scraper.mode_requests == {'http': 4, 'zyte-http': 0, 'zyte-browser': 1}
+    assert scraper.get_all_lots_from_auction("https://quiet.example.com/auctions/606-empty") == []
+    assert scraper.mode_requests == {'http': 5, 'zyte-http': 1, 'zyte-browser': 2}
+    patterns = scraper.fetch_strategy.stats()["patterns"]
+    assert "quiet.example.com/auctions/*" not in patterns and patterns["static.example.com/auctions/*"] == "http"
+    
+    # 已证明可用的模式被软封锁时不当作空页面,浏览器渲染得到拍品
+    assert len(scraper.get_all_lots_from_auction("https://static.example.com/auctions/909-soft")) == 9
+    assert scraper.fetch_strategy.stats()["patterns"]["static.example.com/auctions/*"] == "zyte-browser"
+    
+    # 选择抓取模式时的解析结果直接使用: 第一页升级时解析两次,其余页面各解析一次
+    parses.clear()
+    assert len(scraper.get_all_lots_from_auction("https://shielded.example.com/auctions/808")) == 9
+    assert len(parses) == 4
+    
+    # 学到较贵的模式后定期重新尝试最便宜的模式,成功时降回便宜的模式
+    strategy = FetchStrategy(probe_interval=3)
+    url = "https://shielded.example.com/auctions/909"
+    strategy.learn(url, "zyte-browser")
+    assert [strategy.modes_for(url) for _ in range(3)] == [["zyte-browser"]] * 2 + [strategy.modes]
+    strategy.learn(url, "http")
+    assert strategy.modes_for(url) == strategy.modes and strategy.stats()["probes"] == 1
+    print("✓ 便宜的模式可用时不使用浏览器渲染")
+
+
+class FeedScraper(FakePagedScraper):
+    """JSON 接口返回拍品数据的测试抓取器,记录请求的 URL"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(total_pages=3, page_delay=0, rate_limiter=RateLimiter(rate=0), **kwargs)
+        self.requested = []
+    
+    def _request_zyte(self, url, validators=None):
+        self.requested.append(url)
+        page = int(url.rsplit('page=', 1)[1])
+        lots = [{"LotNo": 80000 + page * 10 + i, "lotTitle": f"Feed Lot {page}-{i}",
+                 "currentBid": {"amount": 1250.0, "currency": "USD"},
+                 "images": [{"url": f"https://img.example.com/{page}-{i}.jpg"}]} for i in range(3)]
+        return json.dumps({"data": {"lots": lots, "pagination": {"page": page, "totalPages": 3}}}), {}
+
+
+@isolated_registries()
+def test_structured_lots():
+    """测试结构化数据: 内嵌 JSON 和 JSON 接口中的拍品直接提取,字段名统一"""
+    print("\n" + "="*60)
+    print("测试: 结构化拍品数据")
+    print("="*60)
+    
+    state = {"auction": {"id": 555, "lots": [
+        {"lotNumber": "1001", "title": "1881-S Morgan Dollar", "currentBid": "$1,250", "imageUrl": "a.jpg"},
+        {"lot_number": 1002, "name": "1907 Saint-Gaudens $20", "high_bid": 3400.0, "description": "Gold"},
+        {"id": 7, "title": "Not a lot"},
+    ]}}
+    html = ('<html><body><div id="app"></div><div class="pagination">Page 1 of 4</div>'
+            f'<script>window.__INITIAL_STATE__ = {json.dumps(state)};</script>'
+            '<script type="application/json">{"lots": [{"LotNo": "1001", "title": "duplicate"}]}</script>'
+            '</body></html>')
+    
+    scraper = LotScraper()
+    lots, total_pages = scraper.parse_page(html)
+    print(f"内嵌 JSON 解析结果: {lots}, 共 {total_pages} 页")
+    assert total_pages == 4
+    assert lots == [
+        {'lot_number': '1001', 'title': '1881-S Morgan Dollar', 'current_bid': '1250', 'image_url': 'a.jpg'},
+        {'lot_number': '1002', 'title': '1907 Saint-Gaudens $20', 'description': 'Gold', 'current_bid': '3400'},
+    ]
+    
+    # 站点配置了 JSON 接口时直接请求接口,不抓取 HTML 页面
+    register_site_profile("feed.example.com", SelectorProfile(
+        "feed", feed_url="https://feed.example.com/api/auctions/{auction_id}/lots?page={page}"))
+    scraper = FeedScraper()
+    lots = scraper.get_all_lots_from_auction("https://feed.example.com/auctions/555/coins")
+    assert scraper.requested == [f"https://feed.example.com/api/auctions/555/lots?page={page}" for page in (1, 2, 3)]
+    assert len(lots) == 9
+    assert lots[0] == {'lot_number': '80010', 'title': 'Feed Lot 1-0', 'current_bid': '1250',
+                       'image_url': 'https://img.example.com/1-0.jpg'}
+    print("✓ 结构化数据直接提取,不解析 HTML")
+
+
+# HTML 列出 6 个拍品,内嵌 JSON 只是推荐拍品小组件,带有它自己的分页
+FEATURED_WIDGET = {"featuredLots": [{"lotNumber": "70012", "title": "Lot 1-2", "currentBid": {"amount": 450.0},
+                                     "imageUrl": "f.jpg"}], "pagination": {"totalPages": 1}}
+PARTIAL_WIDGET_PAGE = (
+    '<html><body>'
+    + ''.join(f'<div class="lot-item"><span>{70010 + i}</span><h3 class="lot-title">Lot 1-{i}</h3>'
+              f'<em>$100</em></div>' for i in range(6))
+    + '<div class="pagination">Page 1 of 4</div>'
+    + f'<script type="application/json">{json.dumps(FEATURED_WIDGET)}</script></body></html>'
+)
+
+
+def test_partial_structured_lots():
+    """测试内嵌 JSON 只包含部分拍品时合并 HTML 中的拍品,总页数以 HTML 分页为准"""
+    print("\n" + "="*60)
+    print("测试: 部分结构化数据")
+    print("="*60)
+    
+    lots, total_pages = LotScraper().parse_page(PARTIAL_WIDGET_PAGE, "https://example.com/auctions/1")
+    print(f"合并结果: {[lot['lot_number'] for lot in lots]}, 共 {total_pages} 页")
+    assert [lot['lot_number'] for lot in lots] == [str(70010 + i) for i in range(6)]
+    assert total_pages == 4
+    # 同一拍品优先使用结构化数据
+    assert lots[2] == {'lot_number': '70012', 'title': 'Lot 1-2', 'current_bid': '450', 'image_url': 'f.jpg'}
+    assert lots[0]['current_bid'] == '100'
+    
+    # HTML 中没有更多拍品容器时不解析 HTML 拍品容器,总页数仍参考页面文本
+    scraper = LotScraper()
+    plan = scraper.get_plan(get_site_profile("https://example.com/auctions/2"))
+    calls = []
+    find_containers = plan.find_containers
+    plan.find_containers = lambda soup: calls.append(soup) or find_containers(soup)
+    page = PARTIAL_WIDGET_PAGE.replace('class="lot-item"', 'class="tile"')
+    assert plan.profile.count_container_markers(PARTIAL_WIDGET_PAGE) == 6
+    assert plan.profile.count_container_markers(page) == 0
+    lots, total_pages = scraper.parse_page(page, "https://example.com/auctions/2")
+    assert [lot['lot_number'] for lot in lots] == ['70012'] and total_pages == 4 and calls == []
+    print("✓ 部分结构化数据与 HTML 中的拍品合并")
+
+
+def test_json_walker():
+    """测试 JSON 拍品查找: 深层嵌套、深度上限、按拍品号去重和多个路径上的拍品"""
+    print("\n" + "="*60)
+    print("测试: JSON 拍品查找")
+    print("="*60)
+    
+    # 拍品在第 8 层,旧的递归查找(最多 5 层)找不到
+    deep = {"props": {"pageProps": {"data": {"sale": {"catalog": {"sections": [{"items": [
+        {"lotNo": "12", "title": "Deep Lot"},
+        {"lot": "Parking", "title": "Not a lot"},
+    ]}]}}}}}}
+    found = list(iter_lot_objects(deep))
+    assert [path for path, _ in found] == [
+        ('props', 'pageProps', 'data', 'sale', 'catalog', 'sections', '*', 'items', '*')]
+    
+    # 拍品对象逐个产出,不需要先遍历整个数据
+    big = {"lots": [{"lotNumber": str(i)} for i in range(100000)]}
+    assert next(iter_lot_objects(big))[1] == {"lotNumber": "0"}
+    
+    # 超过深度上限的容器被跳过,不会 RecursionError
+    nested = {"lotNumber": "1"}
+    for _ in range(5000):
+        nested = {"child": [nested]}
+    assert list(iter_lot_objects(nested)) == []
+    assert len(list(iter_lot_objects(nested, max_depth=20000))) == 1
+    
+    # 同一拍品出现在多个数据块中只保留一次
+    seen = set()
+    lots = []
+    for data in ({"lots": [{"lot_number": "7", "title": "A"}]}, [{"LotNo": 7, "title": "B"}, {"LotNo": 8}]):
+        lots += iter_normalized_lots((lot for _, lot in iter_lot_objects(data)), seen)
+    assert [lot['lot_number'] for lot in lots] == ['7', '8'] and lots[0]['title'] == 'A'
+    
+    # 同一份数据中多个路径上的拍品都能找到
+    mixed = {"results": {"lots": [{"lotNumber": "98"}]}, "featured": [{"lotNumber": "99"}]}
+    assert [(path, lot["lotNumber"]) for path, lot in iter_lot_objects(mixed)] == [
+        (("results", "lots", "*"), "98"), (("featured", "*"), "99")]
+    print("✓ JSON 拍品查找不受嵌套深度限制,不遗漏新路径上的拍品")
+
+
+def test_streaming_export():
+    """测试流式获取: 拍品逐页产出,过滤和写入不需要先收集完整列表"""
+    print("\n" + "="*60)
+    print("测试: 流式获取与导出")
+    print("="*60)
+    
+    scraper = FakePagedScraper(total_pages=4, max_workers=1, rate_limiter=RateLimiter(rate=0))
+    lots = scraper.iter_lots("https://example.com/auctions/stream")
+    
+    first = next(lots)
+    print(f"产出第一个拍品时的请求数: {scraper.requests_made}")
+    assert first['title'] == "Lot 1-0"
+    assert scraper.requests_made == 1
+    lots.close()
+    
+    output_dir = tempfile.mkdtemp(prefix='lot_export_')
+    for format in ('jsonl', 'csv', 'json'):
+        filename = os.path.join(output_dir, f"lots.{format}")
+        stream = scraper.iter_filter_lots_by_keyword(
+            scraper.iter_lots("https://example.com/auctions/stream"), ["lot 2-", "lot 4-1"]
+        )
+        count = scraper.save_lots_to_file(stream, filename, format)
+        
+        with open(filename, encoding='utf-8') as f:
+            if format == 'jsonl':
+                titles = [json.loads(line)['title'] for line in f]
+            elif format == 'csv':
+                titles = [row['title'] for row in csv.DictReader(f)]
+            else:
+                titles = [lot['title'] for lot in json.load(f)]
+        
+        print(f"{format}: 写入 {count} 个拍品 {titles}")
+        assert count == 4
+        assert titles == ["Lot 2-0", "Lot 2-1", "Lot 2-2", "Lot 4-1"]
+    
+    # 只有后面的拍品才有的字段也写入 CSV
+    filename = os.path.join(output_dir, "mixed.csv")
+    mixed = iter([{"lot_number": "1", "title": "A"}, {"lot_number": "2", "title": "B", "estimate": "$500"}])
+    assert scraper.save_lots_to_file(mixed, filename, 'csv') == 2
+    with open(filename, encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert rows[1]["estimate"] == "$500" and rows[0]["estimate"] == ""
+    
+    print("✓ 拍品按页流式产出并逐条写入文件")
+
+
+def test_parallel_auction_export():
+    """测试多个拍卖场次并发抓取导出: 总耗时接近单个拍卖场次,并返回每个场次的报告"""
+    print("\n" + "="*60)
+    print("测试: 多拍卖场次并发导出")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.store = None
+    agent.lot_scraper = FakePagedScraper(total_pages=4, failing_pages=[3], page_delay=0.1,
+                                         max_workers=1, rate_limiter=RateLimiter(rate=0))
+    
+    filename = os.path.join(tempfile.mkdtemp(prefix='lot_export_'), "all_lots.jsonl")
+    result = agent.search_and_export_lots(lot_keywords=["lot 1-"], output_file=filename,
+                                          output_format="jsonl")
+    
+    print(f"耗时 {result['elapsed_seconds']}s, 导出 {result['lots_count']} 个拍品")
+    for report in result['auctions']:
+        print(f"  - {report['title'][:40]}: {report['pages_done']}/{report['total_pages']} 页, "
+              f"{report['lots_matched']} 个拍品, {report['elapsed_seconds']}s")
+    
+    with open(filename, encoding='utf-8') as f:
+        lots = [json.loads(line) for line in f]
+    
+    assert result['success'] and result['lots_count'] == len(lots) == 9
+    assert {lot['auction_url'] for lot in lots} == {report['url'] for report in result['auctions']}
+    assert all(report['pages_done'] == 4 and report['lots_matched'] == 3 for report in result['auctions'])
+    assert all([f['page'] for f in report['failed_pages']] == [3] for report in result['auctions'])
+    assert all(report['eta_seconds'] == 0.0 for report in result['auctions'])
+    # 3 个拍卖场次各 4 页 x 0.1s,逐个抓取约需 1.2s
+    assert result['elapsed_seconds'] < 0.8
+    
+    # 工作线程没有发送结束标记就退出时,导出结束而不是一直等待
+    def broken_report():
+        raise RuntimeError("报告生成失败")
+    
+    outcome = []
+    worker = threading.Thread(target=lambda: outcome.append(agent.search_and_export_lots(
+        output_file=filename, output_format="jsonl",
+        on_progress=lambda progress: setattr(progress, 'to_dict', broken_report))))
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive() and outcome[0]['lots_count'] == 27
+    print("✓ 多个拍卖场次并发抓取,报告包含每个场次的进度和耗时")
+
+
 def main():
     """运行测试"""
     print("\n" + "="*60)
@@ -112,6 +859,19 @@ def main():
     try:
         # 测试过滤和保存(不需要网络请求)
         test_filter_and_save()
+        test_keyword_index()
+        test_lot_records()
+        test_concurrent_pages()
+        test_site_profile()
+        test_parse_page()
+        test_page_cache()
+        test_incremental_refresh()
+        test_fetch_modes()
+        test_structured_lots()
+        test_partial_structured_lots()
+        test_json_walker()
+        test_streaming_export()
+        test_parallel_auction_export()
         
         # 询问是否测试真实抓取
         print("\n" + "="*60)
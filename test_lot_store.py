@@ -0,0 +1,170 @@
+"""
+测试本地拍品库
+"""
+
+import logging
+import time
+
+from lot_index import KeywordIndex
+from lot_scraper import RateLimiter, ScrapeProgress
+from lot_store import LotStore
+from test_lot_scraper import FakePagedScraper
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def test_upsert_and_search():
+    """测试批量写入、更新和全文检索"""
+    print("\n" + "="*60)
+    print("测试: 拍品库写入与检索")
+    print("="*60)
+    
+    store = LotStore(":memory:")
+    store.upsert_auction({"url": "https://example.com/a1", "title": "December Showcase", "date": "2025-12-15"})
+    store.upsert_auction({"url": "https://example.com/a2", "title": "Hong Kong Auction", "date": "2025-12-20"})
+    
+    store.upsert_lots("https://example.com/a1", [
+        {"lot_number": "1001", "title": "1907 Saint-Gaudens Double Eagle", "description": "Gold. MS-63",
+         "current_bid": "2,400"},
+        {"lot_number": "1002", "title": "1881-S Morgan Dollar", "description": "Silver. MS-65",
+         "current_bid": "180", "grade": "MS-65"},
+        {"title": "没有编号的拍品会被跳过"},
+    ])
+    store.upsert_lots("https://example.com/a2", [
+        {"lot_number": "2001", "title": "China 1911 Dollar", "description": "Silver", "current_bid": "900"},
+        {"lot_number": "2002", "title": "Great Britain Sovereign", "description": "Golden age gold coin",
+         "current_bid": "650"},
+    ])
+    
+    assert store.count_lots() == 4
+    
+    # 关键词按词前缀匹配,任一关键词匹配即可
+    gold = store.search_lots(["gold"])
+    print(f"gold: {[lot['lot_number'] for lot in gold]}")
+    assert [lot['lot_number'] for lot in gold] == ["1001", "2002"]
+    assert gold[0]['auction_title'] == "December Showcase"
+    
+    assert [lot['lot_number'] for lot in store.search_lots(["double eagle", "sovereign"])] == ["1001", "2002"]
+    assert [lot['lot_number'] for lot in store.search_lots(min_bid=500, max_bid=1000)] == ["2001", "2002"]
+    assert [lot['lot_number'] for lot in store.search_lots(["silver"], date_from="2025-12-18")] == ["2001"]
+    
+    # 额外字段原样保存,拍卖场次字段可以不附加
+    morgan = store.search_lots(["morgan"], auction_url="https://example.com/a1", with_auction=False)
+    assert morgan == [{"lot_number": "1002", "title": "1881-S Morgan Dollar", "description": "Silver. MS-65",
+                       "current_bid": "180", "grade": "MS-65"}]
+    
+    # 更新出价和标题后,索引同步更新
+    store.upsert_lots("https://example.com/a1", [
+        {"lot_number": "1002", "title": "1881-S Morgan Dollar PL", "description": "Silver. MS-65",
+         "current_bid": "1,200"},
+    ])
+    assert store.count_lots() == 4
+    assert [lot['lot_number'] for lot in store.search_lots(min_bid=1000)] == ["1001", "1002"]
+    assert store.search_lots(["pl"])[0]['current_bid'] == "1,200"
+    
+    # 中文关键词与 KeywordIndex 的匹配结果一致
+    chinese = [
+        {"lot_number": "3001", "title": "大清银币 宣统三年", "description": "壹圆"},
+        {"lot_number": "3002", "title": "袁世凯像银币", "description": "民国三年"},
+        {"lot_number": "3003", "title": "Panda gold coin", "description": "熊猫金币"},
+    ]
+    store.upsert_lots("https://example.com/a3", chinese)
+    for keywords in (["银币"], ["民国"], ["金"], ["大清 银币"], ["熊猫金币", "宣统"], ["银元"]):
+        expected = [lot['lot_number'] for lot in KeywordIndex(chinese).filter(keywords)]
+        found = [lot['lot_number'] for lot in store.search_lots(keywords, auction_url="https://example.com/a3")]
+        assert found == expected, (keywords, found, expected)
+    assert [lot['lot_number'] for lot in store.search_lots(["银币"])] == ["3001", "3002"]
+    print("✓ 写入、更新和检索结果正确")
+
+
+def test_answer_from_store():
+    """测试抓取过的拍卖场次直接从拍品库回答,不再发起请求"""
+    print("\n" + "="*60)
+    print("测试: 从拍品库回答拍品查询")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.store = LotStore(":memory:")
+    agent.lot_scraper = FakePagedScraper(total_pages=5, page_delay=0, rate_limiter=RateLimiter(rate=0))
+    url = "https://example.com/auctions/store"
+    
+    scraped = agent.get_lots_from_auction(url, keywords=["Lot 2-"])
+    requests_made = agent.lot_scraper.requests_made
+    assert len(scraped) == 3 and requests_made == 5
+    
+    start = time.perf_counter()
+    stored = agent.get_lots_from_auction(url, keywords=["Lot 2-"])
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    
+    print(f"从拍品库查询耗时 {elapsed_ms:.2f} ms")
+    assert stored == scraped
+    assert agent.lot_scraper.requests_made == requests_made
+    
+    # refresh=True 时忽略拍品库重新抓取,新的出价写入拍品库
+    agent.lot_scraper.bids['70020'] = 300
+    agent.lot_scraper.cache.clear()
+    refreshed = agent.get_lots_from_auction(url, keywords=["Lot 2-"], refresh=True)
+    assert agent.lot_scraper.requests_made == requests_made + 5
+    assert refreshed[0]['current_bid'] == '300'
+    assert agent.get_lots_from_auction(url, keywords=["Lot 2-"]) == refreshed
+    
+    # 有失败页面时不视为新鲜,下次查询会重新抓取
+    other = "https://example.com/auctions/partial"
+    agent.lot_scraper.failing_pages = {3}
+    agent.get_lots_from_auction(other)
+    assert not agent.store.is_fresh(other) and agent.store.count_lots(other) == 12
+    
+    # 只抓取过第一页时,需要更多页面的查询重新抓取
+    agent.lot_scraper.failing_pages = set()
+    shallow = "https://example.com/auctions/shallow"
+    assert len(agent.get_lots_from_auction(shallow, max_pages=1)) == 3
+    assert agent.store.is_fresh(shallow, max_pages=1) and not agent.store.is_fresh(shallow, max_pages=20)
+    requests_made = agent.lot_scraper.requests_made
+    assert len(agent.get_lots_from_auction(shallow, max_pages=20)) == 15
+    assert agent.lot_scraper.requests_made > requests_made
+    # 抓取过全部 5 页后,需要更多页数的查询也直接从库中回答
+    assert agent.store.is_fresh(shallow, max_pages=50)
+    
+    # 完整重新抓取时删除已撤拍的拍品
+    agent.lot_scraper.total_pages = 4
+    assert len(agent.get_lots_from_auction(shallow, refresh=True)) == 12
+    assert agent.store.count_lots(shallow) == 12
+    
+    # 第一页没有拍品(空页面或解析失败)时不删除库中的拍品,也不视为新鲜
+    blocked = "https://example.com/auctions/blocked"
+    agent.store.upsert_lots(blocked, [{"lot_number": "1", "title": "A"}, {"lot_number": "2", "title": "B"}])
+    progress = ScrapeProgress(blocked)
+    progress.total_pages = progress.site_pages = 1
+    assert list(agent.store.tee_lots(blocked, iter([]), progress=progress)) == []
+    assert agent.store.count_lots(blocked) == 2 and not agent.store.is_fresh(blocked)
+    print("✓ 拍品库命中时不再请求页面")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("拍品库测试")
+    print("="*60)
+    
+    try:
+        test_upsert_and_search()
+        test_answer_from_store()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+测试请求合并: 并发的相同抓取只请求一次
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lot_scraper import RateLimiter, ScrapeProgress
+from lot_store import LotStore
+from single_flight import SingleFlight
+from test_lot_scraper import FakePagedScraper
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _run_concurrently(func, count: int):
+    """count 个线程同时调用 func,返回结果列表"""
+    barrier = threading.Barrier(count)
+    
+    def call(i):
+        barrier.wait()
+        return func(i)
+    
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(call, range(count)))
+
+
+def test_single_flight():
+    """测试同一键的并发调用只执行一次,结果和异常都被共享"""
+    print("\n" + "="*60)
+    print("测试: 请求合并")
+    print("="*60)
+    
+    flight = SingleFlight("test")
+    executions = []
+    
+    def slow(value):
+        executions.append(value)
+        time.sleep(0.2)
+        return {"value": value}
+    
+    results = _run_concurrently(lambda i: flight.do("same", slow, i), 8)
+    assert len(executions) == 1
+    assert all(r is results[0] for r in results)
+    
+    # 不同的键互不影响
+    _run_concurrently(lambda i: flight.do(i % 2, slow, i), 4)
+    assert len(executions) == 3
+    
+    def failing():
+        time.sleep(0.2)
+        raise RuntimeError("Zyte API 请求失败: 503")
+    
+    def call_failing(i):
+        try:
+            flight.do("error", failing)
+        except RuntimeError as e:
+            return str(e)
+    
+    assert _run_concurrently(call_failing, 4) == ["Zyte API 请求失败: 503"] * 4
+    
+    # 调用结束后不保留结果,下次调用重新执行
+    flight.do("same", slow, 99)
+    assert executions[-1] == 99
+    
+    stats = flight.stats()
+    print(f"合并统计: {stats}")
+    assert stats["calls"] == 17 and stats["executions"] == 5 and stats["coalesced"] == 12
+    assert stats["errors"] == 1 and stats["in_flight"] == 0
+    
+    # 等待超时的调用方收到 TimeoutError,执行方仍得到结果
+    flight = SingleFlight("test", wait_timeout=0.1)
+    
+    def call_slow(i):
+        try:
+            return flight.do("slow", lambda: time.sleep(0.5) or "done")
+        except TimeoutError:
+            return "timeout"
+    
+    assert sorted(_run_concurrently(call_slow, 3)) == ["done", "timeout", "timeout"]
+    assert flight.stats()["timeouts"] == 2 and flight.stats()["in_flight"] == 0
+    print("✓ 并发的相同调用只执行一次")
+
+
+def test_concurrent_scrapes():
+    """测试多个线程同时抓取同一页面或同一拍卖场次时只请求一次"""
+    print("\n" + "="*60)
+    print("测试: 并发抓取合并")
+    print("="*60)
+    
+    scraper = FakePagedScraper(total_pages=4, page_delay=0.1, rate_limiter=RateLimiter(rate=0))
+    scraper.cache = None
+    url = "https://example.com/auctions/hot"
+    
+    pages = _run_concurrently(lambda i: scraper.fetch_page(f"{url}?page=2"), 6)
+    assert scraper.requests_made == 1 and len(set(pages)) == 1
+    
+    start = time.perf_counter()
+    progresses = [ScrapeProgress(url) for _ in range(5)]
+    results = _run_concurrently(lambda i: scraper.get_all_lots_from_auction(url, progress=progresses[i]), 5)
+    elapsed = time.perf_counter() - start
+    print(f"5 个线程抓取同一拍卖场次耗时 {elapsed:.2f}s, 请求 {scraper.requests_made - 1} 次")
+    assert scraper.requests_made == 1 + 4
+    assert all(r == results[0] and len(r) == 12 for r in results)
+    # 每个调用方得到自己的列表,共享结果的调用方也得到那次抓取的进度
+    assert results[0] is not results[1]
+    assert all(p.total_pages == 4 and p.lots_found == 12 and p.finished_at for p in progresses)
+    
+    stats = scraper.fetch_stats()
+    assert stats["pages"]["coalesced"] == 5 and stats["auctions"]["coalesced"] == 4
+    print(f"✓ 抓取统计: {stats}")
+
+
+def test_shared_sessions():
+    """测试共享资源的多个会话同时查询同一拍卖场次时只抓取一次"""
+    print("\n" + "="*60)
+    print("测试: 多会话查询同一拍卖场次")
+    print("="*60)
+    
+    import api_server
+    from agent_v2 import AgentResources, AuctionAgentV2
+    
+    resources = AgentResources(tool_workers=4)
+    resources.store = LotStore(":memory:")
+    resources.lot_scraper = FakePagedScraper(total_pages=5, page_delay=0.1, rate_limiter=RateLimiter(rate=0))
+    agents = [AuctionAgentV2(resources) for _ in range(4)]
+    url = "https://example.com/auctions/shared"
+    keywords = [["Lot 1-"], ["Lot 2-"], None, ["Lot 2-"]]
+    
+    results = _run_concurrently(lambda i: agents[i].get_lots_from_auction(url, keywords=keywords[i]), 4)
+    assert resources.lot_scraper.requests_made == 5
+    assert [len(r) for r in results] == [3, 3, 15, 3]
+    assert resources.store.is_fresh(url)
+    
+    stats = resources.auction_flight.stats()
+    print(f"拍品库抓取合并: {stats}")
+    assert stats["executions"] == 1 and stats["coalesced"] == 3
+    
+    shared, api_server.resources = api_server.resources, resources
+    try:
+        metrics = asyncio.run(api_server.metrics())
+    finally:
+        api_server.resources = shared
+    assert metrics["auction_store"]["coalesced"] == 3 and metrics["fetch"]["cache"]["writes"] == 5
+    print("✓ 同一拍卖场次只抓取一次")
+
+
+def test_cancelled_leader():
+    """测试执行抓取的会话被取消后,等待它的会话重新抓取,不返回不完整的拍品"""
+    print("\n" + "="*60)
+    print("测试: 共享的抓取被取消")
+    print("="*60)
+    
+    import agent_v2
+    from agent_v2 import AgentResources, AuctionAgentV2
+    
+    resources = AgentResources(tool_workers=2)
+    resources.store = LotStore(":memory:")
+    resources.lot_scraper = FakePagedScraper(total_pages=5, page_delay=0.1, rate_limiter=RateLimiter(rate=0))
+    leader, follower = AuctionAgentV2(resources), AuctionAgentV2(resources)
+    url = "https://example.com/auctions/cancelled"
+    cancel = threading.Event()
+    
+    def run_leader():
+        # 模拟执行抓取的工具调用超时被取消
+        agent_v2._tool_context.cancel = cancel
+        return leader.get_lots_from_auction(url)
+    
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(run_leader)
+        time.sleep(0.05)
+        threading.Timer(0.1, cancel.set).start()
+        lots = follower.get_lots_from_auction(url)
+        partial = future.result()
+    
+    print(f"被取消的会话得到 {len(partial)} 个拍品,等待的会话得到 {len(lots)} 个拍品")
+    assert len(partial) < 15 and len(lots) == 15
+    assert resources.store.is_fresh(url)
+    stats = resources.auction_flight.stats()
+    assert stats["executions"] == 2 and stats["coalesced"] == 1
+    print("✓ 等待的会话重新抓取了完整的拍品")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("请求合并测试")
+    print("="*60)
+    
+    try:
+        test_single_flight()
+        test_concurrent_scrapes()
+        test_shared_sessions()
+        test_cancelled_leader()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+测试工具结果整理
+"""
+
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import chat_response, fake_client, fake_tool_call
+from lot_scraper import RateLimiter
+from lot_store import LotStore
+from test_lot_scraper import FakePagedScraper
+from tool_results import ResultShaper, ResultStore
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _lots(count: int):
+    return [{
+        "lot_number": str(70000 + i),
+        "title": f"1907 Saint-Gaudens Double Eagle #{i}",
+        "description": f"MS-{60 + i % 10} (PCGS). " + "Lustrous and well struck. " * 10,
+        "current_bid": f"{100 + i * 5:,}",
+        "image_url": f"https://images.example.com/lots/{i}.jpg",
+        "auction_title": "December 2025 Showcase Auction",
+        "auction_url": "https://auctions.example.com/auctions/1"
+    } for i in range(count)]
+
+
+def test_shape_lot_list():
+    """测试长拍品列表整理为摘要和句柄,并记录节省的 token"""
+    print("\n" + "="*60)
+    print("测试: 拍品列表摘要")
+    print("="*60)
+    
+    shaper = ResultShaper(max_chars=6000, top_k=10)
+    lots = _lots(300)
+    text = shaper.shape("get_lots_from_auction", lots)
+    shaped = json.loads(text)
+    
+    assert shaped["count"] == 300 and shaped["truncated"]
+    assert len(shaped["rows"]) == 10 and len(text) <= 6000
+    assert "image_url" not in shaped["rows"][0] and shaped["rows"][0]["description"].endswith("…")
+    assert shaped["bid_stats"] == {"lots_with_bid": 300, "min_bid": 100, "max_bid": 1595, "median_bid": 847.5}
+    assert [lot["lot_number"] for lot in shaped["top_by_bid"]] == ["70299", "70298", "70297"]
+    assert shaper.store.get(shaped["handle"]) is lots
+    
+    stats = shaper.stats.to_dict()
+    print(f"估算 token: {stats['raw_tokens']} -> {stats['sent_tokens']}, 节省 {stats['saved_ratio']:.0%}")
+    assert stats["saved_ratio"] > 0.9
+    
+    # lots 字段即使很短也保存句柄;其他短列表原样发送
+    refresh = json.loads(shaper.shape("refresh_auction_lots", {"lots": lots[:2], "removed": ["1", "2"]}))
+    assert refresh["lots"]["count"] == 2 and not refresh["lots"]["truncated"]
+    assert refresh["removed"] == ["1", "2"]
+    auctions = json.loads(shaper.shape("search_auctions", [{"title": "A", "url": "u"}]))
+    assert auctions == [{"title": "A", "url": "u"}]
+    
+    # 字符上限很小时减少发送的行数
+    small = ResultShaper(max_chars=1500, top_k=10)
+    shaped = json.loads(small.shape("get_lots_from_auction", lots))
+    assert len(small.shape("get_lots_from_auction", lots)) <= 1500
+    assert 0 < len(shaped["rows"]) < 10 and shaped["count"] == 300
+    
+    # 减少行数仍然超出时缩短字段或丢弃末尾的行,结果仍是完整的 JSON
+    long_rows = [{"name": f"row {i}", "note": "x" * 3000} for i in range(8)]
+    for value in (long_rows, {"success": True, "notes": long_rows}, {f"k{i}": "y" * 900 for i in range(40)}):
+        text = small.shape("get_result_page", value, summarize=False)
+        assert len(text) <= 1500 and json.loads(text)
+    fitted = json.loads(small.shape("get_result_page", long_rows, summarize=False))
+    assert fitted[0]["name"] == "row 0" and fitted[0]["note"].endswith("…")
+    many = json.loads(small.shape("get_result_page", [{"n": i} for i in range(500)], summarize=False))
+    assert many["truncated"] and many["rows"][0] == {"n": 0} and 0 < len(many["rows"]) < 500
+    print("✓ 摘要、出价统计和字符上限正确")
+
+
+def test_result_pages():
+    """测试按句柄翻页和句柄淘汰"""
+    print("\n" + "="*60)
+    print("测试: 按句柄翻页")
+    print("="*60)
+    
+    shaper = ResultShaper(max_chars=3000, top_k=5)
+    lots = _lots(47)
+    handle = json.loads(shaper.shape("get_lots_from_auction", lots))["handle"]
+    
+    seen = []
+    offset = 0
+    while offset is not None:
+        page = shaper.page(handle, offset)
+        assert len(json.dumps(page["rows"], ensure_ascii=False)) <= 3000 or len(page["rows"]) == 1
+        seen.extend(page["rows"])
+        offset = page["next_offset"]
+    assert seen == lots
+    
+    store = ResultStore(max_results=2)
+    first = store.put([1])
+    second = store.put([2])
+    store.get(first)
+    store.put([3])
+    assert store.get(second) is None and store.get(first) == [1]
+    assert not shaper.page("res_missing")["success"]
+    print("✓ 翻页返回全部拍品,旧句柄按最近最少使用淘汰")
+
+
+def test_agent_tool_results():
+    """测试 Agent 工具结果使用句柄: 翻页和按句柄导出"""
+    print("\n" + "="*60)
+    print("测试: Agent 工具结果句柄")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.store = LotStore(":memory:")
+    agent.lot_scraper = FakePagedScraper(total_pages=8, page_delay=0, rate_limiter=RateLimiter(rate=0))
+    
+    result = json.loads(agent.execute_tool("get_lots_from_auction",
+                                           {"auction_url": "https://example.com/auctions/handles"}))
+    assert result["count"] == 24 and len(result["rows"]) == 10
+    
+    page = json.loads(agent.execute_tool("get_result_page", {"handle": result["handle"], "offset": 20}))
+    assert page["total"] == 24 and len(page["rows"]) == 4 and page["next_offset"] is None
+    
+    filename = os.path.join(tempfile.mkdtemp(prefix="tool_results_"), "lots.jsonl")
+    saved = json.loads(agent.execute_tool("save_lots_to_file", {
+        "handle": result["handle"], "filename": filename, "format": "jsonl"}))
+    assert saved["success"] and saved["count"] == 24
+    with open(filename, encoding="utf-8") as f:
+        assert sum(1 for _ in f) == 24
+    # 保持原来的位置参数顺序: save_lots_to_file(lots_data, filename, format)
+    positional = agent.save_lots_to_file(json.dumps(_lots(3)), filename, "json")
+    assert positional["success"] and positional["count"] == 3
+    assert not agent.save_lots_to_file(handle=result["handle"])["success"]
+    print(f"✓ 工具结果统计: {agent.result_shaper.stats.to_dict()}")
+
+
+class SlowPagesScraper(FakePagedScraper):
+    """第一页立即返回,后续页面很慢"""
+    
+    def _render(self, url: str) -> str:
+        if 'page=' in url:
+            time.sleep(3.0)
+        return super()._render(url)
+
+
+def test_parallel_tool_calls():
+    """测试同一次回复中的多个工具调用并发执行,超时的调用被取消"""
+    print("\n" + "="*60)
+    print("测试: 并发工具调用")
+    print("="*60)
+    
+    from agent_v2 import AuctionAgentV2
+    
+    agent = AuctionAgentV2()
+    agent.store = LotStore(":memory:")
+    agent.lot_scraper = FakePagedScraper(total_pages=20, page_delay=0.1, max_workers=1,
+                                         rate_limiter=RateLimiter(rate=0))
+    
+    def slow_search(**kwargs):
+        time.sleep(0.3)
+        return [{"title": kwargs.get("keywords", ["?"])[0], "url": "https://example.com/a"}]
+    
+    agent.search_auctions = slow_search
+    agent.tool_timeouts["get_lots_from_auction"] = 0.5
+    
+    calls = [
+        fake_tool_call("c1", "search_auctions", '{"keywords": ["first"]}'),
+        fake_tool_call("c2", "get_lots_from_auction", '{"auction_url": "https://example.com/auctions/slow"}'),
+        fake_tool_call("c3", "search_auctions", '{"keywords": ["third"]}'),
+        fake_tool_call("c4", "search_auctions", '{"keywords": '),
+    ]
+    
+    start = time.perf_counter()
+    results = [json.loads(r) for r in agent.run_tool_calls([call.model_dump() for call in calls])]
+    elapsed = time.perf_counter() - start
+    
+    print(f"4 个工具调用耗时 {elapsed:.2f}s")
+    assert elapsed < 1.0
+    assert results[0] == [{"title": "first", "url": "https://example.com/a"}]
+    assert results[2] == [{"title": "third", "url": "https://example.com/a"}]
+    assert not results[1]["success"] and "超时" in results[1]["error"]
+    assert "JSON" in results[3]["error"]
+    
+    # 超时的抓取收到取消通知后停止请求后续页面,拍卖场次不会被标记为新鲜
+    time.sleep(0.5)
+    requests_made = agent.lot_scraper.requests_made
+    time.sleep(0.3)
+    assert agent.lot_scraper.requests_made == requests_made < 20
+    assert not agent.store.is_fresh("https://example.com/auctions/slow")
+    
+    # 并发抓取分页时,超时的调用不会一直等待很慢的页面而占满工具线程池
+    agent.tool_executor = ThreadPoolExecutor(max_workers=1)
+    agent.lot_scraper = SlowPagesScraper(total_pages=6, page_delay=0, max_workers=4,
+                                         rate_limiter=RateLimiter(rate=0))
+    start = time.perf_counter()
+    timed_out = json.loads(agent.run_tool_calls([fake_tool_call(
+        "c5", "get_lots_from_auction", '{"auction_url": "https://example.com/auctions/stuck"}').model_dump()])[0])
+    assert not timed_out["success"]
+    assert json.loads(agent.run_tool_calls([calls[0].model_dump()])[0])[0]["title"] == "first"
+    print(f"超时后下一个工具调用在 {time.perf_counter() - start:.2f}s 内完成")
+    assert time.perf_counter() - start < 2.5
+    assert not agent.store.is_fresh("https://example.com/auctions/stuck")
+    
+    # 对话历史中一条助手消息包含全部工具调用,工具结果按调用顺序排列
+    responses = iter([
+        chat_response(tool_calls=calls[:1] + calls[2:3]),
+        chat_response("完成"),
+    ])
+    agent.client = fake_client(lambda **kwargs: next(responses))
+    assert agent.process_command("搜索两个拍卖") == "完成"
+    roles = [(m["role"], m.get("tool_call_id")) for m in agent.conversation_history]
+    assert roles == [("user", None), ("assistant", None), ("tool", "c1"), ("tool", "c3"), ("assistant", None)]
+    assert len(agent.conversation_history[1]["tool_calls"]) == 2
+    print("✓ 工具调用并发执行,结果按原顺序返回")
+
+
+def main():
+    """运行测试"""
+    print("\n" + "="*60)
+    print("工具结果整理测试")
+    print("="*60)
+    
+    try:
+        test_shape_lot_list()
+        test_result_pages()
+        test_agent_tool_results()
+        test_parallel_tool_calls()
+        
+        print("\n" + "="*60)
+        print("测试完成")
+        print("="*60)
+    
+    except Exception as e:
+        logger.error(f"测试过程中发生错误: {e}", exc_info=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+工具结果模块 - 把工具的完整结果整理为发送给 LLM 的紧凑摘要
+
+拍品等长列表只发送数量、前几行和出价统计,完整数据按句柄保留在服务端。
+LLM 可以通过 get_result_page 工具按句柄翻页,或把句柄交给 save_lots_to_file 导出。
+每次整理都会记录整理前(原来的缩进 JSON)和整理后的估算 token 数。
+"""
+
+import json
+import math
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from config import (
+    TOOL_RESULT_MAX_CHARS, TOOL_RESULT_TOP_K, TOOL_RESULT_DESCRIPTION_CHARS, TOOL_RESULT_HANDLES
+)
+from lot_analytics import LotFrame
+
+logger = logging.getLogger(__name__)
+
+# 发送给 LLM 的拍品字段,图片链接、拍卖场次 URL 和日期不发送
+ROW_FIELDS = ('lot_number', 'title', 'description', 'current_bid', 'auction_title')
+
+# 作为工具主要结果的拍品列表字段,无论长短都按句柄保存,便于翻页和导出
+PRIMARY_LIST_KEYS = ('lots',)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数: ASCII 字符约 4 个一个 token,中文等其他字符约一个字符一个 token"""
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return math.ceil(ascii_chars / 4) + len(text) - ascii_chars
+
+
+def compact_json(data: Any) -> str:
+    """不带缩进和多余空格的 JSON"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _is_lot(row: Any) -> bool:
+    return isinstance(row, dict) and 'lot_number' in row
+
+
+def _shorten_strings(value: Any, max_chars: int) -> Any:
+    """把嵌套结构中超过 max_chars 的字符串截断,其他值不变"""
+    if isinstance(value, str):
+        return value[:max_chars] + '…' if len(value) > max_chars else value
+    if isinstance(value, list):
+        return [_shorten_strings(item, max_chars) for item in value]
+    if isinstance(value, dict):
+        return {key: _shorten_strings(item, max_chars) for key, item in value.items()}
+    return value
+
+
+class ResultStore:
+    """按句柄保存完整的结果行,超出容量后淘汰最久未访问的结果"""
+    
+    def __init__(self, max_results: int = TOOL_RESULT_HANDLES):
+        self.max_results = max_results
+        self._results: 'OrderedDict[str, List]' = OrderedDict()
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._results)
+    
+    def put(self, rows: List) -> str:
+        """保存结果行,返回句柄"""
+        with self._lock:
+            handle = f"res_{next(self._counter)}"
+            self._results[handle] = rows
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return handle
+    
+    def get(self, handle: str) -> Optional[List]:
+        """取出句柄对应的结果行,句柄不存在或已淘汰时返回 None"""
+        with self._lock:
+            rows = self._results.get(handle)
+            if rows is not None:
+                self._results.move_to_end(handle)
+            return rows
+
+
+class ShapingStats:
+    """累计整理前后的估算 token 数"""
+    
+    def __init__(self):
+        self.calls = 0
+        self.raw_tokens = 0
+        self.sent_tokens = 0
+        self._lock = threading.Lock()
+    
+    def record(self, raw_tokens: int, sent_tokens: int):
+        with self._lock:
+            self.calls += 1
+            self.raw_tokens += raw_tokens
+            self.sent_tokens += sent_tokens
+    
+    def to_dict(self) -> Dict:
+        saved = self.raw_tokens - self.sent_tokens
+        return {
+            "calls": self.calls,
+            "raw_tokens": self.raw_tokens,
+            "sent_tokens": self.sent_tokens,
+            "saved_tokens": saved,
+            "saved_ratio": round(saved / self.raw_tokens, 3) if self.raw_tokens else 0.0
+        }
+
+
+class ResultShaper:
+    """
+    工具结果整理
+    
+    - 超过 top_k 行的列表,以及作为工具主要结果的拍品列表(顶层列表或 lots 字段),替换为
+      {"count", "handle", "rows", "truncated"},拍品列表再附加出价统计和最贵的几个拍品
+    - 拍品行只保留 ROW_FIELDS,描述截断到 description_chars 个字符
+    - 整理后仍超过 max_chars 时,逐步减少每个列表发送的行数,再缩短长字符串,最后丢弃末尾的行或字段
+    """
+    
+    def __init__(self, store: Optional[ResultStore] = None,
+                 max_chars: int = TOOL_RESULT_MAX_CHARS,
+                 top_k: int = TOOL_RESULT_TOP_K,
+                 description_chars: int = TOOL_RESULT_DESCRIPTION_CHARS):
+        """
+        Args:
+            store: 结果句柄存储
+            max_chars: 单个工具结果的字符上限
+            top_k: 每个列表直接发送的行数
+            description_chars: 拍品描述截断长度
+        """
+        self.store = store if store is not None else ResultStore()
+        self.max_chars = max_chars
+        self.top_k = top_k
+        self.description_chars = description_chars
+        self.stats = ShapingStats()
+    
+    def shape(self, tool_name: str, result: Any, summarize: bool = True) -> str:
+        """
+        把工具结果整理为发送给 LLM 的 JSON 文本
+        
+        Args:
+            tool_name: 工具名,用于日志
+            result: 工具返回的完整结果
+            summarize: 为 False 时不替换列表,只做字符上限检查(用于已经分页的结果)
+        """
+        summaries: List[Dict] = []
+        shaped = self._shape_value(result, summaries, primary=True) if summarize else result
+        text = self._fit(shaped, summaries)
+        
+        raw_tokens = estimate_tokens(json.dumps(result, ensure_ascii=False, indent=2))
+        sent_tokens = estimate_tokens(text)
+        self.stats.record(raw_tokens, sent_tokens)
+        logger.info(f"工具结果 {tool_name}: 估算 {raw_tokens} -> {sent_tokens} tokens")
+        
+        return text
+    
+    def page(self, handle: str, offset: int = 0, limit: Optional[int] = None) -> Dict:
+        """
+        按句柄翻页,返回完整的行(拍品描述不截断)
+        
+        返回的行数受 limit 和 max_chars 共同限制,next_offset 为下一页的起点,没有更多行时为 None。
+        """
+        rows = self.store.get(handle)
+        if rows is None:
+            return {"success": False, "error": f"结果句柄不存在或已过期: {handle}"}
+        
+        offset = max(0, offset)
+        limit = limit or self.top_k * 2
+        page_rows = []
+        size = 0
+        for row in rows[offset:offset + limit]:
+            row_size = len(compact_json(row)) + 1
+            # 至少返回一行,避免超长的行导致无法翻页
+            if page_rows and size + row_size > self.max_chars:
+                break
+            page_rows.append(row)
+            size += row_size
+        
+        next_offset = offset + len(page_rows)
+        return {
+            "success": True,
+            "handle": handle,
+            "total": len(rows),
+            "offset": offset,
+            "rows": page_rows,
+            "next_offset": next_offset if next_offset < len(rows) else None
+        }
+    
+    def _shape_value(self, value: Any, summaries: List[Dict], primary: bool = False) -> Any:
+        if isinstance(value, list):
+            if len(value) > self.top_k or (primary and value and _is_lot(value[0])):
+                return self._summarize_rows(value, summaries)
+            return [self._shape_row(row, summaries) for row in value]
+        if isinstance(value, dict):
+            return {key: self._shape_value(item, summaries, primary=primary and key in PRIMARY_LIST_KEYS)
+                    for key, item in value.items()}
+        return value
+    
+    def _shape_row(self, row: Any, summaries: List[Dict]) -> Any:
+        if _is_lot(row):
+            lot = {name: row[name] for name in ROW_FIELDS if row.get(name) is not None}
+            description = lot.get('description')
+            if description and len(description) > self.description_chars:
+                lot['description'] = description[:self.description_chars] + '…'
+            return lot
+        return self._shape_value(row, summaries)
+    
+    def _summarize_rows(self, rows: List, summaries: List[Dict]) -> Dict:
+        """长列表替换为数量、句柄和前 top_k 行"""
+        summary = {
+            "count": len(rows),
+            "handle": self.store.put(rows),
+            "rows": [self._shape_row(row, summaries) for row in rows[:self.top_k]],
+            "truncated": len(rows) > self.top_k
+        }
+        
+        if rows and all(_is_lot(row) for row in rows):
+            frame = LotFrame.from_lots(rows)
+            valid = frame.bids[~np.isnan(frame.bids)]
+            if len(valid):
+                summary["bid_stats"] = {
+                    "lots_with_bid": int(len(valid)),
+                    "min_bid": round(float(valid.min()), 2),
+                    "max_bid": round(float(valid.max()), 2),
+                    "median_bid": round(float(np.median(valid)), 2)
+                }
+                if summary["truncated"]:
+                    summary["top_by_bid"] = [self._shape_row(row, summaries)
+                                             for row in frame.rows(frame.top_n(3))]
+        
+        summaries.append(summary)
+        return summary
+    
+    def _fit(self, shaped: Any, summaries: List[Dict]) -> str:
+        """
+        超过字符上限时依次减少每个列表发送的行数、去掉最贵拍品、缩短长字符串,
+        仍然超出时丢弃末尾的行或字段;返回的始终是完整的 JSON
+        """
+        text = compact_json(shaped)
+        rows_kept = self.top_k
+        while len(text) > self.max_chars and summaries and rows_kept > 0:
+            rows_kept //= 2
+            for summary in summaries:
+                if len(summary["rows"]) > rows_kept:
+                    summary["rows"] = summary["rows"][:rows_kept]
+                    summary["truncated"] = True
+            text = compact_json(shaped)
+        
+        if len(text) > self.max_chars and summaries:
+            for summary in summaries:
+                summary.pop("top_by_bid", None)
+            text = compact_json(shaped)
+        
+        chars = self.description_chars
+        while len(text) > self.max_chars and chars >= 16:
+            shaped = _shorten_strings(shaped, chars)
+            text = compact_json(shaped)
+            chars //= 2
+        
+        if len(text) > self.max_chars:
+            logger.warning(f"工具结果超过字符上限 {self.max_chars},已丢弃末尾的行或字段")
+            text = compact_json(self._drop_tail(shaped))
+        return text
+    
+    def _drop_tail(self, shaped: Any) -> Dict:
+        """逐个丢弃末尾的行(列表)或字段(字典),直到不超过字符上限"""
+        if isinstance(shaped, dict):
+            kept = dict(shaped)
+            while kept and len(compact_json({**kept, "truncated": True})) > self.max_chars:
+                kept.popitem()
+            return {**kept, "truncated": True}
+        rows = list(shaped) if isinstance(shaped, list) else []
+        while rows and len(compact_json({"rows": rows, "truncated": True})) > self.max_chars:
+            rows.pop()
+        return {"rows": rows, "truncated": True}